@@ -3,9 +3,12 @@ import streamlit as st
 # Must be the first streamlit command
 st.set_page_config(page_title="4-4-2 Manager (ADMIN)", layout="wide")
 
-from features import escalacao_main, dados, elenco, leilao, livres, trade, pontuacao, matchup
+from features import escalacao_main, dados, elenco, leilao, livres, trade, pontuacao, matchup, write_queue
 
 def main():
+    # Replay Sheets writes a previous run left in the write-behind journal
+    write_queue.start()
+    
     st.sidebar.title("👮‍♂️ Admin Panel")
     
     # Navigation
@@ -3,11 +3,14 @@ import streamlit as st
 # Must be the first streamlit command
 st.set_page_config(page_title="4-4-2 Manager (Players)", layout="wide")
 
-from features import escalacao_main, elenco, leilao, livres, trade, live_stats, pontuacao, matchup, scout
+from features import escalacao_main, elenco, leilao, livres, trade, live_stats, pontuacao, matchup, scout, write_queue
 
 import time
 
 def main():
+    # Replay Sheets writes a previous run left in the write-behind journal
+    write_queue.start()
+    
     # Background Service: Check Live Stats (Safe Concurrency)
     # DISABLED PER USER REQUEST
     if 'last_sync_ts' not in st.session_state:
@@ -0,0 +1,185 @@
+import heapq
+import time
+import pandas as pd
+from features.auth import get_client
+from features.roster_state import run_transaction, load_snapshot, norm_id
+from features.write_queue import enqueue_append, flush
+
+# Sealed-bid auction resolver (used by the admin page and the CLI below).
+#
+# Every player gets a max-heap of the bids on him; a global heap holds the best
+# open bid of each player, so the highest bid of the whole round is always
+# decided first. A bid is approved if, at that moment:
+#   - the team can pay it with what is left of its caixa after the reservations
+#     of the bids it already won this round,
+#   - the player is still free,
+#   - the team still owns the player it offered to drop (or has a free slot).
+# An approved bid closes the player (his other bids are outbid); a rejected one
+# hands the player over to his next bid. Ties on price go to the earliest bid
+# (sheet row), then to the lowest team_id, so a round always resolves the same way.
+# Every decision goes into the audit log (LEILAO_AUDIT).
+
+MAX_ROSTER = 18  # a bid without a drop needs the roster below this
+
+AUDIT_COLS = ['rodada', 'step', 'row', 'team_id', 'player_id_free', 'player_id_team',
+              'price', 'available', 'status', 'reason', 'processed_at']
+WON_COLS = ['team_id', 'rodada', 'player_id_free', 'player_id_team', 'price']
+
+def is_empty_slot(p_drop):
+    p_drop = str(p_drop).strip()
+    return p_drop == "NENHUM" or p_drop == "" or p_drop.lower() == "none"
+
+def pending_bids(values):
+    """
+    Parses the LEILAO_LANCES grid.
+    Returns (headers, round, bids): the unprocessed bids of the latest round,
+    each a dict with its sheet 'row' and numeric 'price'/'rodada'.
+    """
+    if len(values) <= 1:
+        return [], None, []
+    headers = [str(h).strip().lower() for h in values[0]]
+    lances = pd.DataFrame([list(r) + [''] * (len(headers) - len(r)) for r in values[1:]], columns=headers)
+    if 'rodada' not in lances.columns:
+        return headers, None, []
+    if 'status' not in lances.columns:
+        lances['status'] = ''
+    lances['row'] = lances.index + 2
+
+    pending = lances[lances['status'].fillna('').astype(str).str.strip() == ''].copy()
+    if pending.empty:
+        return headers, None, []
+    pending['rodada'] = pd.to_numeric(pending['rodada'], errors='coerce').fillna(0).astype(int)
+    pending['price'] = pd.to_numeric(pending['price'].astype(str).str.replace(',', '.', regex=False), errors='coerce').fillna(0.0)
+
+    rodada = int(pending['rodada'].max())
+    bids = pending[pending['rodada'] == rodada]
+    cols = ['row', 'team_id', 'rodada', 'player_id_free', 'player_id_team', 'price']
+    return headers, rodada, bids[cols].to_dict('records')
+
+def resolve(snap, bids):
+    """
+    Resolves a round of bids against a RosterSnapshot, applying the approved
+    moves and charges to it. Returns the audit log (list of dicts, decision order).
+    """
+    start_budget = {}
+    reserved = {}
+    audit = []
+
+    # Per-player max-heaps: (-price, row, team_id) -> highest, earliest, lowest team first
+    heaps = {}
+    for b in bids:
+        key = (-float(b['price']), int(b['row']), norm_id(b['team_id']))
+        heaps.setdefault(norm_id(b['player_id_free']), []).append(key + (b,))
+    for h in heaps.values():
+        heapq.heapify(h)
+    top = [h[0][:3] + (pid,) for pid, h in heaps.items()]
+    heapq.heapify(top)
+
+    def log(b, status, reason, available):
+        audit.append({
+            'rodada': b['rodada'], 'step': len(audit) + 1, 'row': b['row'],
+            'team_id': str(b['team_id']), 'player_id_free': str(b['player_id_free']),
+            'player_id_team': str(b['player_id_team']), 'price': float(b['price']),
+            'available': available, 'status': status, 'reason': reason,
+        })
+
+    while top:
+        _, _, _, pid = heapq.heappop(top)
+        *_, b = heapq.heappop(heaps[pid])
+        tid = norm_id(b['team_id'])
+        p_drop = str(b['player_id_team']).strip()
+        price = float(b['price'])
+        empty_slot = is_empty_slot(p_drop)
+
+        if tid not in start_budget:
+            start_budget[tid] = snap.budget(tid)
+        available = round(start_budget[tid] - reserved.get(tid, 0.0), 2)
+
+        if available < price:
+            log(b, 'REJEITADO_CAIXA', f"caixa disponível {available}", available)
+        elif not snap.is_free(pid):
+            log(b, 'REJEITADO_NAO_LIVRE', f"{pid} pertence a {snap.owner_of(pid)}", available)
+        elif empty_slot and snap.roster_size(tid) >= MAX_ROSTER:
+            log(b, 'REJEITADO_CHEIO', f"elenco com {snap.roster_size(tid)} jogadores", available)
+        elif not empty_slot and not snap.owns(tid, p_drop):
+            log(b, 'REJEITADO_NAO_POSSUI', f"{p_drop} não está no elenco", available)
+        else:
+            reserved[tid] = reserved.get(tid, 0.0) + price
+            snap.sign(tid, pid, drop=None if empty_slot else p_drop)
+            log(b, 'APROVADO', "maior lance válido", available)
+            # Player closed: every other bid on him is outbid
+            while heaps[pid]:
+                *_, lost = heapq.heappop(heaps[pid])
+                lost_tid = norm_id(lost['team_id'])
+                lost_avail = round(start_budget.get(lost_tid, snap.budget(lost_tid)) - reserved.get(lost_tid, 0.0), 2)
+                log(lost, 'REJEITADO_SUPERADO', f"vencido por {tid} ({price})", lost_avail)
+            continue
+
+        # Rejected: the player's next bid competes
+        if heaps[pid]:
+            heapq.heappush(top, heaps[pid][0][:3] + (pid,))
+
+    for tid, amount in reserved.items():
+        snap.charge(tid, amount)
+    return audit
+
+def describe(entry):
+    """One-line message for an audit entry (admin page / CLI)."""
+    tid, pid, price = entry['team_id'], entry['player_id_free'], entry['price']
+    if entry['status'] == 'APROVADO':
+        slot = " (Vaga Livre)" if is_empty_slot(entry['player_id_team']) else ""
+        return f"✅ Lance Válido: {tid} leva {pid} por {price}{slot}"
+    return f"❌ {tid}: {pid} por {price} - {entry['status']} ({entry['reason']})"
+
+def run_round(dry_run=False):
+    """
+    Resolves the pending bids of the latest round.
+    Commits the roster moves, caixa charges and bid statuses in one
+    version-checked write (features/roster_state.py) and logs the winners
+    (LEILAO_VENCIDO) and every decision (LEILAO_AUDIT).
+    dry_run: resolves against a snapshot without writing anything.
+    Returns {'rodada': n or None, 'audit': [...], 'msg': str}.
+    """
+    # Bids still in the write-behind queue must reach the sheet first
+    if not flush("LEILAO_LANCES"):
+        raise RuntimeError("Não foi possível gravar os lances pendentes. Tente novamente.")
+    client, sh = get_client()
+    ws_lances = sh.worksheet("LEILAO_LANCES")
+    headers, rodada, bids = pending_bids(ws_lances.get_all_values())
+    if not bids:
+        return {'rodada': None, 'audit': [], 'msg': "Sem lances pendentes."}
+
+    if dry_run:
+        audit = resolve(load_snapshot(sh), bids)
+        return {'rodada': rodada, 'audit': audit, 'msg': f"Simulação da rodada {rodada}: {len(bids)} lances."}
+
+    status_col = (headers.index('status') if 'status' in headers else len(headers)) + 1
+
+    def apply(snap):
+        audit = resolve(snap, bids)
+        if status_col > len(headers):
+            snap.write("LEILAO_LANCES", 1, status_col, 'status')
+        for entry in audit:
+            snap.write("LEILAO_LANCES", entry['row'], status_col, entry['status'])
+        return audit
+
+    audit = run_transaction(apply)
+
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    for entry in audit:
+        entry['processed_at'] = now
+    won = [e for e in audit if e['status'] == 'APROVADO']
+    if won:
+        enqueue_append("LEILAO_VENCIDO", [[e[c] for c in WON_COLS] for e in won], header=WON_COLS)
+    enqueue_append("LEILAO_AUDIT", [[e[c] for c in AUDIT_COLS] for e in audit], header=AUDIT_COLS)
+    return {'rodada': rodada, 'audit': audit, 'msg': f"Rodada {rodada}: {len(won)} de {len(bids)} lances aprovados."}
+
+if __name__ == "__main__":
+    import sys
+    dry = '--dry-run' in sys.argv[1:]
+    result = run_round(dry_run=dry)
+    for entry in result['audit']:
+        print(f"{entry['step']:>4}  row {entry['row']:>4}  {describe(entry)}")
+    print(result['msg'])
+    if not dry:
+        flush()  # the CLI exits right away: write the logs now
@@ -36,8 +36,19 @@ def get_credentials():
     st.error(f"No credentials found. Checked: {SERVICE_ACCOUNT_FILE}")
     return None
 
-@st.cache_resource(ttl=3600)
+# Storage backend: "sheets" (Google Sheets, default) or "sqlite" (features/local_store.py,
+# gspread-compatible local DB; Sheets is then only an import/export target)
+STORAGE_BACKEND = os.environ.get("KBR_STORAGE", "sheets").lower()
+
 def get_client():
+    """Get (client, spreadsheet) for the configured storage backend"""
+    if STORAGE_BACKEND == "sqlite":
+        from features.local_store import get_local_spreadsheet
+        return None, get_local_spreadsheet()
+    return get_sheets_client()
+
+@st.cache_resource(ttl=3600)
+def get_sheets_client():
     """Get authenticated gspread client and spreadsheet"""
     creds = get_credentials()
     if creds is None:
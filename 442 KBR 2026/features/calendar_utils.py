@@ -1,8 +1,174 @@
 import pandas as pd
 import streamlit as st
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta, timezone
 import time
-from features.auth import get_client
+import numpy as np
+from features.sheet_cache import get_sheet_dfs
+
+# GAMEWEEK/HOUR times are GMT-3 strings ("dd/mm/yyyy HH:MM")
+TZ_GMT3 = timezone(timedelta(hours=-3))
+
+# HOUR timestamp columns (UTC epoch seconds; 0 = not set)
+HOUR_TS_COLS = ['inicio_leilao', 'fim_leilao', 'inicio_free', 'fim_free',
+                'inicio_escalacao', 'fim_escalacao', 'primeiro']
+
+# A round counts as finished ROUND_GRACE_H hours after its last kick-off (injury time margin)
+ROUND_GRACE_H = 2.5
+# A single game counts as finished GAME_FINISHED_H hours after kick-off (DNP auto-subs)
+GAME_FINISHED_H = 2
+
+def parse_game_id(raw):
+    """'.../match/#id:14773692' or '.../14773692' -> '14773692' ('' if no digits)."""
+    raw = str(raw).strip()
+    if 'id:' in raw: gid = raw.split('id:')[-1]
+    elif '/' in raw: gid = raw.split('/')[-1]
+    else: gid = raw
+    if not gid.isdigit():
+        gid = ''.join(filter(str.isdigit, gid))
+    return gid
+
+def parse_gmt3_ts(values):
+    """
+    GMT-3 date strings -> UTC epoch seconds (float array, NaN where unparseable).
+    Tries the sheet format first, then a dayfirst fallback for odd rows.
+    """
+    s = pd.Series(values, dtype=object).astype(str)
+    dt = pd.to_datetime(s, format="%d/%m/%Y %H:%M", errors='coerce')
+    missing = dt.isna()
+    if missing.any():
+        dt[missing] = pd.to_datetime(s[missing], dayfirst=True, errors='coerce')
+    dt = dt.dt.tz_localize(TZ_GMT3)
+    epoch = pd.Timestamp(0, tz='UTC')
+    return ((dt - epoch).dt.total_seconds()).to_numpy(dtype=float)
+
+def build_gameweek(df_gw):
+    """
+    Parsed GAMEWEEK model:
+    - 'games': DataFrame (raw_id, simple_id, rodada, start_ts, start, + original columns)
+    - 'finished_at': {rodada: UTC ts when the round is over} (inf if a game has no valid time)
+    """
+    df = df_gw.copy()
+    df.columns = [c.lower() for c in df.columns]
+    if df.empty or 'id_jogo' not in df.columns:
+        return {'games': pd.DataFrame(columns=['raw_id', 'simple_id', 'rodada', 'start_ts', 'start']),
+                'finished_at': {}}
+
+    df['raw_id'] = df['id_jogo'].astype(str).str.strip()
+    df['simple_id'] = df['raw_id'].map(parse_game_id)
+    df['rodada'] = pd.to_numeric(df.get('rodada'), errors='coerce').astype('Int64')
+    df['start_ts'] = parse_gmt3_ts(df.get('data_hora', pd.Series([''] * len(df))).values)
+    df['start'] = pd.to_datetime(df['start_ts'], unit='s', utc=True)
+
+    per_round = df.dropna(subset=['rodada']).groupby('rodada')['start_ts']
+    # max() skips NaN - a round with any unparseable time is never finished
+    last_start = per_round.max().where(per_round.count() == per_round.size(), float('inf'))
+    finished_at = {int(r): float(ts) + ROUND_GRACE_H * 3600 for r, ts in last_start.items()}
+
+    return {'games': df, 'finished_at': finished_at}
+
+def build_hour(df_hour):
+    """
+    Parsed HOUR sheet: one row per round (sorted), int rodada, float timestamp columns.
+    Missing fim_escalacao timestamps fall back to parsing fim_escalacao_fmt.
+    """
+    df = df_hour.copy()
+    df.columns = [c.lower() for c in df.columns]
+    if df.empty or 'rodada' not in df.columns:
+        return pd.DataFrame(columns=['rodada'] + HOUR_TS_COLS)
+
+    df['rodada'] = pd.to_numeric(df['rodada'], errors='coerce')
+    df = df.dropna(subset=['rodada']).sort_values('rodada').reset_index(drop=True)
+    df['rodada'] = df['rodada'].astype(int)
+    for c in HOUR_TS_COLS:
+        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0.0) if c in df.columns else 0.0
+
+    if 'fim_escalacao_fmt' in df.columns:
+        missing = df['fim_escalacao'] == 0
+        if missing.any():
+            parsed = parse_gmt3_ts(df.loc[missing, 'fim_escalacao_fmt'].values)
+            df.loc[missing, 'fim_escalacao'] = np.nan_to_num(parsed, nan=0.0)
+    return df
+
+def build_calendar(df_gw, df_hour):
+    """
+    GAMEWEEK + HOUR model shared by every page/job:
+    - everything from build_gameweek (games, finished_at)
+    - 'game_id': Int64 column on games (numeric SofaScore id)
+    - 'round_games': {rodada: row positions in games}
+    - 'round_of': {raw_id or simple_id: rodada}
+    - 'hour': build_hour frame, 'deadlines': its fim_escalacao array
+    """
+    cal = build_gameweek(df_gw)
+    games = cal['games'].reset_index(drop=True)
+    games['game_id'] = pd.to_numeric(games['simple_id'], errors='coerce').astype('Int64')
+    cal['games'] = games
+
+    valid = games.dropna(subset=['rodada'])
+    cal['round_games'] = {int(r): idx for r, idx in valid.groupby('rodada').indices.items()}
+    rounds = valid['rodada'].astype(int).tolist()
+    cal['round_of'] = {**dict(zip(valid['raw_id'], rounds)), **dict(zip(valid['simple_id'], rounds))}
+
+    cal['hour'] = build_hour(df_hour)
+    cal['deadlines'] = cal['hour']['fim_escalacao'].to_numpy(dtype=float)
+    return cal
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_calendar():
+    """Calendar model from the cached GAMEWEEK/HOUR snapshots (rebuilt after invalidate())."""
+    sheets = get_sheet_dfs(["GAMEWEEK", "HOUR"])
+    return build_calendar(sheets["GAMEWEEK"], sheets["HOUR"])
+
+def games_in_round(cal, rodada):
+    """GAMEWEEK rows of a round."""
+    idx = cal['round_games'].get(int(rodada))
+    if idx is None:
+        return cal['games'].iloc[0:0]
+    return cal['games'].iloc[idx]
+
+def active_games(cal, now_ts=None, max_minutes=130):
+    """Games that kicked off less than max_minutes ago (live window)."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    games = cal['games']
+    elapsed = (now_ts - games['start_ts']) / 60
+    return games[(elapsed > 0) & (elapsed < max_minutes) & (games['simple_id'] != '')]
+
+def round_info(cal, rodada):
+    """HOUR row of a round as a dict (None if unknown)."""
+    hour = cal['hour']
+    rows = hour[hour['rodada'] == int(rodada)]
+    return rows.iloc[0].to_dict() if not rows.empty else None
+
+def next_deadline_round(cal, now_ts=None):
+    """HOUR row (dict) of the first round whose lineup deadline is still ahead, or None."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    ahead = np.flatnonzero(cal['deadlines'] > now_ts)
+    return cal['hour'].iloc[ahead[0]].to_dict() if len(ahead) else None
+
+def last_started_round(cal, now_ts=None):
+    """Highest round with at least one game already kicked off (None if none)."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    games = cal['games']
+    started = games.loc[games['start_ts'] <= now_ts, 'rodada'].dropna()
+    return int(started.max()) if not started.empty else None
+
+def is_round_finished(gw, rodada, now_ts=None):
+    """O(1): True if every game of the round started more than ROUND_GRACE_H hours ago."""
+    fin = gw['finished_at'].get(int(rodada))
+    if fin is None:
+        return False
+    return fin < (now_ts if now_ts is not None else time.time())
+
+def finished_game_ids(gw, now_ts=None):
+    """simple_ids of the games that kicked off more than GAME_FINISHED_H hours ago."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    games = gw['games']
+    done = games['start_ts'] + GAME_FINISHED_H * 3600 < now_ts
+    return set(games.loc[done & (games['simple_id'] != ''), 'simple_id'])
+
+def finished_rounds(gw, now_ts=None):
+    """Rounds for which is_round_finished holds."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    return {r for r, fin in gw['finished_at'].items() if fin < now_ts}
 
 @st.cache_data(ttl=60, show_spinner=False)
 def get_game_state(target_round=None):
@@ -14,56 +180,26 @@ def get_game_state(target_round=None):
     If target_round is provided, checks status for that specific round.
     """
     try:
-        client, sh = get_client()
-        ws = sh.worksheet("HOUR")
-        data = ws.get_all_records()
-        df = pd.DataFrame(data)
-        
-        # Ensure numeric for rodada
-        df['rodada'] = pd.to_numeric(df['rodada'], errors='coerce')
-        df = df.sort_values(by='rodada')
-
-        # Helper to parse GMT-3 String ("dd/mm/yyyy HH:MM") back to UTC Timestamp - KEEPING FOR SAFETY
-        def parse_gmt3_to_utc_ts(date_str):
-            if not date_str or str(date_str).lower() == 'nan': return 0
-            try:
-                dt_naive = datetime.strptime(str(date_str), "%d/%m/%Y %H:%M")
-                tz_gmt3 = timezone(timedelta(hours=-3))
-                dt_aware = dt_naive.replace(tzinfo=tz_gmt3)
-                return dt_aware.timestamp()
-            except:
-                return 0
+        cal = get_calendar()
 
-        # Current Timestamp (UTC)
-        now_ts = time.time()
-        
         next_round_row = None
         
         if target_round:
             # Find specific round
-            rows = df[df['rodada'] == int(target_round)]
-            if not rows.empty:
-                next_round_row = rows.iloc[0]
-            else:
+            next_round_row = round_info(cal, target_round)
+            if next_round_row is None:
                  return {
                      'status': 'ERROR',
                      'msg': f'Rodada {target_round} não encontrada.',
                      'next_round': target_round
                  }
         else:
-            # Logic: Find the first round where 'fim_escalacao' (Lineup Deadline) is in the future.
+            # First round where 'fim_escalacao' (Lineup Deadline) is in the future.
             # If all passed, season finished.
-            for idx, row in df.iterrows():
-                # Use 'fim_escalacao' (timestamp) directly if available
-                lineup_end = float(row.get('fim_escalacao', 0))
-                
-                # If 0, maybe try parsing? (Should be populated by extraction)
-                if lineup_end == 0:
-                     lineup_end = parse_gmt3_to_utc_ts(row.get('fim_escalacao_fmt'))
-                
-                if lineup_end > now_ts:
-                    next_round_row = row
-                    break
+            next_round_row = next_deadline_round(cal)
+        
+        # Current Timestamp (UTC)
+        now_ts = time.time()
                 
         if next_round_row is None:
              return {
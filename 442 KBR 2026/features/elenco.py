@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from features.auth import get_client, get_players_file
+from features.auth import get_players_file
+from features.sheet_cache import get_sheet_df
 
 POS_ORDER = ['GK', 'DEF', 'MEI', 'ATA']
 POS_MAPPING = {
@@ -35,11 +36,8 @@ def load_data():
     # 2. Try Load API
     api_success = False
     try:
-        client, sh = get_client()
-        
         # Load TEAM
-        ws_team = sh.worksheet("TEAM")
-        df_team = pd.DataFrame(ws_team.get_all_records())
+        df_team = get_sheet_df("TEAM")
         if not df_team.empty:
             df_team.columns = df_team.columns.str.lower()
             df_team['player_id'] = df_team['player_id'].astype(str)
@@ -48,8 +46,7 @@ def load_data():
             df_team.to_csv(cache_team_path, index=False)
 
         # Load SQUAD
-        ws_squad = sh.worksheet("SQUAD")
-        df_squad = pd.DataFrame(ws_squad.get_all_records())
+        df_squad = get_sheet_df("SQUAD")
         if not df_squad.empty:
             df_squad.columns = df_squad.columns.str.lower()
             # Normalize ID col
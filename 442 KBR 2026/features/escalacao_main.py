@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
+from gspread.utils import rowcol_to_a1
 from features.auth import get_client, get_players_file
+from features.sheet_cache import get_sheet_df, invalidate
+from features.sheet_upsert import upsert_blocks
 
 FORMATIONS = {
     '5-4-1': {'DEF': 5, 'MEI': 4, 'ATA': 1},
@@ -33,19 +36,15 @@ def load_data():
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
     try:
-        client, sh = get_client()
-        
         # Load TEAM
-        ws_team = sh.worksheet("TEAM")
-        df_team = pd.DataFrame(ws_team.get_all_records())
+        df_team = get_sheet_df("TEAM")
         if not df_team.empty:
             df_team.columns = df_team.columns.str.lower()
             df_team['player_id'] = df_team['player_id'].astype(str)
             df_team['team_id'] = df_team['team_id'].astype(str)
 
         # Load SQUAD
-        ws_squad = sh.worksheet("SQUAD")
-        df_squad = pd.DataFrame(ws_squad.get_all_records())
+        df_squad = get_sheet_df("SQUAD")
         if not df_squad.empty:
             df_squad.columns = df_squad.columns.str.lower()
             id_col = next((c for c in df_squad.columns if c in ['team_id', 'id']), 'team_id')
@@ -57,7 +56,18 @@ def load_data():
         
     return df_players, df_team, df_squad
 
+LINEUP_HEADER = ['team_id', 'player_id', 'rodada', 'formacao', 'lineup', 'posicao', 'cap']
+
 def save_lineup(team_id, rodada, formation, lineup_data):
+    """
+    Saves one team's lineup for one round.
+    TEAM_LINEUP is stored in (team_id, rodada) blocks: only this team's block is
+    rewritten, and no row is ever inserted or deleted (features/sheet_upsert.py).
+    Not fully race-free on Sheets: two managers saving at the same moment can
+    both claim the same blank/new rows, and the later write wins them.
+    Columns are matched by name: the sheet keeps its own column order and
+    missing columns (older sheets lack posicao/cap) are added at the end.
+    """
     try:
         client, sh = get_client()
 
@@ -65,41 +75,25 @@ def save_lineup(team_id, rodada, formation, lineup_data):
             ws = sh.worksheet("TEAM_LINEUP")
         except:
             ws = sh.add_worksheet("TEAM_LINEUP", 1000, 10)
-            ws.append_row(['team_id', 'player_id', 'rodada', 'formacao', 'lineup', 'posicao', 'cap'])
+            ws.append_row(LINEUP_HEADER)
+
+        header = [str(h).strip().lower() for h in ws.row_values(1)]
+        while header and not header[-1]:
+            header.pop()
+        missing = [c for c in LINEUP_HEADER if c not in header]
+        if missing:
+            ws.update(values=[missing], range_name=rowcol_to_a1(1, len(header) + 1))
+            header += missing
 
-        # Read existing to remove old lineup for this team/round
-        existing = ws.get_all_records()
-        df_ex = pd.DataFrame(existing)
-        
         new_rows = []
         for p in lineup_data:
-            new_rows.append([str(team_id), str(p['player_id']), int(rodada), formation, p['status'], p.get('posicao', ''), p.get('cap', '')])
-
-        if not df_ex.empty:
-            df_ex['team_id'] = df_ex['team_id'].astype(str)
-            df_ex['rodada'] = pd.to_numeric(df_ex['rodada'], errors='coerce').fillna(0).astype(int)
-            mask_del = (df_ex['team_id'] == str(team_id)) & (df_ex['rodada'] == int(rodada))
-            df_keep = df_ex[~mask_del]
-            # Handle existing data with or without posicao/cap columns
-            keep_cols = ['team_id', 'player_id', 'rodada', 'formacao', 'lineup']
-            if 'posicao' in df_keep.columns:
-                keep_cols.append('posicao')
-            else:
-                df_keep['posicao'] = ''
-                keep_cols.append('posicao')
-            if 'cap' in df_keep.columns:
-                keep_cols.append('cap')
-            else:
-                df_keep['cap'] = ''
-                keep_cols.append('cap')
-            final_data = df_keep[keep_cols].values.tolist()
-        else:
-            final_data = []
+            values = {'team_id': str(team_id), 'player_id': str(p['player_id']), 'rodada': int(rodada),
+                      'formacao': formation, 'lineup': p['status'], 'posicao': p.get('posicao', ''), 'cap': p.get('cap', '')}
+            new_rows.append([values.get(c, '') for c in header])
 
-        # Write
-        ws.clear()
-        ws.append_row(['team_id', 'player_id', 'rodada', 'formacao', 'lineup', 'posicao', 'cap'])
-        ws.append_rows(final_data + new_rows)
+        key_cols = [header.index('team_id'), header.index('rodada')]
+        upsert_blocks(ws, {(str(team_id), str(int(rodada))): new_rows}, key_cols=key_cols)
+        invalidate("TEAM_LINEUP")
         return True
     except Exception as e:
         st.error(f"Erro ao salvar: {e}")
@@ -107,15 +101,10 @@ def save_lineup(team_id, rodada, formation, lineup_data):
 
 def get_saved_lineup_data(team_id, rodada):
     try:
-        client, sh = get_client()
         try:
-             ws = sh.worksheet("TEAM_LINEUP")
+             df = get_sheet_df("TEAM_LINEUP")
         except:
              return pd.DataFrame()
-             
-        # Optimization: Get all and filter in DF (easier than cell matching)
-        records = ws.get_all_records()
-        df = pd.DataFrame(records)
         
         if df.empty: return df
         
@@ -184,6 +173,7 @@ def verify_lineup_integrity(rodada):
             ws_lineup.clear()
             ws_lineup.append_row(header)
             ws_lineup.append_rows(rows_to_keep)
+            invalidate("TEAM_LINEUP")
             return True, f"Verificação concluída. Inconsistências corrigidas na Rodada {rodada}."
             
         return False, "Nenhuma inconsistência encontrada."
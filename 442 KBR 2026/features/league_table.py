@@ -1,6 +1,10 @@
 import pandas as pd
-import datetime
-from features.auth import get_client
+import json
+import os
+import hashlib
+from features.auth import get_client, BASE_DIR
+from features.sheet_cache import get_sheet_dfs, invalidate
+from features.calendar_utils import build_gameweek, is_round_finished
 
 # Constants
 H2H_TABLE_SHEET = "H2H - TABLE"
@@ -9,45 +13,8 @@ ROUNDS_SHEET = "H2H - ROUNDS"
 GAMEWEEK_SHEET = "GAMEWEEK"
 SQUAD_SHEET = "SQUAD"
 
-def parse_date(date_str):
-    """Robust date parser for DD/MM/YYYY HH:MM"""
-    try:
-        return pd.to_datetime(date_str, dayfirst=True)
-    except:
-        return None
-
-def is_round_finished(rodada, df_gw):
-    """
-    Checks if a round is finished.
-    Rule: ALL games in the round must have (Start Time + 2.5 hours) < Now.
-    """
-    if df_gw.empty or 'rodada' not in df_gw.columns:
-        return False
-        
-    # Filter games for this round
-    round_games = df_gw[df_gw['rodada'] == rodada]
-    
-    if round_games.empty:
-        # If no games defined for this round in GW logic, we can't say it's finished?
-        # Or implies it doesn't exist. safest is False to avoid calc.
-        return False
-        
-    now = datetime.datetime.now()
-    
-    for _, row in round_games.iterrows():
-        dt_str = str(row.get('data_hora', ''))
-        dt = parse_date(dt_str)
-        if not dt:
-             # invalid date, assume not finished/scheduled? 
-             # Safety: return False
-             return False
-             
-        # Check if finished (Start + 2.5h)
-        # Using 2.5h to be safe for injury time
-        if (dt + datetime.timedelta(hours=2.5)) > now:
-            return False # Found a game not finished
-            
-    return True
+# Local cache of finished rounds' match results + last written table
+ROUND_RESULTS_FILE = BASE_DIR / "Dados" / "h2h_round_results.json"
 
 def robust_float(x):
     try:
@@ -57,166 +24,201 @@ def robust_float(x):
     except:
         return 0.0
 
-def update_league_table():
-    print("--- Updating H2H League Table ---")
-    client, sh = get_client()
-    
+def load_round_results():
+    """
+    {'rounds': {rodada: [[home, away, score_h, score_a], ...]},
+     'fingerprints': {rodada: hash of its TEAM_POINTS rows + fixtures},
+     'totals': {team_id: {J, PF, PS, V, E, D}}, 'table_hash': str}
+    """
     try:
-        # 1. Load Data
-        ws_rounds = sh.worksheet(ROUNDS_SHEET)
-        df_rounds = pd.DataFrame(ws_rounds.get_all_records())
-        
-        ws_tp = sh.worksheet(TEAM_POINTS_SHEET)
-        # Use get_values for precision if needed, but get_all_records is usually ok if formatted
-        # actually for robust_float we prefer raw strings if decimal is comma
-        vals_tp = ws_tp.get_values()
-        if vals_tp and len(vals_tp) > 1:
-            df_tp = pd.DataFrame(vals_tp[1:], columns=vals_tp[0])
-        else:
-            df_tp = pd.DataFrame()
-            
-        ws_gw = sh.worksheet(GAMEWEEK_SHEET)
-        df_gw = pd.DataFrame(ws_gw.get_all_records())
-        
-        ws_squad = sh.worksheet(SQUAD_SHEET)
-        df_squad = pd.DataFrame(ws_squad.get_all_records())
-        
+        with open(ROUND_RESULTS_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        cache.setdefault('rounds', {})
+        cache.setdefault('fingerprints', {})
+        return cache
+    except Exception:
+        return {'rounds': {}, 'fingerprints': {}}
+
+def save_round_results(cache):
+    try:
+        ROUND_RESULTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ROUND_RESULTS_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmp, ROUND_RESULTS_FILE)
     except Exception as e:
-        print(f"Error loading sheets for Table: {e}")
-        return
+        print(f"Error saving round results: {e}")
 
-    # Normalize Columns
-    df_rounds.columns = [c.lower() for c in df_rounds.columns]
+def fold_results(results, all_teams):
+    """
+    Standings from per-round results in one vectorized pass.
+    Each match is counted once from each side (home and away perspective).
+    """
+    cols = ['team_id', 'P', 'J', 'PF', 'PS', 'V', 'E', 'D']
+    matches = [m for rnd in results.values() for m in rnd]
+    base = pd.DataFrame({'team_id': sorted(all_teams)})
+    if not matches:
+        for c in cols[1:]:
+            base[c] = 0.0 if c in ('PF', 'PS') else 0
+        return base[cols]
+
+    m = pd.DataFrame(matches, columns=['home', 'away', 'score_h', 'score_a'])
+    sides = pd.concat([
+        pd.DataFrame({'team_id': m['home'], 'PF': m['score_h'], 'PS': m['score_a']}),
+        pd.DataFrame({'team_id': m['away'], 'PF': m['score_a'], 'PS': m['score_h']}),
+    ], ignore_index=True)
+    sides['V'] = (sides['PF'] > sides['PS']).astype(int)
+    sides['E'] = (sides['PF'] == sides['PS']).astype(int)
+    sides['D'] = (sides['PF'] < sides['PS']).astype(int)
+
+    agg = sides.groupby('team_id').agg(
+        J=('PF', 'size'), PF=('PF', 'sum'), PS=('PS', 'sum'),
+        V=('V', 'sum'), E=('E', 'sum'), D=('D', 'sum'))
+    agg['P'] = agg['V'] * 3 + agg['E']
+
+    df = base.merge(agg.reset_index(), on='team_id', how='left')
+    df[['PF', 'PS']] = df[['PF', 'PS']].fillna(0.0)
+    for c in ['P', 'J', 'V', 'E', 'D']:
+        df[c] = df[c].fillna(0).astype(int)
+    return df[cols]
+
+STAT_COLS = ['J', 'PF', 'PS', 'V', 'E', 'D']
+
+def _totals_frame(totals, all_teams):
+    """Cached {team_id: {stat: value}} -> DataFrame indexed by team_id (0 for missing teams)."""
+    teams = sorted(set(all_teams) | set(totals))
+    df = pd.DataFrame([[totals.get(t, {}).get(c, 0) for c in STAT_COLS] for t in teams],
+                      index=pd.Index(teams, name='team_id'), columns=STAT_COLS, dtype=float)
+    return df
+
+def _normalize_team_points(df_tp):
     df_tp.columns = [c.lower() for c in df_tp.columns]
-    df_gw.columns = [c.lower() for c in df_gw.columns]
-    df_squad.columns = [c.lower() for c in df_squad.columns]
-    
-    # Types
-    if 'rodada' in df_rounds.columns: df_rounds['rodada'] = pd.to_numeric(df_rounds['rodada'], errors='coerce')
-    if 'rodada' in df_tp.columns: df_tp['rodada'] = pd.to_numeric(df_tp['rodada'], errors='coerce')
-    if 'rodada' in df_gw.columns: df_gw['rodada'] = pd.to_numeric(df_gw['rodada'], errors='coerce')
-    
+    df_tp['rodada'] = pd.to_numeric(df_tp['rodada'], errors='coerce')
     df_tp['pontuacao'] = df_tp['pontuacao'].apply(robust_float)
     df_tp['team_id'] = df_tp['team_id'].astype(str)
     
-    # Pre-calc Team Points per Round
     # FILTER: Only 'escalado' == True
     # 'escalado' column might be boolean or string 'TRUE'/'FALSE' or '1'/'0'
-    # We should normalize/check
     if 'escalado' in df_tp.columns:
-         # Convert to string and upper case for safety
-         df_tp['escalado_str'] = df_tp['escalado'].astype(str).str.upper()
-         # Filter
-         df_active = df_tp[df_tp['escalado_str'].isin(['TRUE', '1'])]
-    else:
-         # If column missing, assume all? OR none? Safest is warn and empty?
-         # But manual update script creates it.
-         print("Warning: 'escalado' column missing in TEAM_POINTS. Using all.")
-         df_active = df_tp
+        return df_tp[df_tp['escalado'].astype(str).str.upper().isin(['TRUE', '1'])]
+    print("Warning: 'escalado' column missing in TEAM_POINTS. Using all.")
+    return df_tp
+
+def _round_fingerprints(df_active, df_rounds, rounds):
+    """{str(rodada): hash} of what a round's result depends on: its counted TEAM_POINTS rows and its fixtures."""
+    pts = {r: g for r, g in df_active.groupby('rodada')}
+    fix = {r: g for r, g in df_rounds.groupby('rodada')}
+    fps = {}
+    for r in rounds:
+        rows = pts[r][['team_id', 'pontuacao']].values.tolist() if r in pts else []
+        fixtures = fix[r][['home_team_id', 'away_team_id']].astype(str).values.tolist() if r in fix else []
+        payload = json.dumps([sorted(rows), fixtures], default=str)
+        fps[str(r)] = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    return fps
 
+def _round_results(df_active, df_rounds, rounds):
+    """[[home, away, score_h, score_a], ...] per round, from the counted TEAM_POINTS rows."""
     # Group by Team, Round -> Sum Points
+    df_active = df_active[df_active['rodada'].isin(rounds)]
     round_scores = df_active.groupby(['team_id', 'rodada'])['pontuacao'].sum().to_dict() # Key: (tid, rod)
     
-    # Init Table Data
-    # Key: TeamID
-    stats = {} 
+    results = {}
+    for r in rounds:
+        matches = df_rounds[df_rounds['rodada'] == r]
+        home = matches['home_team_id'].astype(str).tolist()
+        away = matches['away_team_id'].astype(str).tolist()
+        results[str(r)] = [[h, a, round_scores.get((h, r), 0.0), round_scores.get((a, r), 0.0)]
+                           for h, a in zip(home, away)]
+    return results
+
+def update_league_table(full=False):
+    """
+    Maintains H2H - TABLE incrementally.
+    Results of finished rounds are cached (Dados/h2h_round_results.json) together
+    with the running totals and a fingerprint of each round's TEAM_POINTS rows and
+    fixtures. A run recomputes only the rounds that finished since the last one or
+    whose fingerprint changed (any TEAM_POINTS/ROUNDS edit, however it was made),
+    and corrects the totals by those rounds alone.
+    full=True drops the cache and rebuilds the table from every finished round.
+    Returns True on success (including nothing to do), False on errors.
+    """
+    print("--- Updating H2H League Table ---")
+    client, sh = get_client()
+    
+    try:
+        # Points and fixtures live; calendar and names from cached snapshots
+        live = get_sheet_dfs([TEAM_POINTS_SHEET, ROUNDS_SHEET], fresh=True)
+        df_tp = live[TEAM_POINTS_SHEET]
+        df_rounds = live[ROUNDS_SHEET]
+        sheets = get_sheet_dfs([GAMEWEEK_SHEET, SQUAD_SHEET])
+        df_gw = sheets[GAMEWEEK_SHEET]
+        df_squad = sheets[SQUAD_SHEET]
+    except Exception as e:
+        print(f"Error loading sheets for Table: {e}")
+        return False
+
+    if df_rounds.empty or df_tp.empty:
+        print("Error loading sheets for Table: ROUNDS/TEAM_POINTS empty or unreadable.")
+        return False
+
+    # Normalize Columns
+    df_rounds.columns = [c.lower() for c in df_rounds.columns]
+    df_squad.columns = [c.lower() for c in df_squad.columns]
+    df_rounds['rodada'] = pd.to_numeric(df_rounds['rodada'], errors='coerce')
+    df_active = _normalize_team_points(df_tp)
     
-    # Identify unique teams from Squad or Rounds
+    # Identify unique teams from Rounds
     all_teams = set()
     if 'home_team_id' in df_rounds.columns:
         all_teams.update(df_rounds['home_team_id'].astype(str).unique())
         all_teams.update(df_rounds['away_team_id'].astype(str).unique())
-        
-    for tid in all_teams:
-        stats[tid] = {
-            'team_id': tid,
-            'P': 0, # Pontos
-            'J': 0, # Jogos
-            'PF': 0.0, # Pontos Feitos
-            'PS': 0.0, # Pontos Sofridos
-            'V': 0, 'E': 0, 'D': 0 # Optional details
-        }
-        
-    # ITERATE ROUNDS
-    # We iterate unique rounds found in matchups
-    rounds_list = sorted(df_rounds['rodada'].unique())
     
-    for r in rounds_list:
-        if pd.isna(r): continue
-        r = int(r)
-        
-        # CHECK IF FINISHED
-        if not is_round_finished(r, df_gw):
-            print(f"  -> Round {r} NOT finished. Skipping.")
-            continue
-            
-        print(f"  -> Processing Round {r} (Finished)...")
-        
-        # Get matchups for this round
-        matches = df_rounds[df_rounds['rodada'] == r]
-        
-        for _, m in matches.iterrows():
-            tid_h = str(m['home_team_id'])
-            tid_a = str(m['away_team_id'])
-            
-            # Get Scores
-            # If entry missing, 0.0
-            score_h = round_scores.get((tid_h, r), 0.0)
-            score_a = round_scores.get((tid_a, r), 0.0)
-            
-            # Update Games
-            if tid_h in stats: stats[tid_h]['J'] += 1
-            if tid_a in stats: stats[tid_a]['J'] += 1
-            
-            # Update PF/PS
-            if tid_h in stats:
-                stats[tid_h]['PF'] += score_h
-                stats[tid_h]['PS'] += score_a
-            if tid_a in stats:
-                stats[tid_a]['PF'] += score_a
-                stats[tid_a]['PS'] += score_h
-                
-            # Result Logic
-            if score_h > score_a:
-                # Home Win
-                if tid_h in stats: 
-                    stats[tid_h]['P'] += 3
-                    stats[tid_h]['V'] += 1
-                if tid_a in stats: 
-                    stats[tid_a]['D'] += 1
-            elif score_a > score_h:
-                # Away Win
-                if tid_h in stats: 
-                    stats[tid_h]['D'] += 1
-                if tid_a in stats: 
-                    stats[tid_a]['P'] += 3
-                    stats[tid_a]['V'] += 1
-            else:
-                # Draw
-                if tid_h in stats: 
-                    stats[tid_h]['P'] += 1
-                    stats[tid_h]['E'] += 1
-                if tid_a in stats: 
-                    stats[tid_a]['P'] += 1
-                    stats[tid_a]['E'] += 1
-                    
-    # BUILD DATAFRAME
-    table_rows = []
-    for tid, data in stats.items():
-        # Calculate Efficiency (Aproveitamento)
-        # P / (J * 3)
-        aprov = 0.0
-        if data['J'] > 0:
-            aprov = (data['P'] / (data['J'] * 3)) * 100
-            
-        data['Aproveitamento'] = aprov
-        table_rows.append(data)
+    gw = build_gameweek(df_gw)
+    cache = {'rounds': {}, 'fingerprints': {}} if full else load_round_results()
+    finished = sorted(int(r) for r in df_rounds['rodada'].dropna().unique() if is_round_finished(gw, int(r)))
+    fps = _round_fingerprints(df_active, df_rounds, finished)
+    
+    # Rounds to (re)compute: not cached yet or changed since; cached rounds that are
+    # no longer finished (calendar/fixture change) leave the table
+    redo = [r for r in finished if str(r) not in cache['rounds'] or cache['fingerprints'].get(str(r)) != fps[str(r)]]
+    dropped = [k for k in cache['rounds'] if int(k) not in finished]
+    
+    if 'totals' in cache:
+        totals = _totals_frame(cache['totals'], all_teams)
+    else:
+        # No totals yet (full rebuild / older cache): folded once from the cached rounds
+        totals = _totals_frame({}, all_teams)
+        if cache['rounds']:
+            folded = fold_results(cache['rounds'], all_teams).set_index('team_id')[STAT_COLS]
+            totals = totals.add(folded, fill_value=0)
+    
+    changed = bool(redo or dropped)
+    if changed:
+        print(f"  -> Rounds to compute: {redo}" + (f", dropped: {dropped}" if dropped else ""))
+        fresh_results = _round_results(df_active, df_rounds, redo)
         
-    df_table = pd.DataFrame(table_rows)
+        # Fold only these rounds into the running totals: old results out, new ones in
+        old = {k: cache['rounds'][k] for k in list(fresh_results) + dropped if k in cache['rounds']}
+        if old:
+            totals = totals.sub(fold_results(old, all_teams).set_index('team_id')[STAT_COLS], fill_value=0)
+        if fresh_results:
+            totals = totals.add(fold_results(fresh_results, all_teams).set_index('team_id')[STAT_COLS], fill_value=0)
+        for k in dropped:
+            cache['rounds'].pop(k, None)
+            cache['fingerprints'].pop(k, None)
+        cache['rounds'].update(fresh_results)
+        cache['fingerprints'].update({str(r): fps[str(r)] for r in redo})
+    print(f"  -> Finished rounds: {len(cache['rounds'])} ({len(redo)} recomputed)")
+    
+    df_table = totals.reset_index()
+    for c in ['J', 'V', 'E', 'D']:
+        df_table[c] = df_table[c].round().astype(int)
+    df_table['P'] = df_table['V'] * 3 + df_table['E']
+    df_table['Aproveitamento'] = (df_table['P'] / (df_table['J'] * 3)).where(df_table['J'] > 0, 0.0) * 100
     
     if df_table.empty:
         print("Table empty.")
-        return
+        return True
         
     # JOIN TEAM NAMES
     # df_squad has team_id_norm usually or need to find id column
@@ -251,15 +253,30 @@ def update_league_table():
     df_final['PF'] = df_final['PF'].apply(lambda x: f"{x:.2f}".replace('.', ','))
     df_final['PS'] = df_final['PS'].apply(lambda x: f"{x:.2f}".replace('.', ','))
     
+    values = [df_final.columns.values.tolist()] + df_final.values.tolist()
+    table_hash = hashlib.sha256(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+    cache['totals'] = {t: {c: float(v) for c, v in row.items()} for t, row in totals.round(6).iterrows()}
+    if not changed and cache.get('table_hash') == table_hash:
+        print("✅ H2H Table already up to date.")
+        return True
+    
     # SAVE
     try:
         try:
             ws_table = sh.worksheet(H2H_TABLE_SHEET)
         except:
             ws_table = sh.add_worksheet(H2H_TABLE_SHEET, 100, 10)
-            
-        ws_table.clear()
-        ws_table.update([df_final.columns.values.tolist()] + df_final.values.tolist(), value_input_option='USER_ENTERED')
+        
+        # Overwrite in place (one request); blank out every other row of the sheet
+        # so rows left over from a longer table never survive
+        padded = values + [[''] * len(cols_order)] * max(ws_table.row_count - len(values), 0)
+        ws_table.update(values=padded, range_name='A1', value_input_option='USER_ENTERED')
         print("✅ H2H Table Updated successfully.")
     except Exception as e:
         print(f"Error saving table: {e}")
+        return False
+    
+    invalidate(H2H_TABLE_SHEET)
+    cache['table_hash'] = table_hash
+    save_round_results(cache)
+    return True
@@ -1,6 +1,10 @@
 import streamlit as st
 import pandas as pd
 from features.auth import get_client, get_players_file
+from features.sheet_cache import get_sheet_df
+from features import auction
+from features.roster_state import run_transaction
+from features.write_queue import enqueue_append, pending_ops, flush
 
 @st.cache_data(ttl=60)
 def load_data():
@@ -12,19 +16,15 @@ def load_data():
     df_players['player_id'] = df_players['player_id'].astype(str)
     
     try:
-        client, sh = get_client()
-        
         # Load TEAM
-        data_team = sh.worksheet("TEAM").get_all_records()
-        df_team = pd.DataFrame(data_team)
+        df_team = get_sheet_df("TEAM")
         if not df_team.empty:
             df_team.columns = df_team.columns.str.lower()
             df_team['player_id'] = df_team['player_id'].astype(str)
             df_team['team_id'] = df_team['team_id'].astype(str)
             
         # Load SQUAD
-        data_squad = sh.worksheet("SQUAD").get_all_records()
-        df_squad = pd.DataFrame(data_squad)
+        df_squad = get_sheet_df("SQUAD")
         if not df_squad.empty:
             df_squad.columns = df_squad.columns.str.lower()
             id_col = next((c for c in df_squad.columns if c in ['team_id', 'id']), 'team_id')
@@ -34,8 +34,7 @@ def load_data():
 
         # Load FREE
         try:
-            data_free = sh.worksheet("PLAYERS_FREE").get_all_records()
-            df_free_tab = pd.DataFrame(data_free)
+            df_free_tab = get_sheet_df("PLAYERS_FREE")
             if not df_free_tab.empty:
                 df_free_tab.columns = df_free_tab.columns.str.lower()
                 df_free_tab['player_id'] = df_free_tab['player_id'].astype(str)
@@ -50,23 +49,23 @@ def load_data():
 
 def save_bid(team_id, rodada, pid_free, pid_team, price):
     try:
-        client, sh = get_client()
-        try:
-            ws = sh.worksheet("LEILAO_LANCES")
-        except:
-            ws = sh.add_worksheet("LEILAO_LANCES", 1000, 5)
-            ws.append_row(['team_id', 'rodada', 'player_id_free', 'player_id_team', 'price', 'status'])
-        
         # Ensure price is float
         price_val = float(price)
+        # Write-behind: journaled now, written to Sheets by the queue worker.
         # Store status as empty initially
-        ws.append_row([str(team_id), int(rodada), str(pid_free), str(pid_team), price_val, ''])
+        enqueue_append(
+            "LEILAO_LANCES",
+            [[str(team_id), int(rodada), str(pid_free), str(pid_team), price_val, '']],
+            header=['team_id', 'rodada', 'player_id_free', 'player_id_team', 'price', 'status'],
+        )
         return True
     except Exception as e:
         st.error(f"Erro ao salvar lance: {e}")
         return False
 
 def has_pending_bids():
+    if pending_ops("LEILAO_LANCES"):
+        return True
     try:
         client, sh = get_client()
         ws_lances = sh.worksheet("LEILAO_LANCES")
@@ -83,229 +82,18 @@ def has_pending_bids():
 
 def process_auction():
     try:
-        client, sh = get_client()
-        
-        # 1. Load Data Live
-        ws_lances = sh.worksheet("LEILAO_LANCES")
-        all_values = ws_lances.get_all_values()
-        
-        if len(all_values) <= 1: 
-            st.info("Sem lances.")
-            return
-
-        headers = [h.lower() for h in all_values[0]]
-        data = all_values[1:]
-        lances = pd.DataFrame(data, columns=headers)
-        
-        if lances.empty: 
-            st.info("Sem lances.")
-            return
-
-        if 'rodada' not in lances.columns: return
-        
-        # Ensure 'status' column exists in DataFrame
-        if 'status' not in lances.columns:
-            lances['status'] = ''
-
-        # Filter: Only process UNPROCESSED bids
-        # We assume empty string or None means unprocessed. 
-        # Be robust: fillna('') and strip.
-        lances['status'] = lances['status'].fillna('').astype(str).str.strip()
-        df_pending = lances[lances['status'] == ''].copy()
-        
-        if df_pending.empty:
-            st.info("Todos os lances já foram processados.")
+        result = auction.run_round()
+        if result['rodada'] is None:
+            st.info(result['msg'])
             return
-
-        # Fix Numerics (Commas)
-        # Apply to df_pending for calculation
-        df_pending['rodada'] = pd.to_numeric(df_pending['rodada'], errors='coerce').fillna(0).astype(int)
-        
-        # Fix Price: Replace , with . and convert
-        df_pending['price'] = df_pending['price'].astype(str).str.replace(',', '.', regex=False)
-        df_pending['price'] = pd.to_numeric(df_pending['price'], errors='coerce').fillna(0.0)
-        
-        max_round = df_pending['rodada'].max()
-        # Filter for the current round being processed
-        df_process = df_pending[df_pending['rodada'] == max_round].sort_values(by='price', ascending=False)
-        
-        if df_process.empty:
-            st.info(f"Sem lances pendentes para a rodada atual ({max_round}).")
-            return
-
-        st.write(f"Processando Rodada {max_round} ({len(df_process)} lances novos)...")
-        
-        # Load State
-        ws_team = sh.worksheet("TEAM")
-        teams_rows = ws_team.get_all_records() # List of dicts
-        
-        ws_squad = sh.worksheet("SQUAD")
-        squad_rows = ws_squad.get_all_records()
-        
-        try: ws_free = sh.worksheet("PLAYERS_FREE") 
-        except: ws_free = sh.add_worksheet("PLAYERS_FREE", 1000,2)
-        free_rows = ws_free.get_all_records()
-        
-        # Helpers
-        def get_budget(tid):
-            for r in squad_rows:
-                if str(r.get('team_id', r.get('id'))) == str(tid):
-                    val = str(r.get('caixa', 0)).replace(',','.')
-                    try: return float(val)
-                    except: return 0.0
-            return 0.0
-            
-        def update_budget(tid, val):
-            for r in squad_rows:
-                 if str(r.get('team_id', r.get('id'))) == str(tid):
-                    cur_str = str(r.get('caixa', 0)).replace(',','.')
-                    cur = float(cur_str) if cur_str else 0.0
-                    r['caixa'] = cur - val
-                    return
-
-        def is_free(pid):
-            # Check strictly in PLAYERS_FREE
-            for r in free_rows:
-                if str(r.get('player_id')) == str(pid): return True
-            return False
-
-        def owns_player(tid, pid):
-            for r in teams_rows:
-                if str(r.get('team_id')) == str(tid) and str(r.get('player_id')) == str(pid): return True
-            return False
-
-        def get_roster_size(tid):
-            count = 0
-            for r in teams_rows:
-                if str(r.get('team_id')) == str(tid):
-                    count += 1
-            return count
-
-        valid_bids = []
-
-        # Use index from original 'lances' to update status later
-        # But df_process is a filtered copy. We need to map back or easier:
-        # Just update 'lances' using the index from df_process (preserved)
-        
-        for idx, bid in df_process.iterrows():
-            tid = str(bid['team_id'])
-            p_free = str(bid['player_id_free'])
-            p_drop = str(bid['player_id_team'])
-            price = float(bid['price'])
-            
-            # Checks
-            if get_budget(tid) < price:
-                st.write(f"❌ {tid}: Sem caixa ({price}).")
-                lances.at[idx, 'status'] = 'REJEITADO_CAIXA'
-                continue
-            if not is_free(p_free):
-                st.write(f"❌ {tid}: {p_free} não está livre.")
-                lances.at[idx, 'status'] = 'REJEITADO_NAO_LIVRE'
-                continue
-            
-            # Check for NENHUM (empty slot) case
-            is_empty_slot = p_drop == "NENHUM" or p_drop == "" or p_drop.lower() == "none"
-            
-            if is_empty_slot:
-                # Verify team still has ≤17 players
-                if get_roster_size(tid) > 17:
-                    st.write(f"❌ {tid}: Elenco cheio.")
-                    lances.at[idx, 'status'] = 'REJEITADO_CHEIO'
-                    continue
-            else:
-                # Normal case - must own the player to drop
-                if not owns_player(tid, p_drop):
-                    st.write(f"❌ {tid}: Não possui {p_drop}.")
-                    lances.at[idx, 'status'] = 'REJEITADO_NAO_POSSUI'
-                    continue
-            
-            # --- EXECUTE ---
-            st.write(f"✅ Lance Válido: {tid} leva {p_free} por {price}" + (" (Vaga Livre)" if is_empty_slot else ""))
-            lances.at[idx, 'status'] = 'APROVADO'
-            
-            # 1. Update Budget
-            update_budget(tid, price)
-            
-            # 2. Handle TEAM
-            if is_empty_slot:
-                # Just add the new player without removing anyone
-                if teams_rows:
-                    new_default = {k: '' for k in teams_rows[0].keys()}
-                    new_default['team_id'] = tid
-                    new_default['player_id'] = p_free
-                    teams_rows.append(new_default)
-                else:
-                    teams_rows.append({'team_id': tid, 'player_id': p_free})
-            else:
-                # Swap
-                idx_rem = -1
-                for i, r in enumerate(teams_rows):
-                    if str(r.get('team_id')) == tid and str(r.get('player_id')) == p_drop:
-                        idx_rem = i
-                        break
-                
-                if idx_rem != -1:
-                    old_row = teams_rows.pop(idx_rem)
-                    new_row = old_row.copy()
-                    new_row['player_id'] = p_free
-                    teams_rows.append(new_row)
-                
-                # Add dropped player to FREE
-                free_rows.append({'player_id': p_drop})
-            
-            # 3. Remove p_free from FREE list
-            idx_free = -1
-            for i, r in enumerate(free_rows):
-                 if str(r.get('player_id')) == p_free: idx_free = i; break
-            if idx_free != -1: free_rows.pop(idx_free)
-            
-            valid_bids.append(bid)
         
-        # --- COMMIT ---
-        if valid_bids:
-            # TEAM
-            ws_team.clear()
-            headers_tm = list(teams_rows[0].keys()) if teams_rows else []
-            ws_team.update([headers_tm] + [list(r.values()) for r in teams_rows])
-            
-            # PLAYERS_FREE
-            ws_free.clear()
-            ws_free.update([['player_id']] + [[r['player_id']] for r in free_rows])
-            
-            # SQUAD
-            ws_squad.clear()
-            headers_sq = list(squad_rows[0].keys()) if squad_rows else []
-            ws_squad.update([headers_sq] + [list(r.values()) for r in squad_rows])
-            
-            # LEILAO_VENCIDO (Keep this as Log)
-            try: ws_vencido = sh.worksheet("LEILAO_VENCIDO")
-            except: ws_vencido = sh.add_worksheet("LEILAO_VENCIDO", 1000, 5)
-            
-            vb_df = pd.DataFrame(valid_bids)
-            # Ensure columns exist
-            cols_to_save = ['team_id','rodada','player_id_free','player_id_team','price']
-            for c in cols_to_save:
-                 if c not in vb_df.columns: vb_df[c] = ''
-            
-            # Format price back to something standard or keep as float
-            data_venc = vb_df[cols_to_save].values.tolist()
-            ws_vencido.append_rows(data_venc)
-            
-        # FINAL STEP: Update LEILAO_LANCES with new status
-        # Reconstruct full data
-        # Ensure status handled for NaN
-        lances = lances.fillna('')
-        
-        # Prepare output
-        output_data = [lances.columns.tolist()] + lances.values.tolist()
-        
-        # SAFE UPDATE: Do NOT use clear()
-        # We only overwrite the rows we read + changed.
-        # If new rows were added (row > len(output_data)), they remain untouched.
-        # We assume headers didn't change (A1 start).
-        ws_lances.update(output_data, "A1")
+        st.write(f"Processando Rodada {result['rodada']} ({len(result['audit'])} lances novos)...")
+        for entry in result['audit']:
+            st.write(auction.describe(entry))
+        with st.expander("Auditoria do leilão"):
+            st.dataframe(pd.DataFrame(result['audit']), hide_index=True)
         
-        if valid_bids:
+        if any(e['status'] == 'APROVADO' for e in result['audit']):
             st.success("Processamento concluído com sucesso!")
         else:
             st.warning("Rodada processada. Nenhum lance aprovado.")
@@ -319,106 +107,44 @@ def execute_free_swap(team_id, drop_pid, pickup_pid, rodada):
     """
     Swap a player from Team to Free Agency
     Or Add if drop_pid is None/Empty (and space exists)
+    Validated against an indexed snapshot of TEAM/PLAYERS_FREE and committed
+    as one version-checked write (features/roster_state.py): if another
+    manager changes the sheets meanwhile, the swap is re-validated and retried.
     """
+    is_addition = (str(drop_pid).upper() == "NENHUM" or not drop_pid)
+    
+    def apply(snap):
+        # Pickup target must STILL be free
+        if not snap.is_free(pickup_pid):
+            return f"Opa! O jogador {pickup_pid} já foi levado por outro time agorinha. 😢"
+        if is_addition:
+            if snap.roster_size(team_id) >= auction.MAX_ROSTER:
+                return "Erro: Elenco cheio. Escolha um jogador para dispensar."
+        elif not snap.owns(team_id, drop_pid):
+            return "Erro: Esse jogador não parece pertencer ao seu time na base."
+        # Drop's TEAM row is rewritten in place with the pickup, no row deletes
+        snap.sign(team_id, pickup_pid, drop=None if is_addition else drop_pid)
+        return None
+    
     try:
-        client, sh = get_client()
-        
-        ws_team = sh.worksheet("TEAM")
-        ws_free = sh.worksheet("PLAYERS_FREE")
-        
-        # 1. OPTIMISTIC CHECK: Ensure pickup target is STILL free
-        # We search specifically for the Cell. This is faster and verifies state.
-        cell_free = ws_free.find(str(pickup_pid))
-        if not cell_free:
-            st.error(f"Opa! O jogador {pickup_pid} já foi levado por outro time agorinha. 😢")
+        error = run_transaction(apply, names=["TEAM", "PLAYERS_FREE"])
+        if error:
+            st.error(error)
             return False
-
-        # Check roster limit if adding without dropping
-        is_addition = (str(drop_pid).upper() == "NENHUM" or not drop_pid)
         
-        # --- PHASE 1: HANDLE DROP (Release Player) ---
-        if not is_addition:
-            # Find player in TEAM sheet to remove
-            # Need to search for player_id column typically? 
-            # Risk: find(player_id) might find it in another team if logic allows duplicates (shouldn't).
-            # Safer: Search, check team_id in same row.
-            cell_drop = ws_team.find(str(drop_pid))
-            
-            if not cell_drop:
-                 st.error("Erro: Jogador a dispensar não encontrado na base de dados.")
-                 return False
-                 
-            # Verify ownership (Column A usually team_id, B player_id... need to check schema)
-            # Assuming team_id is col 1 or we check the row.
-            row_vals = ws_team.row_values(cell_drop.row)
-            # We assume team_id is in the row. 
-            # Simple check: is str(team_id) in row_vals?
-            if str(team_id) not in [str(v) for v in row_vals]:
-                 st.error("Erro: Esse jogador não parece pertencer ao seu time na base.")
-                 return False
-            
-            # ATOMIC DELETE (Drop)
-            ws_team.delete_rows(cell_drop.row)
-            
-            # ATOMIC APPEND (Add to Free)
-            # We assume PLAYERS_FREE has 1 col usually: player_id. 
-            # But earlier code handled multiple key preservation? 
-            # Usually strict ID is enough.
-            ws_free.append_row([str(drop_pid)])
-            
-        else:
-            # Addition - Check Limit 
-            # We rely on the caller or pre-check. 
-            # But let's verify size LIVE to be safe?
-            # Doing a full read is expensive. We assume the UI pre-check was decent.
-            # If we want to be paranoid:
-            # all_team = ws_team.col_values(1) # Team IDs
-            # count = all_team.count(str(team_id))
-            # if count >= 18: ...
-            pass # Trusting the UI/Pre-load for limit check to save API calls, focusing on Race Cond of Pickup.
-
-        # --- PHASE 2: HANDLE PICKUP (Acquire Player) ---
-        # We found `cell_free` earlier. 
-        # But if the Drop phase took time, maybe `cell_free` row shifted?
-        # If we dropped a player from TEAM, FREE sheet was touched (appended). Append doesn't shift rows.
-        # So cell_free.row should be safe IF we didn't delete from Free yet.
-        
-        # DELETE from FREE
-        # Re-find to be ultra safe against row shifts from OTHER users?
-        # If High Concurrency: Yes.
-        cell_free_final = ws_free.find(str(pickup_pid))
-        if cell_free_final:
-            ws_free.delete_rows(cell_free_final.row)
-        else:
-            st.error("Erro Crítico: Jogador sumiu durante o processamento da troca.")
-            return False
-            
-        # APPEND to TEAM
-        # Get headers to know order? Or just append dict values?
-        # append_row takes list. 
-        # TEAM format: team_id, player_id...
-        ws_team.append_row([str(pickup_pid), str(team_id)])
-        
-        # --- PHASE 3: LOG ---
-        try:
-            ws_log = sh.worksheet("FREE_AGENCY")
-        except:
-            ws_log = sh.add_worksheet("FREE_AGENCY", 1000, 5)
-            ws_log.append_row(['rodada', 'team_id', 'added_id', 'dropped_id', 'timestamp'])
-            
+        # --- LOG ---
+        # Write-behind: the log line does not need to block the swap
         from datetime import datetime
-        ws_log.append_row([
-            rodada, 
-            str(team_id), 
-            str(pickup_pid), 
-            str(drop_pid) if not is_addition else "NENHUM", 
-            str(datetime.now())
-        ])
-             
+        enqueue_append(
+            "FREE_AGENCY",
+            [[rodada, str(team_id), str(pickup_pid),
+              str(drop_pid) if not is_addition else "NENHUM", str(datetime.now())]],
+            header=['rodada', 'team_id', 'added_id', 'dropped_id', 'timestamp'],
+        )
         return True
 
     except Exception as e:
-        st.error(f"Erro ao processar troca (Race Condition?): {e}")
+        st.error(f"Erro ao processar troca: {e}")
         return False
 
 import time
@@ -663,6 +389,7 @@ def app(is_admin=False):
             
             if st.button("Confirmar Visualização", type="secondary"):
                 try:
+                    flush("LEILAO_LANCES")  # include bids still in the write queue
                     client, sh = get_client()
                     ws_lances = sh.worksheet("LEILAO_LANCES")
                     vals = ws_lances.get_all_values()
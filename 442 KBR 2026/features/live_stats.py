@@ -5,6 +5,11 @@ import datetime
 import time
 import numpy as np
 from features.auth import get_client, BASE_DIR, get_players_file
+from features.sheet_cache import invalidate
+from features.sheet_upsert import upsert_blocks, upsert_changed_cells
+from features.scoring import score, GROUPS
+from features.calendar_utils import get_calendar, active_games
+from features.player_ids import player_keys
 import sys
 import subprocess
 
@@ -25,19 +30,25 @@ STATS_COLUMNS = [
     'shotOffTarget', 'onTargetScoringAttempt', 'hitWoodwork', 'goalsPrevented',
     'updated_at' 
 ]
+# Raw SofaScore statistics copied as-is (STATS_COLUMNS minus ids/derived/timestamp)
+STAT_FIELDS = [
+    'ownGoals', 'yellowCards', 'redCards', 'totalOffside', 
+    'dispossessed', 'penaltySave', 'penaltyWon', 
+    'penaltyConceded', 'penaltyMiss', 'totalPass', 'accuratePass', 
+    'totalLongBalls', 'accurateLongBalls', 'duelWon', 'duelLost', 
+    'wonContest', 'totalContest', 'keyPass', 'wasFouled', 'fouls',
+    'totalClearance', 'outfielderBlock', 'interceptionWon', 'wonTackle', 
+    'savedShotsFromInsideTheBox', 'saves', 'punches', 'goodHighClaim', 
+    'accurateKeeperSweeper', 'goals', 'goalAssist', 'goalLineClearance', 
+    'shotOffTarget', 'onTargetScoringAttempt', 'hitWoodwork', 'goalsPrevented'
+]
 
 # ... (Previous Cache functions same) ...
 
-def fetch_event_details(game_id):
+def fetch_event_details(game_id, final=False):
     """Fetches event details to get current score."""
     url = f"https://api.sofascore.com/api/v1/event/{game_id}"
-    try:
-        r = cffi_requests.get(url, impersonate="chrome120", timeout=15)
-        if r.status_code == 200:
-            return r.json()
-    except:
-        pass
-    return None
+    return sofascore_get_json_or_raise(url, final)
 
 def fetch_sofascore_lineups(game_id):
     # ... (Same as before) ...
@@ -100,76 +111,13 @@ def extract_stats(player_data, game_id, team_side, home_score, away_score):
 
 @st.cache_data(ttl=300, show_spinner=False)
 def get_active_games_cached():
-    """Finds games that started > 5 mins ago and haven't finished."""
+    """Finds games that kicked off less than 130 min ago (live window)."""
     try:
-        client, sh = get_client()
-        ws = sh.worksheet(GAMEWEEK_SHEET)
-        data = ws.get_all_records()
-        df = pd.DataFrame(data)
-        
-        if df.empty: 
-            # st.toast("⚠️ Planilha GAMEWEEK vazia ou não lida.", icon="📂")
-            return []
-            
-        # DEBUG COLUMNS
-        # st.info(f"Colunas encontradas: {list(df.columns)}")
-
-        # Convert to datetime (Assuming 'data_hora' is GMT-3 string or similar)
-        # Format usually: "YYYY-MM-DD HH:MM:SS"
-        now = datetime.datetime.now()
-        active_games = []
-        
-        # st.toast(f"🔍 Analisando {len(df)} linhas da planilha...")
-        
-        for _, row in df.iterrows():
-            try:
-                # ... (ID logic) ...
-                raw_id = str(row.get('id_jogo', '')).strip()
-                if not raw_id: continue
-
-                # Extract numeric ID logic (keep existing or simplified)
-                if 'id:' in raw_id: gid = raw_id.split('id:')[-1]
-                elif '/' in raw_id: gid = raw_id.split('/')[-1]
-                else: gid = raw_id
-                
-                if not gid.isdigit(): 
-                     # Handle complex URL cases
-                     if 'id:' in raw_id: gid = raw_id.split('id:')[-1]
-                     elif '/' in raw_id: gid = raw_id.split('/')[-1]
-                     # Fallback clean
-                     if not gid.isdigit(): gid = ''.join(filter(str.isdigit, gid))
-
-                dt_str = str(row.get('data_hora', ''))
-                
-                # Parsing
-                game_start = pd.to_datetime(dt_str, dayfirst=True, errors='coerce') 
-                
-                if pd.isna(game_start):
-                     # st.toast(...)
-                     continue
-                
-                diff = (now - game_start).total_seconds() / 60
-                
-                # FORCE DEBUG FOR TARGET ID
-                if '14773692' in str(gid):
-                    # st.toast(f"🎯 ALVO ENCONTRADO: {gid}. Data: {game_start}. Diff: {diff} min. (Janela: 0-200)", icon="🎯")
-                    pass
-                
-                if 0 < diff < 130: 
-                    # Return both RAW ID (for saving) and API ID (for fetching)
-                    active_games.append({'raw': raw_id, 'api': gid})
-                else:
-                    # Optional: Log future games? No, too spammy.
-                    pass 
-                    
-            except Exception as e:
-                continue
-                
-        return active_games
-
+        live = active_games(get_calendar())
+        # Return both RAW ID (for saving) and API ID (for fetching)
+        return [{'raw': raw, 'api': gid} for raw, gid in zip(live['raw_id'], live['simple_id'])]
     except Exception as e:
         # print(f"Error checking active games: {e}")
-        # st.toast(f"❌ Erro Crítico planilha GAMEWEEK: {e}", icon="💥")
         return []
 
 import uuid
@@ -321,30 +269,211 @@ def check_and_run_daily_sync():
         print(f"Error in Daily Sync Check: {e}")
 
 from curl_cffi import requests as cffi_requests # Rename to avoid conflict if any
-
-def fetch_sofascore_lineups(game_id):
-    url = f"https://api.sofascore.com/api/v1/event/{game_id}/lineups"
-    
-    # Headers can be minimal, the impersonate does the heavy lifting
+from curl_cffi import CurlHttpVersion, CurlInfo
+import threading
+import queue
+import os
+import json
+import hashlib
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+# --- HTTP / Concurrency ---
+FETCH_MAX_WORKERS = 8 # Max SofaScore requests in flight
+HOST_MIN_INTERVAL = 0.2 # Min seconds between two requests to the same host
+HTTP_TIMEOUT = 15
+
+_host_next_slot = {} # host -> earliest time the next request may start
+_host_lock = threading.Lock()
+
+def _throttle(url):
+    """Per-host rate limit: reserves the next free slot for the host and sleeps until it."""
+    host = urlparse(url).netloc
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_next_slot.get(host, 0.0))
+        _host_next_slot[host] = slot + HOST_MIN_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+# Pooled sessions: curl_cffi Sessions are not thread-safe, so a request checks out
+# a keep-alive Session (HTTP/2) from the pool and returns it afterwards.
+# Sessions outlive the fetch thread pools, so repeated polls keep their connections.
+_session_pool = queue.LifoQueue()
+_http_stats = {'requests': 0, 'new_connections': 0, 'reused_connections': 0, 'sessions': 0, 'errors': 0}
+_stats_lock = threading.Lock()
+
+def _count(**deltas):
+    with _stats_lock:
+        for k, v in deltas.items():
+            _http_stats[k] += v
+
+def _checkout_session():
+    """Takes an idle pooled Session (most recently used first) or creates one."""
+    try:
+        return _session_pool.get_nowait()
+    except queue.Empty:
+        _count(sessions=1)
+        return cffi_requests.Session(
+            impersonate="chrome120",
+            http_version=CurlHttpVersion.V2_0,
+            timeout=HTTP_TIMEOUT,
+        )
+
+def get_http_stats():
+    """Connection reuse counters for the SofaScore sessions."""
+    with _stats_lock:
+        return dict(_http_stats)
+
+def sofascore_get(url, headers=None):
+    """GET used by every SofaScore fetcher (rate limited, pooled session, browser TLS impersonation)."""
+    _throttle(url)
+    sess = _checkout_session()
+    try:
+        r = sess.get(url, headers=headers)
+        # NUM_CONNECTS = connections curl had to open for this transfer (0 = reused)
+        try:
+            new_conns = int(r.curl.getinfo(CurlInfo.NUM_CONNECTS))
+        except Exception:
+            new_conns = 0
+    except Exception:
+        # Broken connection: drop the session so the pool only keeps healthy ones
+        try: sess.close()
+        except Exception: pass
+        _count(requests=1, errors=1)
+        raise
+    _session_pool.put(sess)
     
+    if new_conns > 0:
+        _count(requests=1, new_connections=new_conns)
+    else:
+        _count(requests=1, reused_connections=1)
+    return r
+
+# --- On-disk response cache (ETag / Last-Modified) ---
+HTTP_CACHE_DIR = BASE_DIR / "Dados" / "http_cache"
+
+def _cache_path(url):
+    return HTTP_CACHE_DIR / (hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+
+def _cache_load(url):
     try:
-        # User impersonate="chrome120" or similar to mimic real browser TLS
-        r = cffi_requests.get(url, impersonate="chrome120", timeout=15)
-        
-        if r.status_code == 200:
-            return r.json()
-        elif r.status_code == 403:
-             # Try mobile version if desktop fails
-             print(f"DEBUG 403 on Desktop. Retrying...")
-        else:
-            print(f"DEBUG API FAIL: {game_id} -> Status {r.status_code}") 
-            # st.toast(f"Erro API: {r.status_code}", icon="❌")
-            return None
+        with open(_cache_path(url), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _cache_save(url, entry):
+    """Atomic write (tmp + replace) so concurrent fetch threads never read half a file."""
+    try:
+        HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _cache_path(url)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
     except Exception as e:
-        print(f"DEBUG API EXCEPTION: {e}")
-        # st.toast(f"Erro Conexão: {e}", icon="⚠️")
-        pass
-    return None
+        print(f"HTTP cache write failed ({url}): {e}")
+
+def get_finished_game_ids():
+    """API ids of games whose GAMEWEEK status is 'finished'."""
+    try:
+        games = get_calendar()['games']
+    except Exception:
+        return set()
+    if games.empty or 'status' not in games.columns:
+        return set()
+    finished = games[games['status'].astype(str).str.strip().str.lower() == 'finished']
+    return set(finished['simple_id'])
+
+def sofascore_get_json(url, final=False):
+    """
+    Cached JSON GET. Returns (status, data); data is None on failure.
+    final: the game is finished (per GAMEWEEK). Callers look it up once per
+    batch (get_finished_game_ids) so fetch threads never touch Streamlit caches.
+    - Entries saved after the game finished are served with no network call (status 0).
+    - Otherwise sends If-None-Match / If-Modified-Since and reuses the cached body on 304.
+    """
+    entry = _cache_load(url)
+    is_final = bool(final)
+    
+    if entry and entry.get('final'):
+        return 0, json.loads(entry['body'])
+    
+    headers = {}
+    if entry:
+        if entry.get('etag'): headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'): headers['If-Modified-Since'] = entry['last_modified']
+    
+    r = sofascore_get(url, headers=headers or None)
+    
+    if r.status_code == 304 and entry:
+        if is_final:
+            entry['final'] = True
+            _cache_save(url, entry)
+        return 304, json.loads(entry['body'])
+    
+    if r.status_code == 200:
+        _cache_save(url, {
+            'url': url,
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'final': is_final,
+            'saved_at': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'body': r.text,
+        })
+        return 200, r.json()
+    
+    return r.status_code, None
+
+class SofaScoreError(Exception):
+    """SofaScore answered without a usable body (403, 404, 5xx...)."""
+
+def sofascore_get_json_or_raise(url, final=False):
+    """sofascore_get_json for the fetchers: the data, or SofaScoreError / the network error."""
+    status, data = sofascore_get_json(url, final)
+    if data is None:
+        raise SofaScoreError(f"HTTP {status}")
+    return data
+
+def fetch_game_bundles(api_ids, max_workers=FETCH_MAX_WORKERS):
+    """
+    Fetches event details, lineups and comments for every game concurrently.
+    Returns {api_id: {'event': dict|None, 'lineups': dict|None, 'comments': dict|None, 'errors': {kind: str}}}.
+    A fetch that fails leaves its kind None and its error (HTTP status / exception) in 'errors'.
+    A round refreshes in about the time of the slowest game (bounded by max_workers / rate limit).
+    """
+    api_ids = list(dict.fromkeys(str(g) for g in api_ids))
+    if not api_ids: return {}
+    
+    # Looked up here, in the caller's thread, once for the whole batch
+    finished = get_finished_game_ids()
+    
+    fetchers = {
+        'event': fetch_event_details,
+        'lineups': fetch_sofascore_lineups,
+        'comments': fetch_game_comments,
+    }
+    bundles = {gid: dict({k: None for k in fetchers}, errors={}) for gid in api_ids}
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(api_ids) * len(fetchers)))) as pool:
+        futures = {
+            pool.submit(fn, gid, gid in finished): (gid, kind)
+            for gid in api_ids
+            for kind, fn in fetchers.items()
+        }
+        for fut, (gid, kind) in futures.items():
+            try:
+                bundles[gid][kind] = fut.result()
+            except Exception as e:
+                bundles[gid]['errors'][kind] = str(e)
+
+    return bundles
+
+def fetch_sofascore_lineups(game_id, final=False):
+    url = f"https://api.sofascore.com/api/v1/event/{game_id}/lineups"
+    # sofascore_get impersonates chrome120 to mimic real browser TLS
+    return sofascore_get_json_or_raise(url, final)
 
 @st.cache_data(ttl=3600)
 def get_player_pos_map():
@@ -357,13 +486,8 @@ def get_player_pos_map():
         
         df = pd.read_csv(f)
         
-        # Helper to extract ID
-        def extract_id(val):
-            s = str(val)
-            if '/' in s: return s.split('/')[-1]
-            return s
-            
-        df['pid'] = df['player_id'].apply(extract_id)
+        # Canonical int key -> str (same form as the SofaScore lineup ids)
+        df['pid'] = player_keys(df['player_id'].values).astype(str)
         
         # Map PT -> EN structure
         # GK->G, DEF->D, MEI->M, ATA->F
@@ -374,27 +498,18 @@ def get_player_pos_map():
             'ATA': 'F'
         }
         
-        # Create map
-        pmap = {}
-        for _, row in df.iterrows():
-            clean_pos = row['Posição'].strip().upper() if isinstance(row['Posição'], str) else ''
-            mapped = pos_map_dict.get(clean_pos, 'M') # Default to M if unknown
-            pmap[str(row['pid'])] = mapped
+        # Create map (Default to M if unknown)
+        clean_pos = df['Posição'].where(df['Posição'].map(type) == str, '').str.strip().str.upper()
+        pmap = dict(zip(df['pid'], clean_pos.map(pos_map_dict).fillna('M')))
             
         return pmap
     except Exception as e:
         print(f"Error loading player map: {e}")
         return {}
 
-def fetch_game_comments(game_id):
+def fetch_game_comments(game_id, final=False):
     url = f"https://api.sofascore.com/api/v1/event/{game_id}/comments"
-    try:
-        r = cffi_requests.get(url, impersonate="chrome120", timeout=15)
-        if r.status_code == 200:
-            return r.json()
-    except:
-        pass
-    return None
+    return sofascore_get_json_or_raise(url, final)
 
 def parse_cards_from_comments(comments_data):
     """
@@ -462,19 +577,7 @@ def extract_stats(player_data, game_id, team_side, home_score, away_score, pos_m
     }
     
     # Map requested fields
-    fields = [
-        'ownGoals', 'yellowCards', 'redCards', 'totalOffside', 
-        'dispossessed', 'penaltySave', 'penaltyWon', 
-        'penaltyConceded', 'penaltyMiss', 'totalPass', 'accuratePass', 
-        'totalLongBalls', 'accurateLongBalls', 'duelWon', 'duelLost', 
-        'wonContest', 'totalContest', 'keyPass', 'wasFouled', 'fouls',
-        'totalClearance', 'outfielderBlock', 'interceptionWon', 'wonTackle', 
-        'savedShotsFromInsideTheBox', 'saves', 'punches', 'goodHighClaim', 
-        'accurateKeeperSweeper', 'goals', 'goalAssist', 'goalLineClearance', 
-        'shotOffTarget', 'onTargetScoringAttempt', 'hitWoodwork', 'goalsPrevented'
-    ]
-    
-    for f in fields:
+    for f in STAT_FIELDS:
         row[f] = stats.get(f, 0)
     
     # 2. CARD OVERRIDE FROM COMMENTS
@@ -485,128 +588,84 @@ def extract_stats(player_data, game_id, team_side, home_score, away_score, pos_m
         
     return row
 
-def calculate_points(df):
-    """Calculates fantasy points based on Lucca's rules."""
-    if df.empty: return pd.DataFrame()
-    
-    # Ensure numeric types
-    cols = [
-        'rating', 'ownGoals', 'yellowCards', 'redCards', 'totalOffside',
-        'dispossessed', 'penaltyConceded', 'penaltyMiss', 'fouls',
-        'minutesPlayed', 'totalPass', 'accuratePass', 'totalLongBalls',
-        'accurateLongBalls', 'duelWon', 'duelLost', 'wonContest',
-        'totalContest', 'keyPass', 'penaltySave', 'penaltyWon',
-        'wasFouled', 'shotOffTarget', 'onTargetScoringAttempt', 'hitWoodwork',
-        'goals', 'totalClearance', 'outfielderBlock', 'interceptionWon',
-        'wonTackle', 'goalLineClearance', 'saves', 'savedShotsFromInsideTheBox',
-        'accurateKeeperSweeper', 'goalsPrevented', 'goalAssist', 'gols_sofridos_partida'
-    ]
-    for c in cols:
-        if c in df.columns:
-            df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-            
-    # Lucca's Logic
-    # 1. Nota (Rating)
-    cond_nota = [(df['rating']>=9), (df['rating']>=8), (df['rating']>=7), (df['rating']>=6.5), (df['rating']>=6), (df['rating']>=3)]
-    val_nota = [3, 2, 1, 0, -1, -2]
-    df['L_nota'] = np.select(cond_nota, val_nota, default=0)
-
-    # 2. Pontos Negativos
-    real_fouls = (df['fouls'] - df['penaltyConceded']).clip(lower=0)
-    df['L_negativos'] = (
-        (df['ownGoals'] * -2) + (df['yellowCards'] * -1) + (df['totalOffside'] * -0.25) +
-        (df['dispossessed'] * -0.25) + (df['penaltyConceded'] * -2) + 
-        (df['penaltyMiss'] * -3) + (real_fouls * -0.5)
-    )
-    
-    # 3. Cartão Vermelho
-    df['L_red'] = np.where(df['redCards'] > 0, -3, 0)
+def extract_lineup_stats(lineups, game_id, home_score, away_score, pos_map=None, card_map=None):
+    """
+    Batch version of extract_stats: turns a whole /lineups payload (home + away)
+    into one DataFrame with exactly STATS_COLUMNS, in one pass.
+    Position (pos_map) and card (card_map) overrides are applied as vectorized lookups.
+    """
+    players = []
+    sides = []
+    for side in ('home', 'away'):
+        side_players = (lineups or {}).get(side, {}).get('players', [])
+        players.extend(side_players)
+        sides.extend([side] * len(side_players))
+        
+    if not players:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+        
+    infos = [p.get('player', {}) for p in players]
+    pids = pd.Series([str(i.get('id', '')) for i in infos])
+    slugs = pd.Series([str(i.get('slug', '')) for i in infos])
     
-    # 4. Participação (> 75 min)
-    df['L_part'] = np.where(df['minutesPlayed'] > 75, 1, 0)
-
-    # 5. Bonus Stats
-    p_passe = np.where(df['totalPass']>0, df['accuratePass']/df['totalPass'], 0)
-    p_long = np.where(df['totalLongBalls']>0, df['accurateLongBalls']/df['totalLongBalls'], 0)
-    p_duel = np.where((df['duelWon']+df['duelLost'])>0, df['duelWon']/(df['duelWon']+df['duelLost']), 0)
-    p_drib = np.where(df['totalContest']>0, df['wonContest']/df['totalContest'], 0)
-
-    df['L_bonus'] = (
-        np.where((df['totalPass']>=40) & (p_passe>=0.90), 1, 0) +
-        np.where((df['accurateLongBalls']>=3) & (p_long>=0.60), 1, 0) +
-        np.where((df['duelWon']>=3) & (p_duel>=0.50), 1, 0) +
-        np.where((df['wonContest']>=3) & (p_drib>=0.60), 1, 0)
-    )
-
-    # 6. Ações Ofensivas
-    real_shot = (df['onTargetScoringAttempt'] - df['hitWoodwork'] - df['goals']).clip(lower=0)
-    df['L_acoes'] = (
-        (df['keyPass'] * 0.75) + (df['penaltySave'] * 5) + (df['penaltyWon'] * 2) +
-        (df['wasFouled'] * 0.5) + (df['shotOffTarget'] * 0.75) + 
-        (real_shot * 1.5) + (df['hitWoodwork'] * 3)
+    # Columnar stats block; missing stats -> 0
+    df = pd.DataFrame.from_records(
+        [p.get('statistics', {}) for p in players],
+        columns=STAT_FIELDS + ['rating', 'minutesPlayed']
     )
-
-    # 7. Defesa (Jogadores de Linha)
-    # Using 'Posição' column. Ensure it matches 'G', 'D', 'M', 'F'.
-    # SofaScore stats usually use 'G', 'D', 'M', 'F'.
-    df['L_def'] = np.where(df['Posição'] != 'G', 
-        (df['totalClearance']*0.1) + (df['outfielderBlock']*0.25) + 
-        (df['interceptionWon']*0.5) + (df['wonTackle']*0.75) + (df['goalLineClearance']*2), 0
-    )
-
-    # 8. Goleiro
-    saves_out = (df['saves'] - df['savedShotsFromInsideTheBox']).clip(lower=0)
-    df['L_gk'] = np.where(df['Posição'] == 'G',
-        (df['savedShotsFromInsideTheBox']*1.0) + (saves_out*0.5) + 
-        (df['accurateKeeperSweeper']*1) + (df['goalLineClearance']*2)+
-        (df['goalsPrevented']*2), 0
-    )
-
-    # 9. Posição (Gols + Assist + SG)
-    # Mapping logic via nice lookup
-    # Need to handle Apply vs Vectorized. Vectorized is faster/safer with np.select or map.
+    df = df.apply(pd.to_numeric, errors='coerce').fillna(0)
     
-    # Goal Points
-    # G:6, D:6, M:6, F:6 (Wait, user put 6 for F? Usually F is 4 or 5. But code says 6. Sticking to code.)
-    # Actually User Code: pos_L_G = {'G':6,'D':6,'M':6,'F':6}
-    # Assist Points
-    # pos_L_A = {'G':4,'D':4,'M':4,'F':4}
-    # SG Points
-    # pos_L_SG = {'G':4,'D':3,'M':0,'F':0}
-    
-    # Since all are constant across positions (except SG), we can simplify or use map.
-    # Goals = 6 pts for everyone
-    pts_goals = df['goals'] * 6
-    pts_assists = df['goalAssist'] * 4
+    # 1. POSITION OVERRIDE (Players.csv), API position as fallback
+    api_pos = pd.Series([i.get('position', 'M') for i in infos])
+    if pos_map:
+        df['Posição'] = pids.map(pos_map).fillna(api_pos)
+    else:
+        df['Posição'] = api_pos
+        
+    # 2. CARD OVERRIDE FROM COMMENTS
+    if card_map:
+        cards = pd.DataFrame.from_dict(card_map, orient='index')
+        yellow = pids.map(cards['yellow'])
+        red = pids.map(cards['red'])
+        df['yellowCards'] = yellow.fillna(df['yellowCards'])
+        df['redCards'] = red.fillna(df['redCards'])
+        
+    # Conceded = opponent's score
+    df['gols_sofridos_partida'] = np.where(pd.Series(sides) == 'home', away_score, home_score)
     
-    # SG
-    # SG apply only if clean sheet AND minutes > 0? User code: if (x['gols_sofridos_partida']==0 and x['minutesPlayed'] > 0)
-    has_sg = (df['gols_sofridos_partida'] == 0) & (df['minutesPlayed'] > 0)
-    sg_pts = np.select(
-        [
-            (df['Posição'] == 'G') & has_sg,
-            (df['Posição'] == 'D') & has_sg
-        ],
-        [4, 3],
-        default=0
-    )
+    df['game_id'] = game_id
+    df['player_id'] = "https://www.sofascore.com/football/player/" + slugs + "/" + pids
+    df['updated_at'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # Gols Sofridos (Defense only) - Only count if player played > 0 minutes
-    # np.where(df['Posição'].isin(['G','D']), df['gols_sofridos_partida']*-0.5, 0)
-    def_conceded = np.where(
-        (df['Posição'].isin(['G','D'])) & (df['minutesPlayed'] > 0), 
-        df['gols_sofridos_partida'] * -0.5, 
-        0
-    )
+    # Keep whole-number stats as ints (fillna/joins upcast to float: 90 -> "90.0" on the sheet)
+    num_cols = STAT_FIELDS + ['rating', 'minutesPlayed']
+    whole = (df[num_cols] % 1 == 0).all()
+    int_cols = whole[whole].index.tolist()
+    df[int_cols] = df[int_cols].astype('int64')
     
-    df['L_pos'] = pts_goals + pts_assists + sg_pts + def_conceded
+    return df[STATS_COLUMNS]
+
+def calculate_points(df):
+    """Calculates fantasy points based on Lucca's rules (see features/scoring.py)."""
+    if df.empty: return pd.DataFrame()
+
+    points = score(df)
+    for c in GROUPS + ['PONTUACAO_LUCCA_MATCH']:
+        df[c] = points[c]
 
-    df['PONTUACAO_LUCCA_MATCH'] = df[['L_nota','L_negativos','L_red','L_part','L_bonus','L_acoes','L_def','L_gk','L_pos']].sum(axis=1)
-    
     return df[['game_id', 'player_id', 'PONTUACAO_LUCCA_MATCH']]
 
-def save_stats_to_sheet(all_stats_rows):
-    if not all_stats_rows: return
+def save_stats_to_sheet(all_stats_rows, upsert=True):
+    """
+    Saves stats rows to PLAYERS_STATS, replacing the rows of the games being saved.
+    upsert=True: only the blocks of those game_ids are rewritten (cost ~ rows of the updated games).
+    upsert=False: legacy full read / clear / rewrite of the sheet.
+    all_stats_rows: list of row dicts or a DataFrame (e.g. from extract_lineup_stats).
+    Returns True on success, False if the write failed.
+    """
+    if isinstance(all_stats_rows, pd.DataFrame):
+        if all_stats_rows.empty: return True
+    elif not all_stats_rows: return True
     
     try:
         client, sh = get_client()
@@ -616,6 +675,22 @@ def save_stats_to_sheet(all_stats_rows):
             ws = sh.add_worksheet(STATS_SHEET, 1000, len(STATS_COLUMNS))
             ws.append_row(STATS_COLUMNS)
             
+        if upsert:
+            new_df = pd.DataFrame(all_stats_rows)
+            for c in STATS_COLUMNS:
+                if c not in new_df.columns: new_df[c] = ''
+            values = new_df[STATS_COLUMNS].astype(str).values.tolist()
+            
+            # Block per game_id (column A)
+            blocks = {}
+            for row in values:
+                blocks.setdefault((row[0],), []).append(row)
+                
+            res = upsert_blocks(ws, blocks, key_cols=[0])
+            print(f"PLAYERS_STATS upsert: {len(blocks)} games, {res}")
+            invalidate(STATS_SHEET)
+            return True
+            
         # OVERWRITE LOGIC:
         # 1. Get all existing records
         existing_data = ws.get_all_records()
@@ -648,14 +723,35 @@ def save_stats_to_sheet(all_stats_rows):
         
         ws.clear()
         ws.update('A1', final_values)
+        return True
         
     except Exception as e:
         print(f"Error saving stats (overwrite): {e}")
+        return False
 
 from features.utils import robust_to_float, format_br_decimal
 
-def save_points_to_sheet(points_df):
-    if points_df.empty: return
+def same_points(old, new):
+    """Comparator for PLAYER_POINTS cells (sheet value may be a number or a comma-decimal string)."""
+    return abs(robust_to_float(old) - robust_to_float(new)) < 1e-6
+
+def points_rows(points_df):
+    """points_df (game_id, player_id, PONTUACAO_LUCCA_MATCH|pontuacao) -> PLAYER_POINTS rows."""
+    df = points_df.rename(columns={'PONTUACAO_LUCCA_MATCH': 'pontuacao'})
+    return [
+        [str(g), str(p), format_br_decimal(robust_to_float(v))]
+        for g, p, v in zip(df['game_id'], df['player_id'], df['pontuacao'])
+    ]
+
+def save_points_to_sheet(points_df, upsert=True):
+    """
+    Saves player points for the games in points_df.
+    upsert=True: keyed by (game_id, player_id), only cells whose score changed are written
+    (one batched request), plus rows of players no longer in those games removed.
+    upsert=False: legacy full read / clear / rewrite of the sheet.
+    Returns True on success, False if the write failed.
+    """
+    if points_df.empty: return True
     try:
         client, sh = get_client()
         try:
@@ -664,6 +760,12 @@ def save_points_to_sheet(points_df):
             ws = sh.add_worksheet(POINTS_SHEET, 1000, 3)
             ws.append_row(['game_id', 'player_id', 'pontuacao'])
             
+        if upsert:
+            res = upsert_changed_cells(ws, points_rows(points_df), key_cols=[0, 1], scope_col=0, equal=same_points)
+            print(f"PLAYER_POINTS upsert: {res}")
+            invalidate(POINTS_SHEET)
+            return True
+            
         # OVERWRITE LOGIC (Same pattern)
         existing_data = ws.get_all_records()
         existing_df = pd.DataFrame(existing_data)
@@ -702,10 +804,64 @@ def save_points_to_sheet(points_df):
         ws.update('A1', final_values, value_input_option='USER_ENTERED')
 
         # st.toast(f"Pontos salvos na aba '{POINTS_SHEET}': {len(final_df)} registros.", icon="✅")
+        return True
 
     except Exception as e:
         print(f"Error saving points (overwrite): {e}")
         # st.toast(f"Erro ao salvar Pontos: {e}", icon="🚩")
+        return False
+
+# --- Change detection ---
+GAME_HASHES_FILE = BASE_DIR / "Dados" / "game_hashes.json"
+
+def compute_game_hash(lineups, home_score, away_score, card_map):
+    """Content hash of everything that feeds extract_stats / calculate_points for one game."""
+    payload = {
+        'lineups': lineups,
+        'score': [home_score, away_score],
+        'cards': card_map,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def load_game_hashes():
+    """{raw game_id: hash} of the last payload successfully scored and saved."""
+    try:
+        with open(GAME_HASHES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_game_hashes(hashes):
+    try:
+        GAME_HASHES_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = GAME_HASHES_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(hashes, f, indent=1, sort_keys=True)
+        os.replace(tmp, GAME_HASHES_FILE)
+    except Exception as e:
+        print(f"Error saving game hashes: {e}")
+
+FINISHED_STATE_FILE = BASE_DIR / "Dados" / "finished_state.json"
+
+def load_finished_state():
+    """{'games': [simple_id, ...], 'rounds': [rodada, ...]} already finished at the last successful run."""
+    try:
+        with open(FINISHED_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return {'games': state.get('games', []), 'rounds': state.get('rounds', [])}
+    except Exception:
+        return {'games': [], 'rounds': []}
+
+def save_finished_state(games, rounds):
+    try:
+        FINISHED_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = FINISHED_STATE_FILE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({'games': sorted(games), 'rounds': sorted(int(r) for r in rounds)}, f, indent=1)
+        os.replace(tmp, FINISHED_STATE_FILE)
+    except Exception as e:
+        print(f"Error saving finished state: {e}")
 
 def run_auto_update(force=False):
     """Main entry point called by Players.py - DISABLED PER USER REQUEST"""
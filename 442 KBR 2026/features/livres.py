@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from features.auth import get_client, get_players_file
+from features.auth import get_players_file
+from features.sheet_cache import get_sheet_df
 
 POS_MAPPING = {
     'Goalkeeper': 'GK',
@@ -27,11 +28,7 @@ def load_data():
 
     # 2. Load PLAYERS_FREE from Sheets (Availability)
     try:
-        client, sh = get_client()
-        
-        ws_free = sh.worksheet("PLAYERS_FREE")
-        data_free = ws_free.get_all_records()
-        df_free_ids = pd.DataFrame(data_free)
+        df_free_ids = get_sheet_df("PLAYERS_FREE")
         if not df_free_ids.empty:
             df_free_ids.columns = df_free_ids.columns.str.lower()
             df_free_ids['player_id'] = df_free_ids['player_id'].astype(str)
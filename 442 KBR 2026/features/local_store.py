@@ -0,0 +1,361 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+import gspread
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, numericise_all
+from features.auth import BASE_DIR
+
+# Local embedded backend for the league data (SQLite, stdlib only).
+# LocalSpreadsheet / LocalWorksheet implement the subset of the gspread API this
+# app uses, so every read and write path runs unchanged against it when
+# KBR_STORAGE=sqlite (see auth.get_client). Each call is a transaction
+# (BEGIN IMMEDIATE, so concurrent processes serialize); several calls can be
+# grouped with `with sh.transaction():` to commit or roll back together.
+# Google Sheets becomes an export target: import_from_sheets / export_to_sheets.
+#
+# Cells are stored as their displayed strings (what get_values() returns from
+# Sheets); get_all_records() and UNFORMATTED_VALUE reads numericise them.
+
+DB_FILE = BASE_DIR / "Dados" / "league.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    name TEXT PRIMARY KEY,
+    id INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    col_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cells (
+    sheet TEXT NOT NULL,
+    r INTEGER NOT NULL,
+    vals TEXT NOT NULL,
+    PRIMARY KEY (sheet, r)
+) WITHOUT ROWID;
+"""
+
+def _cell(v):
+    """Python value -> stored (displayed) string."""
+    if v is None: return ''
+    if hasattr(v, 'item'): v = v.item()  # numpy scalars
+    if isinstance(v, bool): return 'TRUE' if v else 'FALSE'
+    if isinstance(v, float):
+        return str(int(v)) if v.is_integer() else repr(v)
+    return str(v)
+
+def _trim(row):
+    row = list(row)
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+class LocalSpreadsheet:
+    def __init__(self, path=DB_FILE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    def _q(self, sql, args=()):
+        """Read query (serialized with writers of this process)."""
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    @contextmanager
+    def transaction(self):
+        """Groups calls into one atomic write (nestable)."""
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self._conn
+            except Exception:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._conn.execute("COMMIT")
+
+    # --- gspread Spreadsheet API subset ---
+
+    def worksheet(self, title):
+        if not self._q("SELECT name FROM sheets WHERE name = ?", (title,)):
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return LocalWorksheet(self, title)
+
+    def worksheets(self):
+        return [LocalWorksheet(self, n) for (n,) in self._q("SELECT name FROM sheets ORDER BY id")]
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        with self.transaction() as c:
+            next_id = c.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sheets").fetchone()[0]
+            c.execute("INSERT OR IGNORE INTO sheets VALUES (?, ?, ?, ?)", (title, next_id, int(rows), int(cols)))
+        return LocalWorksheet(self, title)
+
+    def values_batch_get(self, ranges, params=None):
+        out = []
+        for rng in ranges:
+            name, _, a1 = rng.partition('!')
+            name = name.strip("'").replace("''", "'")
+            values = self.worksheet(name).get_values(a1 or None)
+            out.append({'range': rng, 'values': values})
+        return {'valueRanges': out}
+
+    def values_batch_update(self, body):
+        """Writes every {'range': "'Sheet'!A1", 'values': [...]} of body['data'] in one transaction."""
+        with self.transaction():
+            for d in body.get('data', []):
+                name, _, a1 = d['range'].partition('!')
+                name = name.strip("'").replace("''", "'")
+                r1, c1 = a1_to_rowcol((a1 or 'A1').split(':')[0])
+                self.worksheet(name)._write_block(r1, c1 - 1, d['values'])
+        return {}
+
+    def batch_update(self, body):
+        """
+        Spreadsheet-level batchUpdate. The app only sends deleteDimension (ROWS)
+        requests (sheet_upsert.delete_sheet_rows), which is all this supports.
+        Raises ValueError for any other request type, before anything is written.
+        """
+        by_id = {i: n for n, i in self._q("SELECT name, id FROM sheets")}
+        requests = body.get('requests', [])
+        for req in requests:
+            dd = req.get('deleteDimension')
+            if not dd or dd['range'].get('dimension') != 'ROWS':
+                raise ValueError(f"unsupported batch_update request {list(req)} (local backend supports deleteDimension ROWS only)")
+        with self.transaction():
+            for req in requests:
+                dd = req['deleteDimension']
+                rng = dd['range']
+                LocalWorksheet(self, by_id[rng['sheetId']]).delete_rows(rng['startIndex'] + 1, rng['endIndex'])
+        return {}
+
+class LocalWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    def _q(self, sql, args=()):
+        return self.spreadsheet._q(sql, args)
+
+    @property
+    def id(self):
+        return self._q("SELECT id FROM sheets WHERE name = ?", (self.title,))[0][0]
+
+    @property
+    def row_count(self):
+        rc = self._q("SELECT row_count FROM sheets WHERE name = ?", (self.title,))[0][0]
+        return max(rc, self._last_row())
+
+    @property
+    def col_count(self):
+        return self._q("SELECT col_count FROM sheets WHERE name = ?", (self.title,))[0][0]
+
+    def _last_row(self):
+        return self._q("SELECT COALESCE(MAX(r), 0) FROM cells WHERE sheet = ?", (self.title,))[0][0]
+
+    def _rows(self, r1=1, r2=None):
+        """{r: [values]} for rows r1..r2 (inclusive)."""
+        q = "SELECT r, vals FROM cells WHERE sheet = ? AND r >= ?"
+        args = [self.title, r1]
+        if r2 is not None:
+            q += " AND r <= ?"
+            args.append(r2)
+        return {r: json.loads(v) for r, v in self._q(q, args)}
+
+    def _put(self, r, row):
+        row = _trim(row)
+        if row:
+            self._q("INSERT OR REPLACE INTO cells VALUES (?, ?, ?)", (self.title, r, json.dumps(row)))
+        else:
+            self._q("DELETE FROM cells WHERE sheet = ? AND r = ?", (self.title, r))
+
+    # --- reads ---
+
+    def get_values(self, range_name=None, value_render_option=None, **kwargs):
+        if range_name:
+            g = a1_range_to_grid_range(range_name)
+        else:
+            g = {}
+        r1 = g.get('startRowIndex', 0) + 1
+        r2 = g.get('endRowIndex')
+        c1 = g.get('startColumnIndex', 0)
+        c2 = g.get('endColumnIndex')
+
+        rows = self._rows(r1, r2)
+        last = max(rows) if rows else r1 - 1
+        grid = []
+        for r in range(r1, last + 1):
+            row = rows.get(r, [])[c1:c2]
+            grid.append(numericise_all(row) if value_render_option == 'UNFORMATTED_VALUE' else row)
+        while grid and not grid[-1]:
+            grid.pop()
+        return grid
+
+    get_all_values = get_values
+
+    def get_all_records(self, head=1, default_blank='', **kwargs):
+        values = self.get_values()
+        if len(values) < head:
+            return []
+        keys = values[head - 1]
+        out = []
+        for row in values[head:]:
+            row = numericise_all(list(row[:len(keys)]) + [default_blank] * (len(keys) - len(row)))
+            out.append(dict(zip(keys, row)))
+        return out
+
+    def batch_get(self, ranges, **kwargs):
+        return [self.get_values(r) for r in ranges]
+
+    def row_values(self, row, **kwargs):
+        return self._rows(row, row).get(row, [])
+
+    def col_values(self, col, **kwargs):
+        col_idx = col - 1
+        rows = self._rows()
+        last = max(rows) if rows else 0
+        out = [rows.get(r, [])[col_idx] if col_idx < len(rows.get(r, [])) else '' for r in range(1, last + 1)]
+        return _trim(out)
+
+    def acell(self, label, **kwargs):
+        r, c = a1_to_rowcol(label)
+        row = self.row_values(r)
+        return Cell(r, c, row[c - 1] if c - 1 < len(row) else '')
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        q = str(query)
+        for r, row in sorted(self._rows().items()):
+            if in_row is not None and r != in_row: continue
+            for c, v in enumerate(row, start=1):
+                if in_column is not None and c != in_column: continue
+                if (v == q) if case_sensitive else (v.lower() == q.lower()):
+                    return Cell(r, c, v)
+        return None
+
+    # --- writes ---
+
+    def _write_block(self, r1, c1, values):
+        rows = self._rows(r1, r1 + len(values) - 1)
+        for i, new in enumerate(values):
+            r = r1 + i
+            row = rows.get(r, [])
+            end = c1 + len(new)
+            row = row + [''] * max(end - len(row), 0)
+            row[c1:end] = [_cell(v) for v in new]
+            self._put(r, row)
+
+    def update(self, values=None, range_name=None, value_input_option=None, **kwargs):
+        if isinstance(values, str):  # legacy update('A1', values) order
+            values, range_name = range_name, values
+        r1, c1 = a1_to_rowcol((range_name or 'A1').split(':')[0])
+        with self.spreadsheet.transaction():
+            self._write_block(r1, c1 - 1, values)
+        return {}
+
+    def update_acell(self, label, value):
+        return self.update([[value]], label)
+
+    def batch_update(self, data, value_input_option=None, **kwargs):
+        with self.spreadsheet.transaction():
+            for d in data:
+                r1, c1 = a1_to_rowcol(d['range'].split('!')[-1].split(':')[0])
+                self._write_block(r1, c1 - 1, d['values'])
+        return {}
+
+    def append_rows(self, values, value_input_option=None, insert_data_option=None, table_range=None, **kwargs):
+        with self.spreadsheet.transaction():
+            start = self._last_row() + 1
+            for i, row in enumerate(values):
+                self._put(start + i, [_cell(v) for v in row])
+        return {}
+
+    def append_row(self, values, value_input_option=None, insert_data_option=None, table_range=None, **kwargs):
+        return self.append_rows([values], value_input_option, insert_data_option, table_range)
+
+    def add_rows(self, rows):
+        with self.spreadsheet.transaction() as c:
+            c.execute("UPDATE sheets SET row_count = ? WHERE name = ?", (self.row_count + int(rows), self.title))
+
+    def add_cols(self, cols):
+        with self.spreadsheet.transaction() as c:
+            c.execute("UPDATE sheets SET col_count = ? WHERE name = ?", (self.col_count + int(cols), self.title))
+
+    def delete_rows(self, start_index, end_index=None):
+        end_index = end_index or start_index
+        n = end_index - start_index + 1
+        with self.spreadsheet.transaction() as c:
+            c.execute("DELETE FROM cells WHERE sheet = ? AND r BETWEEN ? AND ?", (self.title, start_index, end_index))
+            # Shift up in two steps so the primary key never collides mid-update
+            c.execute("UPDATE cells SET r = -(r - ?) WHERE sheet = ? AND r > ?", (n, self.title, end_index))
+            c.execute("UPDATE cells SET r = -r WHERE sheet = ? AND r < 0", (self.title,))
+
+    def clear(self):
+        with self.spreadsheet.transaction() as c:
+            c.execute("DELETE FROM cells WHERE sheet = ?", (self.title,))
+
+    def replace_values(self, values):
+        """Whole-sheet replace in one transaction (import/export helper)."""
+        with self.spreadsheet.transaction():
+            self.clear()
+            for i, row in enumerate(values, start=1):
+                self._put(i, [_cell(v) for v in row])
+
+_local = None
+_local_lock = threading.Lock()
+
+def get_local_spreadsheet():
+    global _local
+    with _local_lock:
+        if _local is None:
+            _local = LocalSpreadsheet()
+        return _local
+
+def import_from_sheets(names=None):
+    """Copies worksheets (all if names is None) from Google Sheets into the local DB."""
+    from features.auth import get_sheets_client
+    client, remote = get_sheets_client()
+    local = get_local_spreadsheet()
+    for ws in remote.worksheets():
+        if names is not None and ws.title not in names: continue
+        values = ws.get_values()
+        try:
+            local_ws = local.worksheet(ws.title)
+        except gspread.exceptions.WorksheetNotFound:
+            local_ws = local.add_worksheet(ws.title, ws.row_count, ws.col_count)
+        local_ws.replace_values(values)
+        print(f"Imported {ws.title}: {len(values)} rows")
+
+def export_to_sheets(names=None):
+    """Pushes local worksheets (all if names is None) to Google Sheets (clear + rewrite)."""
+    from features.auth import get_sheets_client
+    client, remote = get_sheets_client()
+    local = get_local_spreadsheet()
+    for ws in local.worksheets():
+        if names is not None and ws.title not in names: continue
+        values = ws.get_values()
+        try:
+            remote_ws = remote.worksheet(ws.title)
+        except gspread.exceptions.WorksheetNotFound:
+            remote_ws = remote.add_worksheet(ws.title, max(len(values), 100), 26)
+        remote_ws.clear()
+        if values:
+            remote_ws.update(values=values, range_name='A1', value_input_option='USER_ENTERED')
+        print(f"Exported {ws.title}: {len(values)} rows")
+
+if __name__ == "__main__":
+    import sys
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    names = sys.argv[2:] or None
+    if cmd == 'import':
+        import_from_sheets(names)
+    elif cmd == 'export':
+        export_to_sheets(names)
+    else:
+        print("Usage: python -m features.local_store import|export [SHEET ...]")
@@ -1,20 +1,17 @@
 import streamlit as st
 import pandas as pd
-from features.auth import get_client, get_players_file
+import time
+from features.auth import get_players_file
+from features.sheet_cache import get_sheet_df
 from features.pontuacao import render_player_row, load_data_v2, load_live_data, clean_pos
+from features.calendar_utils import get_calendar
 
 # Reuse data loading structure from pontuacao, but we need TEAM_POINTS too
 @st.cache_data(ttl=60) 
 def load_matchup_data():
-    client, sh = get_client()
     try:
-        ws = sh.worksheet("H2H - TEAM_POINTS")
-        # Use get_values to preserve comma-decimal strings
-        raw_values = ws.get_values()
-        if raw_values and len(raw_values) > 1:
-            df_tp = pd.DataFrame(raw_values[1:], columns=raw_values[0])
-        else:
-            df_tp = pd.DataFrame()
+        # Read raw by the cache to preserve comma-decimal strings
+        df_tp = get_sheet_df("H2H - TEAM_POINTS")
         
         # Normalize
         if not df_tp.empty:
@@ -51,15 +48,13 @@ def app():
     
     # Determine default index (Round closest to today)
     default_idx = 0
-    if all_rounds and 'data_hora' in df_gw.columns and not df_gw.empty:
+    if all_rounds and not df_gw.empty:
         try:
-            now = pd.Timestamp.now()
-            # Convert GW dates
-            df_gw['dt'] = pd.to_datetime(df_gw['data_hora'], dayfirst=True, errors='coerce')
+            games = get_calendar()['games']
             # Find future or active games
-            future = df_gw[df_gw['dt'] >= (now - pd.Timedelta(days=2))] # Include recent past
+            future = games[games['start_ts'] >= time.time() - 2 * 86400].dropna(subset=['rodada']) # Include recent past
             if not future.empty:
-                next_round = future.sort_values('dt').iloc[0]['rodada']
+                next_round = int(future.sort_values('start_ts').iloc[0]['rodada'])
                 if next_round in all_rounds:
                     default_idx = all_rounds.index(next_round)
             else:
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# Canonical player key.
+# Player IDs show up as SofaScore URLs (".../player/{slug}/{id}"), "slug/id",
+# "id:123", plain "123" or numericised 123 / 123.0 depending on the sheet/CSV.
+# All of them are interned to the numeric SofaScore id as int64 at load time,
+# so joins/isin filters compare ints instead of long strings.
+# Forms without a numeric id get their own negative key, so they never collide.
+# The original player_id column is kept for display and sheet writes.
+
+_registry = {}  # raw string form -> int64 key (shared by every load in the process)
+_local_keys = {}  # normalized non-numeric form -> negative key
+
+def _parse(raw):
+    s = raw.strip()
+    if s.endswith('.0'):
+        s = s[:-2]
+    s = s.rstrip('/')
+    if 'id:' in s: s = s.split('id:')[-1]
+    elif '/' in s: s = s.split('/')[-1]
+    if s.isdigit():
+        return int(s)
+    if s not in _local_keys:
+        _local_keys[s] = -(len(_local_keys) + 1)
+    return _local_keys[s]
+
+def player_key(value):
+    """Any player id form -> int key (negative if it has no numeric id)."""
+    raw = str(value)
+    key = _registry.get(raw)
+    if key is None:
+        key = _parse(raw)
+        _registry[raw] = key
+    return key
+
+def player_keys(values):
+    """
+    Vectorized player_key: interns the distinct forms once and maps codes back.
+    Returns an int64 numpy array aligned with values.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).astype(str))
+    lookup = np.fromiter((player_key(u) for u in uniques), dtype=np.int64, count=len(uniques))
+    return lookup[codes] if len(codes) else np.empty(0, dtype=np.int64)
+
+def add_player_key(df, col='player_id', key='pid'):
+    """Adds the int64 key column (in place) and returns df."""
+    if col in df.columns:
+        df[key] = player_keys(df[col].values)
+    return df
@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
-from features.auth import get_client, get_players_file
+from features.auth import get_players_file
+from features.sheet_cache import get_sheet_dfs
 from features.utils import robust_to_float
+from features.calendar_utils import get_calendar, last_started_round, parse_game_id
+from features.player_ids import add_player_key
 
 @st.cache_data(ttl=60) # Cache Static Data for 1 Minute
 def load_data_v2():
@@ -9,15 +12,16 @@ def load_data_v2():
     if players_file.exists():
         df_players = pd.read_csv(players_file)
         df_players['player_id'] = df_players['player_id'].astype(str)
+        add_player_key(df_players)
     else:
         df_players = pd.DataFrame()
 
     try:
-        client, sh = get_client()
+        # One batched request for every static sheet (missing sheets come back empty)
+        sheets = get_sheet_dfs(["GAMEWEEK", "H2H - ROUNDS", "TEAM_LINEUP", "SQUAD", "H2H - TABLE"])
 
         # Load GAMEWEEK (Matches)
-        ws_gw = sh.worksheet("GAMEWEEK")
-        df_gw = pd.DataFrame(ws_gw.get_all_records())
+        df_gw = sheets["GAMEWEEK"]
         if not df_gw.empty:
             df_gw.columns = df_gw.columns.str.lower()
             if 'rodada' in df_gw.columns:
@@ -25,8 +29,7 @@ def load_data_v2():
 
         # Load H2H - ROUNDS
         try:
-             ws_h2h = sh.worksheet("H2H - ROUNDS")
-             df_h2h = pd.DataFrame(ws_h2h.get_all_records())
+             df_h2h = sheets["H2H - ROUNDS"]
              if not df_h2h.empty:
                  df_h2h.columns = df_h2h.columns.str.lower()
                  if 'rodada' in df_h2h.columns:
@@ -36,8 +39,7 @@ def load_data_v2():
 
         # Load TEAM_LINEUP (Who played)
         try:
-             ws_lineup = sh.worksheet("TEAM_LINEUP")
-             df_lineup = pd.DataFrame(ws_lineup.get_all_records())
+             df_lineup = sheets["TEAM_LINEUP"]
              if not df_lineup.empty:
                  df_lineup.columns = df_lineup.columns.str.lower()
                  df_lineup['player_id'] = df_lineup['player_id'].astype(str)
@@ -49,8 +51,7 @@ def load_data_v2():
 
         # Load SQUAD (for Team Names)
         try:
-            ws_squad = sh.worksheet("SQUAD")
-            df_squad = pd.DataFrame(ws_squad.get_all_records())
+            df_squad = sheets["SQUAD"]
             if not df_squad.empty:
                 df_squad.columns = df_squad.columns.str.lower()
                 id_col = next((c for c in df_squad.columns if c in ['team_id', 'id']), 'team_id')
@@ -61,12 +62,10 @@ def load_data_v2():
         # Load H2H - TABLE
         # Load H2H - TABLE
         try:
-             ws_table = sh.worksheet("H2H - TABLE")
-             # Use get_all_values to fetch RAW strings and avoid gspread auto-numericising "87,57" as 8757
-             raw_data = ws_table.get_all_values()
+             # Read raw by the cache to avoid gspread auto-numericising "87,57" as 8757
+             df_table = sheets["H2H - TABLE"]
              
-             if raw_data and len(raw_data) > 1:
-                 df_table = pd.DataFrame(raw_data[1:], columns=raw_data[0])
+             if not df_table.empty:
                  df_table.columns = df_table.columns.str.lower()
                  
                  # Clean Numerics (Brazilian Format: 12,34 -> 12.34)
@@ -95,19 +94,15 @@ def load_live_data(_client=None, _sh=None):
     # Pass client/sh or get new? Getting new ensures freshness if auth expires, but costly.
     # Auth get_client caches itself usually.
     try:
-        client, sh = get_client()
-        
-        # Load PLAYER_POINTS - use get_values to preserve comma-decimal strings
+        sheets = get_sheet_dfs(["PLAYER_POINTS", "PLAYERS_STATS"])
+
+        # Load PLAYER_POINTS - read raw by the cache to preserve comma-decimal strings
         try:
-             ws_pts = sh.worksheet("PLAYER_POINTS")
-             pts_values = ws_pts.get_values()
-             if pts_values and len(pts_values) > 1:
-                 df_pts = pd.DataFrame(pts_values[1:], columns=pts_values[0])
-             else:
-                 df_pts = pd.DataFrame()
+             df_pts = sheets["PLAYER_POINTS"]
              if not df_pts.empty:
                  df_pts['player_id'] = df_pts['player_id'].astype(str)
                  df_pts['game_id'] = df_pts['game_id'].astype(str)
+                 add_player_key(df_pts)
                  # Parse pontuacao from comma-decimal string
                  df_pts['pontuacao'] = df_pts['pontuacao'].apply(robust_to_float)
         except:
@@ -115,8 +110,7 @@ def load_live_data(_client=None, _sh=None):
 
         # Load PLAYER_STATS
         try:
-             ws_stats = sh.worksheet("PLAYERS_STATS")
-             df_stats = pd.DataFrame(ws_stats.get_all_records())
+             df_stats = sheets["PLAYERS_STATS"]
              if not df_stats.empty:
                   df_stats['player_id'] = df_stats['player_id'].astype(str)
                   df_stats['game_id'] = df_stats['game_id'].astype(str)
@@ -378,25 +372,18 @@ def app():
     # --- FILTERS ---
     c1, c2, c3 = st.columns([1, 2, 2])
     
-    import datetime
-    
     with c1:
         # Standardize Rodada to Int
         all_rounds = sorted(df_gw['rodada'].unique()) if 'rodada' in df_gw.columns else []
         
         # Determine Default Round (Latest started round)
         default_idx = 0
-        if all_rounds and 'data_hora' in df_gw.columns:
+        if all_rounds:
             try:
-                # Convert to datetime for comparison
-                df_gw['dt_obj'] = pd.to_datetime(df_gw['data_hora'], dayfirst=True, errors='coerce')
-                now = datetime.datetime.now()
-                # Find max round where at least one game has started
-                started_rounds = df_gw[df_gw['dt_obj'] <= now]['rodada'].unique()
-                if len(started_rounds) > 0:
-                    last_started = max(started_rounds)
-                    if last_started in all_rounds:
-                         default_idx = all_rounds.index(last_started)
+                # Max round where at least one game has started
+                last_started = last_started_round(get_calendar())
+                if last_started is not None and last_started in all_rounds:
+                     default_idx = all_rounds.index(last_started)
             except Exception as e:
                 pass
 
@@ -451,9 +438,7 @@ def app():
                 # Prepare Round Stats for full details
                 r_games = df_gw[df_gw['rodada'] == sel_round]
                 gids_full = r_games['id_jogo'].astype(str).tolist()
-                gids_simple = []
-                for x in gids_full:
-                    if "id:" in x: gids_simple.append(x.split("id:")[-1])
+                gids_simple = [parse_game_id(x) for x in gids_full]
                 
                 valid_gids = set(gids_full) | set(gids_simple)
 
@@ -638,12 +623,7 @@ def app():
         # This behavior is consistent.
         
         round_game_ids_full = round_matches['id_jogo'].astype(str).tolist()
-        round_game_ids_simple = []
-        for raw in round_game_ids_full:
-            try:
-                 if "id:" in raw: round_game_ids_simple.append(raw.split("id:")[-1])
-                 else: round_game_ids_simple.append(raw)
-            except: pass
+        round_game_ids_simple = [parse_game_id(raw) for raw in round_game_ids_full]
 
         # 2. Filter df_pts
         mask_pts = (df_pts['game_id'].astype(str).isin(round_game_ids_full)) | \
@@ -653,8 +633,7 @@ def app():
 
         if not round_pts.empty:
             # 3. Merge with Player Details
-            round_pts['player_id'] = round_pts['player_id'].astype(str)
-            merged = round_pts.merge(df_players[['player_id', 'Nome', 'Team', 'Posição']], on='player_id', how='left')
+            merged = round_pts.merge(df_players[['pid', 'Nome', 'Team', 'Posição']], on='pid', how='left')
             
             # Apply Position Filter
             merged['CleanPos'] = merged['Posição'].apply(clean_pos)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+from collections import Counter
+from contextlib import nullcontext
+from gspread.utils import rowcol_to_a1
+from features.auth import get_client
+from features.sheet_cache import invalidate
+
+# Indexed snapshot of the roster sheets (TEAM, SQUAD, PLAYERS_FREE) with
+# optimistic-concurrency commits.
+# A transaction reads the sheets in one values_batch_get, builds hash indexes
+# (player -> owner, team -> budget, free set, team -> roster size), lets the
+# caller apply its moves against them, and writes only the changed cells in one
+# values_batch_update. Right before writing, the sheets are read again: if any
+# of them changed since the snapshot (fingerprint mismatch), nothing is written
+# and the transaction reruns on a fresh snapshot.
+# Rows are never deleted (a moved player is rewritten in place, a removed
+# free-agent row is filled with the last row), so concurrent writers cannot
+# shift the rows a commit points to.
+# On the SQLite backend the check and the write run inside one DB transaction.
+
+ROSTER_SHEETS = ["TEAM", "SQUAD", "PLAYERS_FREE"]
+MAX_ATTEMPTS = 3
+
+DEFAULT_HEADERS = {
+    "TEAM": ["team_id", "player_id"],
+    "PLAYERS_FREE": ["player_id"],
+}
+
+class ConflictError(Exception):
+    """The sheets kept changing underneath the transaction."""
+
+def _quote(name):
+    return "'" + name.replace("'", "''") + "'"
+
+def _trim_grid(values):
+    grid = [list(r) for r in values]
+    while grid and not any(str(v).strip() for v in grid[-1]):
+        grid.pop()
+    return grid
+
+def _fingerprint(grid):
+    return hashlib.sha1(json.dumps(grid, ensure_ascii=False, default=str).encode()).hexdigest()
+
+def norm_id(v):
+    s = str(v).strip()
+    return s[:-2] if s.endswith('.0') else s
+
+def _money(v):
+    try:
+        return float(str(v).replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+class RosterSnapshot:
+    def __init__(self, grids):
+        self.grids = {n: _trim_grid(g) for n, g in grids.items()}
+        self.versions = {n: _fingerprint(g) for n, g in self.grids.items()}
+        self.cells = {}  # (sheet, row, col) -> value, 1-based; the pending writes
+        self.rows_before = {n: len(g) for n, g in self.grids.items()}
+        for n, header in DEFAULT_HEADERS.items():
+            if n in self.grids and not self.grids[n]:
+                for c, h in enumerate(header, start=1):
+                    self.write(n, 1, c, h)
+        self.cols = {n: {str(h).strip().lower(): i for i, h in enumerate(g[0])} if g else {}
+                     for n, g in self.grids.items()}
+        self._index()
+
+    def _get(self, sheet, r, col):
+        row = self.grids[sheet][r - 1]
+        return row[col] if col < len(row) else ''
+
+    def _index(self):
+        self.owner = {}  # pid -> tid
+        self.team_row = {}  # pid -> TEAM row
+        self.roster = Counter()  # tid -> players
+        if "TEAM" in self.grids:
+            tc, pc = self.cols["TEAM"].get('team_id'), self.cols["TEAM"].get('player_id')
+            for r in range(2, len(self.grids["TEAM"]) + 1):
+                tid, pid = norm_id(self._get("TEAM", r, tc)), norm_id(self._get("TEAM", r, pc))
+                if pid:
+                    self.owner[pid] = tid
+                    self.team_row[pid] = r
+                    self.roster[tid] += 1
+
+        self.budgets = {}  # tid -> caixa
+        self.squad_row = {}  # tid -> SQUAD row
+        if "SQUAD" in self.grids:
+            cols = self.cols["SQUAD"]
+            ic = cols.get('team_id', cols.get('id'))
+            cc = cols.get('caixa')
+            for r in range(2, len(self.grids["SQUAD"]) + 1):
+                tid = norm_id(self._get("SQUAD", r, ic))
+                if tid:
+                    self.squad_row[tid] = r
+                    self.budgets[tid] = _money(self._get("SQUAD", r, cc)) if cc is not None else 0.0
+
+        self.free_row = {}  # pid -> PLAYERS_FREE row
+        if "PLAYERS_FREE" in self.grids:
+            pc = self.cols["PLAYERS_FREE"].get('player_id')
+            for r in range(2, len(self.grids["PLAYERS_FREE"]) + 1):
+                pid = norm_id(self._get("PLAYERS_FREE", r, pc))
+                if pid:
+                    self.free_row[pid] = r
+
+    # --- lookups ---
+
+    def has_team(self, tid):
+        """True if the team has a SQUAD row (where its caixa lives)."""
+        return norm_id(tid) in self.squad_row
+
+    def budget(self, tid):
+        return self.budgets.get(norm_id(tid), 0.0)
+
+    def owner_of(self, pid):
+        return self.owner.get(norm_id(pid))
+
+    def owns(self, tid, pid):
+        return self.owner_of(pid) == norm_id(tid)
+
+    def is_free(self, pid):
+        return norm_id(pid) in self.free_row
+
+    def roster_size(self, tid):
+        return self.roster[norm_id(tid)]
+
+    # --- edits (kept in the grids, the indexes and the pending cells) ---
+
+    def write(self, sheet, r, c, value):
+        """Sets one cell (1-based). Sheets outside the snapshot are written without version check."""
+        grid = self.grids.get(sheet)
+        if grid is not None:
+            while len(grid) < r:
+                grid.append([])
+            row = grid[r - 1]
+            row.extend([''] * (c - len(row)))
+            row[c - 1] = value
+        self.cells[(sheet, r, c)] = value
+
+    def _set(self, sheet, r, col_name, value):
+        self.write(sheet, r, self.cols[sheet][col_name] + 1, value)
+
+    def _append(self, sheet, values):
+        """Writes a new row after the last one; values: {column name: value}."""
+        r = len(self.grids[sheet]) + 1
+        for name, v in values.items():
+            self._set(sheet, r, name, v)
+        return r
+
+    def charge(self, tid, amount):
+        """Takes amount from the team's caixa."""
+        tid = norm_id(tid)
+        new = round(self.budget(tid) - amount, 2)
+        self.budgets[tid] = new
+        self._set("SQUAD", self.squad_row[tid], 'caixa', new)
+
+    def _take_free(self, pid):
+        """Removes pid from PLAYERS_FREE: its row is filled with the last row, the last row is blanked."""
+        r = self.free_row.pop(pid)
+        grid = self.grids["PLAYERS_FREE"]
+        last = len(grid)
+        if r != last:
+            moved = list(grid[last - 1])
+            for c in range(len(moved)):
+                self.write("PLAYERS_FREE", r, c + 1, moved[c])
+            moved_pid = norm_id(moved[self.cols["PLAYERS_FREE"]['player_id']])
+            self.free_row[moved_pid] = r
+        for c in range(max(len(grid[last - 1]), 1)):
+            self.write("PLAYERS_FREE", last, c + 1, '')
+        grid.pop()
+
+    def sign(self, tid, pid, drop=None):
+        """
+        Moves free agent pid into team tid.
+        With drop: the dropped player's TEAM row is rewritten in place with pid
+        and the dropped player takes pid's PLAYERS_FREE row.
+        Without: pid gets a new TEAM row.
+        """
+        tid, pid = norm_id(tid), norm_id(pid)
+        if drop:
+            drop = norm_id(drop)
+            r = self.team_row.pop(drop)
+            del self.owner[drop]
+            self._set("TEAM", r, 'player_id', pid)
+            self.team_row[pid] = r
+            fr = self.free_row.pop(pid)
+            self._set("PLAYERS_FREE", fr, 'player_id', drop)
+            self.free_row[drop] = fr
+        else:
+            self.team_row[pid] = self._append("TEAM", {'team_id': tid, 'player_id': pid})
+            self.roster[tid] += 1
+            self._take_free(pid)
+        self.owner[pid] = tid
+
+    def transfer(self, pid, to_tid):
+        """Moves an owned player to another team (his TEAM row's team_id is rewritten)."""
+        pid, to_tid = norm_id(pid), norm_id(to_tid)
+        self.roster[self.owner[pid]] -= 1
+        self._set("TEAM", self.team_row[pid], 'team_id', to_tid)
+        self.owner[pid] = to_tid
+        self.roster[to_tid] += 1
+
+    def changes(self):
+        """Pending cells as values_batch_update data."""
+        return [{'range': f"{_quote(s)}!{rowcol_to_a1(r, c)}", 'values': [[v]]}
+                for (s, r, c), v in sorted(self.cells.items())]
+
+def load_snapshot(sh, names=ROSTER_SHEETS):
+    resp = sh.values_batch_get([_quote(n) for n in names])
+    value_ranges = resp.get('valueRanges', [])
+    return RosterSnapshot({n: vr.get('values', []) for n, vr in zip(names, value_ranges)})
+
+def _ensure_rows(sh, snap):
+    # Writes past the grid fail on Sheets; grow sheets that got new rows
+    for name, before in snap.rows_before.items():
+        last = max((r for (s, r, c) in snap.cells if s == name), default=0)
+        if last > before:
+            ws = sh.worksheet(name)
+            if last > ws.row_count:
+                ws.add_rows(last - ws.row_count)
+
+def _commit(sh, snap, names):
+    lock = sh.transaction() if hasattr(sh, 'transaction') else nullcontext()
+    with lock:
+        current = load_snapshot(sh, names)
+        if current.versions != snap.versions:
+            return False
+        _ensure_rows(sh, snap)
+        sh.values_batch_update({'valueInputOption': 'RAW', 'data': snap.changes()})
+    return True
+
+def run_transaction(apply, names=ROSTER_SHEETS, max_attempts=MAX_ATTEMPTS):
+    """
+    Runs apply(snapshot) and commits the cells it changed.
+    apply must only read/edit the snapshot (it may run several times) and
+    returns whatever the caller needs (e.g. a log); that value is returned.
+    Raises ConflictError if the sheets changed underneath it on every attempt.
+    """
+    client, sh = get_client()
+    for attempt in range(1, max_attempts + 1):
+        snap = load_snapshot(sh, names)
+        result = apply(snap)
+        if not snap.cells:
+            return result
+        if _commit(sh, snap, names):
+            invalidate(*{s for (s, r, c) in snap.cells})
+            return result
+        print(f"Roster sheets changed during the transaction (attempt {attempt}/{max_attempts}). Retrying...")
+    raise ConflictError("As planilhas mudaram durante a operação. Tente novamente.")
@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+
+# Declarative scoring rules (Lucca's rules), compiled once into vectorized kernels.
+# Shared by live scoring (live_stats.calculate_points), full recalculation and Scout bonuses.
+#
+# Every rule has:
+#   name   - breakdown column
+#   group  - L_* column it adds up into (PONTUACAO_LUCCA_MATCH = sum of all groups)
+#   one of:
+#     points  - constant awarded when the conditions hold
+#     weights - {stat: weight} linear combination
+#     tiers   - (stat, [(threshold, points), ...]) first threshold reached (>=) wins, else 0
+#   when       - optional [(stat, op, value), ...] (all must hold)
+#   positions  - optional list of 'Posição' codes the rule applies to ('G', 'D', 'M', 'F')
+#   exclude    - optional list of 'Posição' codes the rule does NOT apply to
+
+# Stats computed from the raw ones before the rules run (in order)
+DERIVED = [
+    ('real_fouls', 'clip_sub', ('fouls', 'penaltyConceded')),
+    ('real_shot', 'clip_sub', ('onTargetScoringAttempt', 'hitWoodwork', 'goals')),
+    ('saves_out', 'clip_sub', ('saves', 'savedShotsFromInsideTheBox')),
+    ('duelTotal', 'sum', ('duelWon', 'duelLost')),
+    ('p_passe', 'ratio', ('accuratePass', 'totalPass')),
+    ('p_long', 'ratio', ('accurateLongBalls', 'totalLongBalls')),
+    ('p_duel', 'ratio', ('duelWon', 'duelTotal')),
+    ('p_drib', 'ratio', ('wonContest', 'totalContest')),
+]
+
+SG_WHEN = [('gols_sofridos_partida', '==', 0), ('minutesPlayed', '>', 0)]
+
+RULES = [
+    # 1. Nota (Rating)
+    {'name': 'nota', 'group': 'L_nota',
+     'tiers': ('rating', [(9, 3), (8, 2), (7, 1), (6.5, 0), (6, -1), (3, -2)])},
+
+    # 2. Pontos Negativos
+    {'name': 'negativos', 'group': 'L_negativos',
+     'weights': {'ownGoals': -2, 'yellowCards': -1, 'totalOffside': -0.25, 'dispossessed': -0.25,
+                 'penaltyConceded': -2, 'penaltyMiss': -3, 'real_fouls': -0.5}},
+
+    # 3. Cartão Vermelho
+    {'name': 'red', 'group': 'L_red', 'points': -3, 'when': [('redCards', '>', 0)]},
+
+    # 4. Participação (> 75 min)
+    {'name': 'part', 'group': 'L_part', 'points': 1, 'when': [('minutesPlayed', '>', 75)]},
+
+    # 5. Bonus Stats
+    {'name': 'bonus_passe', 'group': 'L_bonus', 'points': 1,
+     'when': [('totalPass', '>=', 40), ('p_passe', '>=', 0.90)]},
+    {'name': 'bonus_longa', 'group': 'L_bonus', 'points': 1,
+     'when': [('accurateLongBalls', '>=', 3), ('p_long', '>=', 0.60)]},
+    {'name': 'bonus_duelo', 'group': 'L_bonus', 'points': 1,
+     'when': [('duelWon', '>=', 3), ('p_duel', '>=', 0.50)]},
+    {'name': 'bonus_drible', 'group': 'L_bonus', 'points': 1,
+     'when': [('wonContest', '>=', 3), ('p_drib', '>=', 0.60)]},
+
+    # 6. Ações Ofensivas
+    {'name': 'acoes', 'group': 'L_acoes',
+     'weights': {'keyPass': 0.75, 'penaltySave': 5, 'penaltyWon': 2, 'wasFouled': 0.5,
+                 'shotOffTarget': 0.75, 'real_shot': 1.5, 'hitWoodwork': 3}},
+
+    # 7. Defesa (Jogadores de Linha)
+    {'name': 'def', 'group': 'L_def', 'exclude': ['G'],
+     'weights': {'totalClearance': 0.1, 'outfielderBlock': 0.25, 'interceptionWon': 0.5,
+                 'wonTackle': 0.75, 'goalLineClearance': 2}},
+
+    # 8. Goleiro
+    {'name': 'gk', 'group': 'L_gk', 'positions': ['G'],
+     'weights': {'savedShotsFromInsideTheBox': 1.0, 'saves_out': 0.5, 'accurateKeeperSweeper': 1,
+                 'goalLineClearance': 2, 'goalsPrevented': 2}},
+
+    # 9. Posição (Gols + Assist + SG + Gols Sofridos)
+    {'name': 'gols', 'group': 'L_pos', 'weights': {'goals': 6}},
+    {'name': 'assist', 'group': 'L_pos', 'weights': {'goalAssist': 4}},
+    {'name': 'sg_gk', 'group': 'L_pos', 'points': 4, 'positions': ['G'], 'when': SG_WHEN},
+    {'name': 'sg_def', 'group': 'L_pos', 'points': 3, 'positions': ['D'], 'when': SG_WHEN},
+    {'name': 'gols_sofridos', 'group': 'L_pos', 'positions': ['G', 'D'],
+     'weights': {'gols_sofridos_partida': -0.5}, 'when': [('minutesPlayed', '>', 0)]},
+]
+
+GROUPS = ['L_nota', 'L_negativos', 'L_red', 'L_part', 'L_bonus', 'L_acoes', 'L_def', 'L_gk', 'L_pos']
+BONUS_RULES = ['bonus_passe', 'bonus_longa', 'bonus_duelo', 'bonus_drible']
+
+_OPS = {
+    '>': np.greater, '>=': np.greater_equal, '==': np.equal,
+    '<': np.less, '<=': np.less_equal,
+}
+
+def compile_rules(rules=RULES, derived=DERIVED):
+    """
+    Compiles the rule table into index/weight arrays over the stat matrix.
+    Column layout: raw stats (sorted) followed by the derived stats.
+    """
+    derived_names = [d[0] for d in derived]
+    referenced = set()
+    for _, _, args in derived:
+        referenced.update(args)
+    for r in rules:
+        referenced.update(r.get('weights', {}).keys())
+        referenced.update(c[0] for c in r.get('when', []))
+        if 'tiers' in r:
+            referenced.add(r['tiers'][0])
+    raw = sorted(referenced - set(derived_names))
+    col = {name: i for i, name in enumerate(raw + derived_names)}
+
+    compiled = []
+    for r in rules:
+        c = {
+            'name': r['name'],
+            'group': r['group'],
+            'when': [(col[s], _OPS[op], np.float64(v)) for s, op, v in r.get('when', [])],
+            'positions': r.get('positions'),
+            'exclude': r.get('exclude'),
+        }
+        if 'weights' in r:
+            c['kind'] = 'linear'
+            c['idx'] = np.array([col[s] for s in r['weights']], dtype=np.intp)
+            c['w'] = np.array(list(r['weights'].values()), dtype=np.float64)
+        elif 'tiers' in r:
+            stat, tiers = r['tiers']
+            c['kind'] = 'tiers'
+            c['idx'] = col[stat]
+            c['thresholds'] = np.array([t for t, _ in tiers], dtype=np.float64)
+            c['values'] = np.array([p for _, p in tiers], dtype=np.float64)
+        else:
+            c['kind'] = 'points'
+            c['points'] = np.float64(r['points'])
+        compiled.append(c)
+
+    groups = list(dict.fromkeys(r['group'] for r in rules))
+    group_matrix = np.zeros((len(rules), len(groups)), dtype=np.float64)
+    for i, r in enumerate(rules):
+        group_matrix[i, groups.index(r['group'])] = 1
+
+    return {
+        'raw': raw,
+        'derived': [(col[n], kind, [col[a] for a in args]) for n, kind, args in derived],
+        'n_cols': len(col),
+        'rules': compiled,
+        'names': [r['name'] for r in rules],
+        'groups': groups,
+        'group_matrix': group_matrix,
+    }
+
+_COMPILED = compile_rules()
+
+def stat_matrix(df, compiled=None):
+    """
+    Builds the float64 stat matrix (n_rows x n_cols) and the position array.
+    Column names are matched case-insensitively (Scout lowercases its columns);
+    missing stats count as 0.
+    """
+    compiled = compiled or _COMPILED
+    n = len(df)
+    lower = {str(c).lower(): c for c in df.columns}
+
+    X = np.zeros((n, compiled['n_cols']), dtype=np.float64)
+    for i, name in enumerate(compiled['raw']):
+        c = lower.get(name.lower())
+        if c is not None:
+            X[:, i] = pd.to_numeric(df[c], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    for i, kind, args in compiled['derived']:
+        if kind == 'clip_sub':
+            X[:, i] = np.maximum(X[:, args[0]] - X[:, args[1:]].sum(axis=1), 0)
+        elif kind == 'sum':
+            X[:, i] = X[:, args].sum(axis=1)
+        elif kind == 'ratio':
+            num, den = X[:, args[0]], X[:, args[1]]
+            np.divide(num, den, out=X[:, i], where=den > 0)
+
+    pos_col = lower.get('posição')
+    if pos_col is not None:
+        pos = df[pos_col].astype(str).to_numpy()
+    else:
+        pos = np.full(n, '', dtype=object)
+    return X, pos
+
+def evaluate(X, pos, compiled=None, only=None):
+    """
+    Runs the compiled kernels. Returns the per-rule breakdown matrix
+    (n_rows x n_rules, float64) in compiled['names'] order.
+    only: optional set of rule names to evaluate (others stay 0).
+    """
+    compiled = compiled or _COMPILED
+    n = X.shape[0]
+    B = np.zeros((n, len(compiled['rules'])), dtype=np.float64)
+
+    for j, r in enumerate(compiled['rules']):
+        if only is not None and r['name'] not in only:
+            continue
+
+        if r['kind'] == 'linear':
+            val = X[:, r['idx']] @ r['w']
+        elif r['kind'] == 'tiers':
+            v = X[:, r['idx']]
+            # First threshold reached (thresholds sorted desc) - same as np.select
+            hit = v[:, None] >= r['thresholds'][None, :]
+            first = hit.argmax(axis=1)
+            val = np.where(hit.any(axis=1), r['values'][first], np.float64(0))
+        else:
+            val = np.full(n, r['points'], dtype=np.float64)
+
+        mask = np.ones(n, dtype=bool)
+        for idx, op, thr in r['when']:
+            mask &= op(X[:, idx], thr)
+        if r['positions'] is not None:
+            mask &= np.isin(pos, r['positions'])
+        if r['exclude'] is not None:
+            mask &= ~np.isin(pos, r['exclude'])
+
+        B[:, j] = np.where(mask, val, np.float64(0))
+
+    return B
+
+def score_breakdown(df, rules=None):
+    """
+    Per-rule points for every row of df, as a DataFrame (same index as df).
+    rules: optional list of rule names to compute/return (e.g. BONUS_RULES).
+    """
+    X, pos = stat_matrix(df)
+    only = set(rules) if rules is not None else None
+    B = evaluate(X, pos, only=only)
+    out = pd.DataFrame(B, index=df.index, columns=_COMPILED['names'])
+    return out[list(rules)] if rules is not None else out
+
+def score(df):
+    """
+    Full scoring: returns a DataFrame with the group columns (GROUPS),
+    PONTUACAO_LUCCA_MATCH and the per-rule breakdown (same index as df).
+    """
+    X, pos = stat_matrix(df)
+    B = evaluate(X, pos)
+    G = B @ _COMPILED['group_matrix']
+
+    out = pd.DataFrame(B, index=df.index, columns=_COMPILED['names'])
+    for k, g in enumerate(_COMPILED['groups']):
+        out[g] = G[:, k]
+    out['PONTUACAO_LUCCA_MATCH'] = G.sum(axis=1)
+    return out
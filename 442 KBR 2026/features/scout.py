@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
-from features.auth import get_client, get_players_file
+from features.auth import get_players_file
+from features.sheet_cache import get_sheet_dfs
 from features.elenco import clean_pos
+from features.scoring import score_breakdown, BONUS_RULES
+from features.calendar_utils import get_calendar
+from features.player_ids import add_player_key
 
 # --- CONSTANTS & MAPPING ---
 POS_ORDER = ['GK', 'DEF', 'MEI', 'ATA']
@@ -94,16 +98,17 @@ def load_scout_data():
     if players_file.exists():
         df_players = pd.read_csv(players_file)
         df_players['player_id'] = df_players['player_id'].astype(str)
+        add_player_key(df_players)
         df_players['Pos'] = df_players['Posição'].apply(clean_pos)
     else:
         df_players = pd.DataFrame()
 
     try:
-        client, sh = get_client()
+        # One batched request for every sheet the Scout page needs
+        sheets = get_sheet_dfs(["PLAYERS_STATS", "PLAYER_POINTS", "TEAM", "SQUAD", "GAMEWEEK"])
 
         # 2. Stats
-        ws_stats = sh.worksheet("PLAYERS_STATS")
-        df_stats = pd.DataFrame(ws_stats.get_all_records())
+        df_stats = sheets["PLAYERS_STATS"]
         if not df_stats.empty:
             df_stats.columns = df_stats.columns.str.lower()
             df_stats['player_id'] = df_stats['player_id'].astype(str)
@@ -113,16 +118,16 @@ def load_scout_data():
             for col in df_stats.columns:
                 if col not in ['player_id', 'game_id', 'fixture_id']:
                     df_stats[col] = pd.to_numeric(df_stats[col], errors='coerce').fillna(0)
+            add_player_key(df_stats)
 
         # 2a. Points (New Requirement)
-        ws_pts = sh.worksheet("PLAYER_POINTS")
-        # Use get_values to assume strings and handle commas if needed
-        pts_vals = ws_pts.get_values()
-        if pts_vals and len(pts_vals) > 1:
-            df_pts = pd.DataFrame(pts_vals[1:], columns=pts_vals[0])
+        # Read raw (get_values) by the cache to keep comma decimals as strings
+        df_pts = sheets["PLAYER_POINTS"]
+        if not df_pts.empty:
             df_pts.columns = df_pts.columns.str.lower()
             df_pts['player_id'] = df_pts['player_id'].astype(str)
             df_pts['game_id'] = df_pts['game_id'].astype(str)
+            add_player_key(df_pts)
             
             # Helper to clean float
             def robust_to_float_local(x):
@@ -134,32 +139,30 @@ def load_scout_data():
             df_pts['pontuacao'] = df_pts['pontuacao'].apply(robust_to_float_local)
             
             # Merge Points into Stats
-            # We merge on player_id and game_id
+            # We merge on player key and game_id
             if 'pontuacao' not in df_stats.columns:
-                df_stats = df_stats.merge(df_pts[['player_id', 'game_id', 'pontuacao']], on=['player_id', 'game_id'], how='left')
+                df_stats = df_stats.merge(df_pts[['pid', 'game_id', 'pontuacao']], on=['pid', 'game_id'], how='left')
                 df_stats['pontuacao'] = df_stats['pontuacao'].fillna(0)
         else:
             # If empty points, add 0 column
             df_stats['pontuacao'] = 0.0
 
         # 3. Teams (Ownership)
-        ws_team = sh.worksheet("TEAM")
-        df_team = pd.DataFrame(ws_team.get_all_records())
+        df_team = sheets["TEAM"]
         if not df_team.empty:
             df_team.columns = df_team.columns.str.lower()
             df_team['player_id'] = df_team['player_id'].astype(str)
             df_team['team_id'] = df_team['team_id'].astype(str)
+            add_player_key(df_team)
 
-        ws_squad = sh.worksheet("SQUAD")
-        df_squad = pd.DataFrame(ws_squad.get_all_records())
+        df_squad = sheets["SQUAD"]
         if not df_squad.empty:
             df_squad.columns = df_squad.columns.str.lower()
             id_col = next((c for c in df_squad.columns if c in ['team_id', 'id']), 'team_id')
             df_squad['team_id_norm'] = df_squad[id_col].astype(str)
 
         # 4. Gameweek (To map Game ID -> Round)
-        ws_gw = sh.worksheet("GAMEWEEK")
-        df_gw = pd.DataFrame(ws_gw.get_all_records())
+        df_gw = sheets["GAMEWEEK"]
         if not df_gw.empty:
             df_gw.columns = df_gw.columns.str.lower()
             # We need a map of game_id -> round
@@ -172,45 +175,12 @@ def load_scout_data():
 
     return df_players, df_stats, df_team, df_squad, df_gw
 
-def calculate_bonuses(row):
+def calculate_bonuses(df):
     """
-    Returns a dict with 1 if bonus achieved, 0 otherwise.
-    Based on features/pontuacao.py logic.
+    Returns a DataFrame (same index as df) with 1 if bonus achieved, 0 otherwise.
+    Uses the shared rule table in features/scoring.py, so Scout matches live scoring.
     """
-    bonuses = {
-        "bonus_passe": 0,
-        "bonus_longa": 0,
-        "bonus_duelo": 0,
-        "bonus_drible": 0
-    }
-    
-    # Bonus Passe: >= 40 passes AND >= 90% accuracy
-    tot_pass = row.get('totalpass', 0)
-    acc_pass = row.get('accuratepass', 0)
-    if tot_pass >= 40 and (acc_pass/tot_pass >= 0.90):
-        bonuses['bonus_passe'] = 1
-        
-    # Bonus Longa: >= 3 long balls AND >= 60% accuracy
-    tot_long = row.get('totallongballs', 0)
-    acc_long = row.get('accuratelongballs', 0)
-    if tot_long >= 3 and (acc_long/tot_long >= 0.60):
-        bonuses['bonus_longa'] = 1
-        
-    # Bonus Duelo: >= 3 won AND >= 50% win rate
-    won_duel = row.get('duelwon', 0)
-    lost_duel = row.get('duellost', 0)
-    tot_duel = won_duel + lost_duel
-    # Check if total > 0 to avoid div by zero
-    if tot_duel > 0 and won_duel >= 3 and (won_duel/tot_duel >= 0.50):
-        bonuses['bonus_duelo'] = 1
-    
-    # Bonus Drible (Contest): >= 3 won AND >= 60% win rate
-    won_con = row.get('woncontest', 0)
-    tot_con = row.get('totalcontest', 0)
-    if tot_con > 0 and won_con >= 3 and (won_con/tot_con >= 0.60):
-        bonuses['bonus_drible'] = 1
-        
-    return pd.Series(bonuses)
+    return score_breakdown(df, BONUS_RULES).astype(int)
 
 def app():
     st.markdown("## 🕵️ Scout Center")
@@ -228,17 +198,9 @@ def app():
     
     # 1. Map Game IDs to Rounds
     # Create a map: game_id -> round
-    game_round_map = {}
-    if not df_gw.empty and 'rodada' in df_gw.columns:
-        for _, row in df_gw.iterrows():
-            gid_full = str(row.get('id_jogo', ''))
-            gw = row.get('rodada')
-            if gid_full:
-                game_round_map[gid_full] = gw
-                if 'id:' in gid_full:
-                    game_round_map[gid_full.split('id:')[-1]] = gw
+    game_round_map = get_calendar()['round_of']
     
-    df_stats['rodada'] = df_stats['game_id'].apply(lambda x: game_round_map.get(str(x), 0))
+    df_stats['rodada'] = df_stats['game_id'].astype(str).map(game_round_map).fillna(0).astype(int)
     # Filter out stats with no valid round (maybe friendly or bug)
     df_stats = df_stats[df_stats['rodada'] != 0]
 
@@ -252,15 +214,12 @@ def app():
         name_col = next((c for c in df_squad.columns if c in ['name', 'nome', 'team', 'team_name']), 'name')
         tid_name_map = pd.Series(df_squad[name_col].values, index=df_squad['team_id_norm']).to_dict()
         
-        # Map player -> tid -> Team Name
-        for _, row in df_team.iterrows():
-            pid = str(row['player_id'])
-            tid = str(row['team_id'])
-            tname = tid_name_map.get(tid, f"Time {tid}")
-            player_team_map[pid] = tname
+        # Map player key -> tid -> Team Name
+        tnames = df_team['team_id'].map(lambda tid: tid_name_map.get(tid, f"Time {tid}"))
+        player_team_map = dict(zip(df_team['pid'], tnames))
             
     # Add 'FictionalTeam' to df_players temporarily for display/filtering
-    df_players['FictionalTeam'] = df_players['player_id'].apply(lambda x: player_team_map.get(x, 'Sem Time'))
+    df_players['FictionalTeam'] = df_players['pid'].map(player_team_map).fillna('Sem Time')
     
     # --- FILTERS (EXPANDER) ---
     with st.expander("🔍 Filtros de Pesquisa", expanded=True):
@@ -330,7 +289,7 @@ def app():
     if sel_teams:
         df_p_filtered = df_p_filtered[df_p_filtered['FictionalTeam'].isin(sel_teams)]
         
-    target_pids = df_p_filtered['player_id'].unique()
+    target_pids = df_p_filtered['pid'].unique()
     
     if len(target_pids) == 0:
         st.info("Nenhum jogador encontrado com os filtros selecionados.")
@@ -338,7 +297,7 @@ def app():
 
     # 2. Filter Stats
     stats_filtered = df_stats[
-        (df_stats['player_id'].isin(target_pids)) & 
+        (df_stats['pid'].isin(target_pids)) & 
         (df_stats['rodada'].isin(sel_rounds))
     ].copy()
     
@@ -350,8 +309,7 @@ def app():
     
     # Pre-calculate Bonuses if needed
     if "bonus_passe" in sel_vars or "bonus_longa" in sel_vars or "bonus_duelo" in sel_vars or "bonus_drible" in sel_vars:
-        # We need to apply this row by row
-        bonus_df = stats_filtered.apply(calculate_bonuses, axis=1)
+        bonus_df = calculate_bonuses(stats_filtered)
         stats_filtered = pd.concat([stats_filtered, bonus_df], axis=1)
 
     # Define aggregation dict
@@ -367,7 +325,7 @@ def app():
     agg_dict['rodada'] = 'count' # This gives number of matches
     
     # Group By Player
-    grouped = stats_filtered.groupby('player_id').agg(agg_dict).reset_index()
+    grouped = stats_filtered.groupby('pid').agg(agg_dict).reset_index()
     
     # Rename 'rodada' to 'Jogos'
     grouped = grouped.rename(columns={'rodada': 'Jogos'})
@@ -378,7 +336,7 @@ def app():
             grouped[col] = grouped[col].round(2)
 
     # --- FINAL MERGE ---
-    final_df = grouped.merge(df_p_filtered[['player_id', 'Nome', 'Pos', 'FictionalTeam', 'Team']], on='player_id', how='left')
+    final_df = grouped.merge(df_p_filtered[['pid', 'Nome', 'Pos', 'FictionalTeam', 'Team']], on='pid', how='left')
     
     # Organize Columns
     cols_order = ['Nome', 'Pos', 'FictionalTeam', 'Team', 'Jogos'] + sel_vars
@@ -0,0 +1,224 @@
+import time
+import threading
+import pandas as pd
+import streamlit as st
+import gspread
+from gspread.utils import numericise_all, a1_range_to_grid_range
+from features.auth import get_client
+from features.sheet_mirror import read_mirror, write_mirror, drop_mirror
+from features.write_queue import pending_ops
+
+# Shared in-process snapshot of the spreadsheet.
+# One read per worksheet serves every page and every session until its TTL
+# expires or a write path calls invalidate().
+# Behind it sits the local Parquet mirror (features/sheet_mirror.py): a fresh
+# enough mirror is loaded instead of calling Sheets, and every Sheets read
+# refreshes it.
+# Writes still waiting in the write-behind queue (features/write_queue.py) are
+# overlaid on every returned copy, so a queued write is visible immediately.
+
+# TTL (seconds) per worksheet
+SHEET_TTLS = {
+    "TEAM": 60,
+    "SQUAD": 60,
+    "PLAYERS_FREE": 60,
+    "TEAM_LINEUP": 60,
+    "PLAYER_POINTS": 60,
+    "PLAYERS_STATS": 120,
+    "H2H - TEAM_POINTS": 60,
+    "H2H - TABLE": 60,
+    "H2H - ROUNDS": 600,
+    "GAMEWEEK": 300,
+    "HOUR": 300,
+}
+DEFAULT_TTL = 60
+
+# Sheets read with get_values() (raw strings) instead of get_all_records().
+# Needed where gspread would auto-numericise comma decimals ("87,57" -> 8757).
+RAW_SHEETS = {"PLAYER_POINTS", "H2H - TEAM_POINTS", "H2H - TABLE"}
+
+_snapshots = {}  # name -> (loaded_at, DataFrame)
+_worksheets = {}  # name -> gspread Worksheet handle
+_lock = threading.Lock()
+
+def get_worksheet(name):
+    """Returns a cached Worksheet handle (sh.worksheet() costs a metadata round trip)."""
+    ws = _worksheets.get(name)
+    if ws is None:
+        client, sh = get_client()
+        ws = sh.worksheet(name)
+        _worksheets[name] = ws
+    return ws
+
+def _to_df(name, values):
+    """
+    Builds the DataFrame for a sheet from its raw value grid.
+    Matches get_all_records() typing (numericised cells) unless the sheet is in RAW_SHEETS.
+    """
+    if not values:
+        return pd.DataFrame()
+    header = values[0]
+    rows = []
+    for row in values[1:]:
+        # API trims trailing blanks - pad back to header width
+        row = list(row[:len(header)]) + [''] * (len(header) - len(row))
+        rows.append(row if name in RAW_SHEETS else numericise_all(row))
+    return pd.DataFrame(rows, columns=header)
+
+def _fetch(name):
+    df = _to_df(name, get_worksheet(name).get_values())
+    write_mirror(name, df)
+    return df
+
+def _load_mirror(name, max_age=None):
+    return read_mirror(name, max_age=max_age, raw=name in RAW_SHEETS)
+
+def _overlay(name, df):
+    """Applies the queued (not yet flushed) appends/updates of a sheet to df."""
+    ops = pending_ops(name)
+    if not ops:
+        return df
+    if len(df.columns) == 0:
+        # Empty or not yet created sheet: the header the queued appends will create it with
+        header = next((op['header'] for op in ops if op['op'] == 'append' and op.get('header')), None)
+        if not header:
+            return df
+        df = pd.DataFrame(columns=header)
+    width = len(df.columns)
+    for op in ops:
+        if op['op'] == 'append':
+            rows = [list(r[:width]) + [''] * (width - len(r)) for r in op['rows']]
+            if name not in RAW_SHEETS:
+                rows = [numericise_all(r) for r in rows]
+            df = pd.concat([df, pd.DataFrame(rows, columns=df.columns)], ignore_index=True)
+        else:
+            grid = a1_range_to_grid_range(op['range'].split('!')[-1])
+            r0, c0 = grid.get('startRowIndex', 0) - 1, grid.get('startColumnIndex', 0)
+            for i, row in enumerate(op['values']):
+                for j, v in enumerate(row):
+                    if 0 <= r0 + i < len(df) and c0 + j < width:
+                        df.iat[r0 + i, c0 + j] = v
+    return df
+
+def _drop_blank_rows(df):
+    """Rows left blank by block upserts (features/sheet_upsert.py) are not data."""
+    if df.empty:
+        return df
+    filled = df.astype(str).apply(lambda col: col.str.strip() != '').any(axis=1)
+    return df[filled].reset_index(drop=True)
+
+def _a1(name):
+    # Whole-sheet A1 range; quotes needed for names like "H2H - ROUNDS"
+    return "'" + name.replace("'", "''") + "'"
+
+def get_sheet_df(name):
+    """
+    Returns a copy of the cached DataFrame for a worksheet, reloading it
+    from Sheets when its TTL has expired.
+    Raises the underlying gspread error if the sheet cannot be read.
+    """
+    ttl = SHEET_TTLS.get(name, DEFAULT_TTL)
+    now = time.time()
+
+    entry = _snapshots.get(name)
+    if entry is None or now - entry[0] >= ttl:
+        with _lock:
+            # Re-check: another session may have refreshed it while we waited
+            entry = _snapshots.get(name)
+            if entry is None or time.time() - entry[0] >= ttl:
+                entry = _load_mirror(name, max_age=ttl)
+                if entry is None:
+                    try:
+                        entry = (time.time(), _fetch(name))
+                    except Exception as e:
+                        # Stale handle (sheet recreated) - drop it so next call re-resolves
+                        _worksheets.pop(name, None)
+                        # Sheets unreachable: last mirror, whatever its age
+                        entry = _load_mirror(name)
+                        if entry is None and isinstance(e, gspread.exceptions.WorksheetNotFound) and pending_ops(name):
+                            # Created by the first queued append: serve just the queued rows until then
+                            entry = (time.time(), pd.DataFrame())
+                        elif entry is None:
+                            raise
+                        else:
+                            print(f"Sheets read failed for {name} ({e}). Serving local mirror.")
+                _snapshots[name] = entry
+
+    return _drop_blank_rows(_overlay(name, entry[1].copy()))
+
+def get_sheet_dfs(names, fresh=False):
+    """
+    Returns {name: DataFrame} for several worksheets.
+    Every sheet missing or expired in the cache (all of them if fresh=True)
+    is pulled in a single values_batch_get request.
+    If the batch fails (e.g. a sheet does not exist), falls back to per-sheet
+    reads; sheets that still fail are returned as empty DataFrames.
+    With fresh=True the fallback also reads Sheets directly, never the mirror.
+    """
+    now = time.time()
+    stale = [n for n in names
+             if fresh or n not in _snapshots
+             or now - _snapshots[n][0] >= SHEET_TTLS.get(n, DEFAULT_TTL)]
+    
+    if not fresh:
+        # Fresh enough mirror files spare the Sheets call
+        for n in list(stale):
+            entry = _load_mirror(n, max_age=SHEET_TTLS.get(n, DEFAULT_TTL))
+            if entry is not None:
+                with _lock:
+                    _snapshots[n] = entry
+                stale.remove(n)
+
+    failed = {}  # name -> error (fresh reads that failed)
+    if stale:
+        try:
+            client, sh = get_client()
+            resp = sh.values_batch_get([_a1(n) for n in stale])
+            value_ranges = resp.get('valueRanges', [])
+            loaded_at = time.time()
+            with _lock:
+                for n, vr in zip(stale, value_ranges):
+                    _snapshots[n] = (loaded_at, _to_df(n, vr.get('values', [])))
+            for n in stale[:len(value_ranges)]:
+                write_mirror(n, _snapshots[n][1])
+        except Exception as e:
+            print(f"Batch read failed ({e}). Reading sheets one by one...")
+            for n in stale:
+                with _lock:
+                    _snapshots.pop(n, None)
+                if fresh:
+                    # fresh=True must come from Sheets: no mirror fallback
+                    try:
+                        entry = (time.time(), _fetch(n))
+                        with _lock:
+                            _snapshots[n] = entry
+                    except Exception as e2:
+                        _worksheets.pop(n, None)
+                        failed[n] = e2
+
+    out = {}
+    for n in names:
+        if n in failed:
+            print(f"Error reading sheet {n}: {failed[n]}")
+            out[n] = pd.DataFrame()
+            continue
+        try:
+            out[n] = get_sheet_df(n)
+        except Exception as e:
+            print(f"Error reading sheet {n}: {e}")
+            out[n] = pd.DataFrame()
+    return out
+
+def invalidate(*names):
+    """
+    Drops the snapshot and mirror file of the given worksheets (all if none
+    given) and clears the page-level st.cache_data so the next render reads fresh data.
+    """
+    with _lock:
+        if names:
+            for n in names:
+                _snapshots.pop(n, None)
+        else:
+            _snapshots.clear()
+    drop_mirror(*names)
+    st.cache_data.clear()
@@ -0,0 +1,103 @@
+import os
+import time
+import pandas as pd
+from gspread.utils import numericise_all
+from features.auth import BASE_DIR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow ships with streamlit; without it the mirror is just disabled
+    pa = None
+    pq = None
+
+# Local columnar mirror of the spreadsheet (one Parquet file per worksheet).
+# sheet_cache reads it before going to Sheets, writes it after every Sheets
+# read, and drops it on invalidate(), so every process (app sessions, scripts)
+# shares the last read and a write is never hidden by a stale copy.
+# If Sheets is unreachable, the last mirror is served regardless of its age.
+
+MIRROR_DIR = BASE_DIR / "Dados" / "mirror"
+
+MIRROR_SHEETS = [
+    "TEAM", "SQUAD", "PLAYERS_FREE", "TEAM_LINEUP", "GAMEWEEK", "HOUR",
+    "PLAYERS_STATS", "PLAYER_POINTS",
+    "H2H - ROUNDS", "H2H - TEAM_POINTS", "H2H - TABLE",
+]
+
+def _path(name):
+    return MIRROR_DIR / (name.replace(" ", "_") + ".parquet")
+
+def _to_table(df):
+    """
+    Typed Arrow table: columns that are all numbers keep a numeric type,
+    anything mixed (numbers + blanks/text) is stored as strings.
+    """
+    cols = {}
+    for c in df.columns:
+        s = df[c]
+        if s.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).all() and len(s):
+            cols[str(c)] = pd.to_numeric(s)
+        else:
+            cols[str(c)] = s.astype(str)
+    return pa.Table.from_pandas(pd.DataFrame(cols, index=df.index), preserve_index=False)
+
+def write_mirror(name, df):
+    """Saves a sheet DataFrame to its Parquet file (atomic replace). Never raises."""
+    if pq is None or name not in MIRROR_SHEETS:
+        return
+    try:
+        MIRROR_DIR.mkdir(parents=True, exist_ok=True)
+        path = _path(name)
+        tmp = path.with_suffix(".tmp")
+        pq.write_table(_to_table(df), tmp)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Mirror write failed ({name}): {e}")
+
+def read_mirror(name, max_age=None, raw=False):
+    """
+    Loads a sheet from its Parquet file (memory-mapped).
+    Returns (mtime, DataFrame), or None if missing, older than max_age seconds or unreadable.
+    String columns are numericised back (as get_all_records would) unless raw=True.
+    """
+    if pq is None:
+        return None
+    path = _path(name)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    if max_age is not None and time.time() - mtime >= max_age:
+        return None
+    try:
+        df = pq.read_table(path, memory_map=True).to_pandas()
+    except Exception as e:
+        print(f"Mirror read failed ({name}): {e}")
+        return None
+    for c in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[c]):
+            values = df[c].astype(object).tolist()
+            df[c] = pd.Series(values if raw else numericise_all(values), index=df.index, dtype=object)
+    return mtime, df
+
+def drop_mirror(*names):
+    """Deletes the mirror files of the given sheets (all if none given)."""
+    for n in (names or MIRROR_SHEETS):
+        try:
+            _path(n).unlink()
+        except OSError:
+            pass
+
+def sync_mirror(names=None):
+    """Refreshes the mirror of every worksheet (or `names`) from Sheets in one batched read."""
+    from features.sheet_cache import get_sheet_dfs
+    names = list(names or MIRROR_SHEETS)
+    start = time.time()
+    sheets = get_sheet_dfs(names, fresh=True)
+    for n in names:
+        print(f"  {n}: {len(sheets[n])} rows")
+    print(f"Mirror synced in {time.time() - start:.1f}s -> {MIRROR_DIR}")
+
+if __name__ == "__main__":
+    sync_mirror()
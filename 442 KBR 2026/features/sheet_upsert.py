@@ -0,0 +1,219 @@
+from gspread.utils import rowcol_to_a1
+
+# Block upserts for append-only style sheets (PLAYERS_STATS, TEAM_LINEUP, ...).
+# Rows are grouped in blocks by a key made of one or more columns
+# (e.g. game_id, or team_id + rodada). Only the blocks being saved are touched,
+# and rows are never inserted or deleted, so other rows never move:
+# - a block's new rows go into its old rows first, then into blank rows
+#   (freed by earlier upserts), then after the last row
+# - old rows it no longer needs are blanked (readers skip blank rows)
+# Everything is written in one batch_update. Right before it, the key cells of
+# every target row are read again: if any of them no longer holds what the plan
+# expects (the block's key, or blank), the upsert is re-planned.
+# Remaining race on Sheets (no row locks): another writer that claims the same
+# blank/tail rows between that re-check and the write can be overwritten.
+
+MAX_ATTEMPTS = 3
+
+def _col_letter(idx):
+    """0-based column index -> A1 letter."""
+    return rowcol_to_a1(1, idx + 1)[:-1]
+
+def _scan_keys(ws, key_cols):
+    """Reads only the key columns: (n_rows, {key: [row numbers]}, [blank row numbers])."""
+    ranges = [f"{_col_letter(c)}:{_col_letter(c)}" for c in key_cols]
+    cols = ws.batch_get(ranges)
+    n_rows = max((len(c) for c in cols), default=0)
+
+    index = {}
+    blank = []
+    for r in range(1, n_rows):  # skip header
+        key = tuple(str(col[r][0]) if r < len(col) and col[r] else '' for col in cols)
+        if not any(key):
+            blank.append(r + 1)
+            continue
+        index.setdefault(key, []).append(r + 1)
+    return n_rows, index, blank
+
+def read_key_index(ws, key_cols):
+    """
+    Reads only the key columns and returns (n_rows, {key: [row numbers]}).
+    n_rows includes the header; row numbers are 1-based sheet rows.
+    Keys are tuples of strings, in the order of key_cols.
+    """
+    n_rows, index, _ = _scan_keys(ws, key_cols)
+    return n_rows, index
+
+def _row_runs(rows):
+    """[3,4,5,9,10] -> [(3,5),(9,10)]"""
+    runs = []
+    for r in sorted(rows):
+        if runs and r == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], r)
+        else:
+            runs.append((r, r))
+    return runs
+
+def delete_sheet_rows(ws, rows):
+    """Deletes the given 1-based rows in a single request (bottom-up so indexes stay valid)."""
+    if not rows: return
+    requests = []
+    for start, end in reversed(_row_runs(rows)):
+        requests.append({
+            "deleteDimension": {
+                "range": {
+                    "sheetId": ws.id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,
+                    "endIndex": end
+                }
+            }
+        })
+    ws.spreadsheet.batch_update({"requests": requests})
+
+def _rows_hold(ws, key_cols, expected):
+    """True if every row in expected ({row: key tuple, all '' for blank}) still holds that key."""
+    rows = [r for r in sorted(expected) if r <= ws.row_count]  # rows past the grid are blank
+    runs = _row_runs(rows)
+    ranges = [f"{_col_letter(c)}{start}:{_col_letter(c)}{end}" for start, end in runs for c in key_cols]
+    cols = iter(ws.batch_get(ranges)) if ranges else iter(())
+    for start, end in runs:
+        block = [next(cols) for _ in key_cols]
+        for i in range(end - start + 1):
+            found = tuple(str(col[i][0]) if i < len(col) and col[i] else '' for col in block)
+            if found != expected[start + i]:
+                return False
+    return True
+
+def upsert_blocks(ws, blocks, key_cols, value_input_option='RAW'):
+    """
+    Replaces the rows of each key in `blocks` ({key_tuple: [row lists]}) without
+    moving any other row (see the notes at the top).
+    Returns {'updated': n, 'appended': n, 'cleared': n} (row counts).
+    Raises RuntimeError if the target rows kept changing on every attempt.
+    """
+    blank_key = ('',) * len(key_cols)
+    width = max([len(r) for rows in blocks.values() for r in rows] + [ws.col_count])
+
+    for attempt in range(MAX_ATTEMPTS):
+        n_rows, index, free = _scan_keys(ws, key_cols)
+        next_row = max(n_rows, 1) + 1
+        writes = {}  # row -> values
+        expected = {}  # row -> key it must still hold when written
+        n_updated = n_appended = n_cleared = 0
+
+        for key, rows in blocks.items():
+            old = index.get(key, [])
+            for i, values in enumerate(rows):
+                if i < len(old):
+                    r = old[i]
+                    n_updated += 1
+                else:
+                    if free:
+                        r = free.pop(0)
+                    else:
+                        r, next_row = next_row, next_row + 1
+                    n_appended += 1
+                writes[r] = list(values) + [''] * (width - len(values))
+            for r in old[len(rows):]:
+                writes[r] = [''] * width
+                n_cleared += 1
+            for r in old:
+                expected[r] = key
+        for r in writes:
+            expected.setdefault(r, blank_key)
+
+        if _rows_hold(ws, key_cols, expected):
+            break
+    else:
+        raise RuntimeError(f"{ws.title}: rows kept changing during the upsert. Try again.")
+
+    if not writes:
+        return {'updated': 0, 'appended': 0, 'cleared': 0}
+    last = max(writes)
+    if last > ws.row_count:
+        ws.add_rows(last - ws.row_count)
+    if width > ws.col_count:
+        ws.add_cols(width - ws.col_count)
+    data = [{'range': f"A{start}", 'values': [writes[r] for r in range(start, end + 1)]}
+            for start, end in _row_runs(writes)]
+    ws.batch_update(data, value_input_option=value_input_option)
+
+    return {'updated': n_updated, 'appended': n_appended, 'cleared': n_cleared}
+
+def upsert_changed_cells(ws, rows, key_cols, scope_col=None, prune_all=False,
+                         equal=None, value_input_option='USER_ENTERED'):
+    """
+    Keyed upsert that only writes cells whose value changed (e.g. PLAYER_POINTS by game_id + player_id).
+    rows: full rows in sheet column order (header must already exist).
+    Existing keys get a cell update for every non-key column that differs,
+    unknown keys are written as new rows after the last one - all in one batch_update.
+    Stale rows are deleted afterwards:
+    - scope_col: rows whose scope value (e.g. game_id) is being saved but whose key is gone
+    - prune_all: every row whose key is not in `rows` (full recalculation)
+    equal(old, new): comparator for non-key cells (default: string compare).
+    Returns {'changed': n_cells, 'appended': n_rows, 'deleted': n_rows}.
+    """
+    if equal is None:
+        equal = lambda a, b: str(a) == str(b)
+
+    # Unformatted so numbers come back as numbers, not locale strings ("2,5")
+    current = ws.get_values(value_render_option='UNFORMATTED_VALUE')
+    n_rows = len(current)
+
+    index = {}
+    duplicates = []
+    for r in range(1, n_rows):
+        row = current[r]
+        key = tuple(str(row[c]) if c < len(row) else '' for c in key_cols)
+        if not any(key): continue
+        if key in index:
+            duplicates.append(r + 1)  # left over from old full rewrites
+        else:
+            index[key] = r + 1
+
+    updates = []
+    new_rows = []
+    seen = set()
+    n_changed = 0
+
+    for row in rows:
+        key = tuple(str(row[c]) for c in key_cols)
+        seen.add(key)
+        sheet_row = index.get(key)
+        if sheet_row is None:
+            new_rows.append(row)
+            continue
+        old = current[sheet_row - 1]
+        for c, val in enumerate(row):
+            if c in key_cols: continue
+            old_val = old[c] if c < len(old) else ''
+            if not equal(old_val, val):
+                updates.append({'range': rowcol_to_a1(sheet_row, c + 1), 'values': [[val]]})
+                n_changed += 1
+
+    if new_rows:
+        start = n_rows + 1
+        needed = n_rows + len(new_rows) - ws.row_count
+        if needed > 0:
+            ws.add_rows(needed)
+        updates.append({'range': f"A{start}", 'values': new_rows})
+
+    if updates:
+        ws.batch_update(updates, value_input_option=value_input_option)
+
+    # Stale rows
+    if prune_all:
+        stale = [r for k, r in index.items() if k not in seen]
+    elif scope_col is not None:
+        pos = key_cols.index(scope_col)
+        scopes = {k[pos] for k in seen}
+        stale = [r for k, r in index.items() if k[pos] in scopes and k not in seen]
+    else:
+        stale = []
+    stale += duplicates
+
+    if stale:
+        delete_sheet_rows(ws, stale)
+
+    return {'changed': n_changed, 'appended': len(new_rows), 'deleted': len(stale)}
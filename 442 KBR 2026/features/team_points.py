@@ -1,20 +1,93 @@
 import pandas as pd
-import datetime
-import re
+import time
 from features.auth import get_client, get_players_file
 from features.live_stats import STATS_SHEET, POINTS_SHEET
 from features.utils import robust_to_float, format_br_decimal
+from features.sheet_cache import invalidate
+from features.sheet_upsert import upsert_blocks
+from features.league_table import update_league_table
+from features.calendar_utils import build_gameweek, parse_game_id, GAME_FINISHED_H
+from features.player_ids import add_player_key
 
 TEAM_POINTS_SHEET = "H2H - TEAM_POINTS"
 
-def parse_time(t_str):
-    if not t_str: return None
-    try:
-        return pd.to_datetime(t_str, dayfirst=True)
-    except:
-        return None
+def build_points_index(df_pts, df_gw):
+    """
+    Returns {(pid, rodada): total points} from PLAYER_POINTS joined to GAMEWEEK on game id.
+    Expects lowercase columns, the int pid key (add_player_key) and numeric pontuacao.
+    """
+    if df_pts.empty or 'game_id' not in df_pts.columns:
+        return {}
+    gw = pd.DataFrame({
+        'simple_id': df_gw['id_jogo'].map(parse_game_id),
+        'rodada': pd.to_numeric(df_gw['rodada'], errors='coerce'),
+    }).dropna().drop_duplicates()
+    gw['rodada'] = gw['rodada'].astype(int)
+
+    pts = df_pts[['pid', 'pontuacao']].assign(simple_id=df_pts['game_id'].map(parse_game_id))
+    merged = pts.merge(gw, on='simple_id', how='inner')
+    totals = merged.groupby(['pid', 'rodada'])['pontuacao'].sum()
+    return {k: float(v) for k, v in totals.items()}
+
+def resolve_substitutions(round_lineup, r, player_game_map, pid_to_club, club_round_status):
+    """
+    Automatic substitutions for all teams of a round at once.
+    A starter (TITULAR) whose game is finished with 0 minutes - or whose club's game
+    is finished and he has no stats row - is replaced by the bench player (PRI n) of the
+    same position with the best priority not used yet. Starters are served in lineup order,
+    so within (team, position) the k-th DNP starter gets the k-th eligible sub.
+    Players are identified by the int pid key (add_player_key).
+    Returns {team_id: set(active pids)}.
+    """
+    lineup = round_lineup.reset_index(drop=True)
+    starters = lineup[lineup['lineup'] == 'TITULAR'].copy()
+    subs = lineup[lineup['lineup'].str.startswith('PRI', na=False)].copy()
+
+    # Starter status: stats row if any, otherwise the club's game
+    keys = list(zip(starters['pid'], [r] * len(starters)))
+    finished = pd.Series([player_game_map[k]['finished'] if k in player_game_map
+                          else club_round_status.get((pid_to_club.get(k[0]), r), {}).get('finished', False)
+                          for k in keys], index=starters.index, dtype=bool)
+    mins = pd.Series([player_game_map[k]['min'] if k in player_game_map else 0 for k in keys],
+                     index=starters.index, dtype=object)
+    dnp = finished & (mins == 0)
+
+    # Rank DNP starters and eligible subs inside each (team, position)
+    out = starters[dnp].copy()
+    out['rank'] = out.groupby(['team_id', 'posicao']).cumcount()
+
+    subs['pri_num'] = pd.to_numeric(subs['lineup'].str.split().str[-1], errors='coerce').fillna(99)
+    starter_keys = set(zip(starters['team_id'], starters['pid']))
+    used = pd.Series([k in starter_keys for k in zip(subs['team_id'], subs['pid'])], index=subs.index, dtype=bool)
+    subs = subs[~used].sort_values('pri_num', kind='stable')
+    subs['rank'] = subs.groupby(['team_id', 'posicao']).cumcount()
+
+    swaps = out.merge(subs[['team_id', 'posicao', 'rank', 'pid']],
+                      on=['team_id', 'posicao', 'rank'], suffixes=('', '_sub'))
+    swapped_out = set(zip(swaps['team_id'], swaps['pid']))
+
+    active = {}
+    for tid, pid in zip(starters['team_id'], starters['pid']):
+        if (tid, pid) not in swapped_out:
+            active.setdefault(tid, set()).add(pid)
+    for tid, pid in zip(swaps['team_id'], swaps['pid_sub']):
+        active.setdefault(tid, set()).add(pid)
+    for tid in lineup['team_id'].unique():
+        active.setdefault(tid, set())
+    return active
 
-def calculate_team_points(target_round=None):
+def calculate_team_points(target_round=None, changed_game_ids=None, finished_game_ids=None):
+    """
+    Recomputes H2H - TEAM_POINTS.
+    - no arguments: every round, sheet rewritten from scratch
+    - target_round: only that round
+    - changed_game_ids: only the rounds of those games, and only the teams with a
+      lineup player (or a player's club) in them
+    - finished_game_ids: games that became finished since the last run (clock, not
+      payload): every team of their rounds, since DNP auto-subs may now apply
+    Scoped runs upsert just their (team_id, rodada) blocks instead of clearing the sheet.
+    Returns True on success (including nothing to update), False if loading or saving failed.
+    """
     client, sh = get_client()
     
     # 1. Load Data
@@ -45,7 +118,7 @@ def calculate_team_points(target_round=None):
         
     except Exception as e:
         print(f"Error loading sheets: {e}")
-        return
+        return False
 
     # Normalize Columns
     df_lineup.columns = [c.lower() for c in df_lineup.columns] 
@@ -59,19 +132,28 @@ def calculate_team_points(target_round=None):
         df_pts['pontuacao'] = df_pts['pontuacao'].apply(robust_to_float)
 
     
+    # Rows blanked by block upserts (features/sheet_upsert.py)
+    df_lineup = df_lineup[df_lineup['team_id'].astype(str).str.strip() != ''].copy()
+    if 'game_id' in df_stats.columns:
+        df_stats = df_stats[df_stats['game_id'].astype(str).str.strip() != ''].copy()
+    
     # Ensure IDs are strings
     df_lineup['player_id'] = df_lineup['player_id'].astype(str)
     df_lineup['team_id'] = df_lineup['team_id'].astype(str)
     df_pts['player_id'] = df_pts['player_id'].astype(str)
     df_stats['player_id'] = df_stats['player_id'].astype(str)
     df_players['player_id'] = df_players['player_id'].astype(str)
+    
+    # Int keys for every join/lookup below (URL, slug and numeric forms all map to the same key)
+    for df in (df_lineup, df_pts, df_stats, df_players):
+        add_player_key(df)
 
     # Map Player -> Club
     # normalization: verify 'club' or 'clube' or 'time' column in players
     club_col = next((c for c in df_players.columns if c in ['club', 'clube', 'team', 'time']), None)
     pid_to_club = {}
     if club_col:
-        pid_to_club = pd.Series(df_players[club_col].values, index=df_players['player_id']).to_dict()
+        pid_to_club = pd.Series(df_players[club_col].values, index=df_players['pid']).to_dict()
 
     # 2. Filter Round
     if target_round is None:
@@ -81,53 +163,59 @@ def calculate_team_points(target_round=None):
         
     final_rows = []
     
-    now = datetime.datetime.now()
+    gw = build_gameweek(df_gw)
+    df_gw['simple_id'] = gw['games']['simple_id'].values
+    df_stats['simple_id'] = df_stats['game_id'].map(parse_game_id)
     
-    def clean_id(x): return str(x).split("id:")[-1]
+    # Incremental scope: rounds and teams touched by the changed games,
+    # plus every team of the rounds with a newly finished game
+    scoped = changed_game_ids is not None or finished_game_ids is not None
+    affected_teams = None
+    full_rounds = set()
+    if scoped:
+        changed = {parse_game_id(g) for g in changed_game_ids or []}
+        crossed = {parse_game_id(g) for g in finished_game_ids or []}
+        round_of = pd.to_numeric(df_gw['rodada'], errors='coerce')
+        full_rounds = set(round_of[df_gw['simple_id'].isin(crossed)].dropna().astype(int))
+        changed_rounds = set(round_of[df_gw['simple_id'].isin(changed)].dropna().astype(int))
+        rounds = sorted(full_rounds | changed_rounds)
+        
+        # Players in those games, and their clubs (catches DNP starters with no stats row)
+        game_pids = set(df_stats.loc[df_stats['simple_id'].isin(changed), 'pid'])
+        game_clubs = {pid_to_club[p] for p in game_pids if p in pid_to_club}
+        lineup_clubs = df_lineup['pid'].map(pid_to_club)
+        hit = df_lineup['pid'].isin(game_pids) | lineup_clubs.isin(game_clubs)
+        affected_teams = set(df_lineup.loc[hit, 'team_id'])
+        
+        if not rounds or not (affected_teams or full_rounds):
+            print("No team affected by the changed games.")
+            return True
     
-    df_gw['simple_id'] = df_gw['id_jogo'].apply(clean_id)
-    df_stats['simple_id'] = df_stats['game_id'].apply(clean_id)
+    # Merge Stats + GW (parsed start times)
+    games = gw['games'].dropna(subset=['rodada']).drop_duplicates('simple_id', keep='last')
+    df_merged_full = df_stats.merge(games[['simple_id', 'rodada', 'start_ts']], on='simple_id', how='inner')
     
-    # Merge Stats + GW
-    df_merged_full = df_stats.merge(df_gw[['simple_id', 'data_hora', 'rodada']], on='simple_id', how='left')
+    # A game counts as finished GAME_FINISHED_H after kick-off (unparseable time -> not finished)
+    finished = (df_merged_full['start_ts'] + GAME_FINISHED_H * 3600 < time.time()).tolist()
+    mins = df_merged_full['minutesplayed'].tolist() if 'minutesplayed' in df_merged_full.columns else [0] * len(df_merged_full)
     
     player_game_map = {} # (pid, round) -> {minutes, is_finished}
     
     # Also build Club -> GameInfo map per round to catch DNP
-    # (Club, Round) -> {is_finished, start_time}
+    # (Club, Round) -> {is_finished}
     club_round_status = {}
-
-    for _, row in df_merged_full.iterrows():
-        pid = str(row['player_id'])
-        rod = row.get('rodada')
-        if pd.isna(rod) or str(rod) == '': continue
-        
-        mins = row.get('minutesplayed', 0)
-        start_str = row.get('data_hora')
-        
-        is_finished = False
-        if start_str:
-            dt = parse_time(start_str)
-            if dt:
-                if (dt + datetime.timedelta(hours=2)) < now:
-                    is_finished = True
-        
-        # Store Player Status
-        player_game_map[(pid, int(rod))] = {'min': mins, 'finished': is_finished}
+    
+    for pid, rod, m, fin in zip(df_merged_full['pid'].tolist(), df_merged_full['rodada'].astype(int), mins, finished):
+        player_game_map[(pid, rod)] = {'min': m, 'finished': fin}
         
-        # Store Club Status (Iteratively update)
         # We know this player's club played this game
         p_club = pid_to_club.get(pid)
         if p_club:
-            club_round_status[(p_club, int(rod))] = {'finished': is_finished}
+            club_round_status[(p_club, rod)] = {'finished': fin}
 
-    # ... get_score helper ...
-    def get_score(pid, rod):
-        gids_in_round = df_gw[df_gw['rodada'] == rod]['simple_id'].tolist()
-        df_pts['simple_id'] = df_pts['game_id'].apply(clean_id)
-        subset = df_pts[ (df_pts['player_id'] == pid) & (df_pts['simple_id'].isin(gids_in_round)) ]
-        if subset.empty: return 0.0
-        return float(subset['pontuacao'].sum())
+    # Points index: (pid, rodada) -> summed score of that player's games in the round.
+    # Built once per run instead of filtering df_pts for every lineup row.
+    points_index = build_points_index(df_pts, df_gw)
 
     # 3. Process Per Team / Per Round
     for r in rounds:
@@ -136,81 +224,22 @@ def calculate_team_points(target_round=None):
         # Get lineups for this round
         round_lineup = df_lineup[df_lineup['rodada'] == r]
         teams = round_lineup['team_id'].unique()
+        if affected_teams is not None and r not in full_rounds:
+            teams = [t for t in teams if t in affected_teams]
+        
+        # Final active lineup of every team in the round (DNP starters replaced)
+        active_by_team = resolve_substitutions(round_lineup, r, player_game_map, pid_to_club, club_round_status)
         
         for tid in teams:
             team_players = round_lineup[round_lineup['team_id'] == tid]
+            active_pids = active_by_team.get(tid, set())
             
-            # Separate Starters and Subs
-            starters = team_players[team_players['lineup'] == 'TITULAR'].copy()
-            subs = team_players[team_players['lineup'].str.startswith('PRI', na=False)].copy()
-            
-            def get_pri(x):
-                try: return int(str(x).split()[-1])
-                except: return 99
-            subs['pri_num'] = subs['lineup'].apply(get_pri)
-            subs = subs.sort_values('pri_num')
-            
-            active_pids = starters['player_id'].tolist()
-            
-            # Check Substitutions
-            for _, starter in starters.iterrows():
-                sid = starter['player_id']
-                spos = starter['posicao']
-                
-                # DETERMINE STATUS
-                is_finished = False
-                mins = 0
-                
-                # 1. Direct Stats Lookup
-                if (sid, r) in player_game_map:
-                    s_data = player_game_map[(sid, r)]
-                    is_finished = s_data['finished']
-                    mins = s_data['min']
-                else:
-                    # 2. Fallback: Check Club Status
-                    s_club = pid_to_club.get(sid)
-                    if s_club and (s_club, r) in club_round_status:
-                        # Club played?
-                        c_status = club_round_status[(s_club, r)]
-                        if c_status['finished']:
-                            is_finished = True
-                            mins = 0 # DNP
-                    # If Club not known or game not mapped, assume not finished -> No Sub
-                
-                if is_finished and mins == 0:
-                     # MATCHES DNP CRITERIA
-                    # CANDIDATE FOR SUB
-                    # Find replacement
-                    # Same Position, Highest Priority, (Played > 0 min? User implied valid score?)
-                    # "entrada... de mesma pontuação" (Assumed Position)
-                    
-                    replacement = None
-                    for _, sub in subs.iterrows():
-                        sub_id = sub['player_id']
-                        if sub_id in active_pids: continue # Already used? (Sub can only enter once? Usually yes)
-                        # Wait, subs list is static. "active_pids" tracks the finals.
-                        # We shouldn't reuse a sub.
-                        
-                        if sub['posicao'] == spos:
-                            # Candidate found. Check if already used?
-                            # Need to track used subs.
-                            replacement = sub_id
-                            break
-                    
-                    if replacement:
-                        # PERFORM SUB
-                        active_pids.remove(sid)
-                        active_pids.append(replacement)
-                        # Mark sub as used so he can't sub for another?
-                        # Remove from 'subs' df or keep tracked set.
-                        subs = subs[subs['player_id'] != replacement] 
-                        
             # Final Generation
             for _, p in team_players.iterrows():
                 pid = str(p['player_id'])
-                score = get_score(pid, r)
+                score = points_index.get((p['pid'], r), 0.0)
                 
-                in_active = (pid in active_pids)
+                in_active = (p['pid'] in active_pids)
                 
                 # Check if player is captain (cap column = 'CAPITAO')
                 is_captain = str(p.get('cap', '')).upper() == 'CAPITAO'
@@ -243,12 +272,36 @@ def calculate_team_points(target_round=None):
         except:
             ws_out = sh.add_worksheet(TEAM_POINTS_SHEET, 1000, 5)
             
-        ws_out.clear()
-        # Use USER_ENTERED to respect sheet locale for decimal interpretation
-        ws_out.update([df_out.columns.values.tolist()] + df_out.values.tolist(), value_input_option='USER_ENTERED')
+        
+        full = target_round is None and not scoped
+        if full:
+            ws_out.clear()
+            # Use USER_ENTERED to respect sheet locale for decimal interpretation
+            ws_out.update([df_out.columns.values.tolist()] + df_out.values.tolist(), value_input_option='USER_ENTERED')
+        else:
+            if df_out.empty:
+                print("No team points to update.")
+                return True
+            if not ws_out.row_values(1):
+                ws_out.update(values=[df_out.columns.values.tolist()], range_name='A1')
+            
+            # One block per (team_id, rodada); only those rows are replaced
+            blocks = {}
+            for row in df_out.values.tolist():
+                blocks.setdefault((str(row[0]), str(row[2])), []).append(row)
+            res = upsert_blocks(ws_out, blocks, key_cols=[0, 2], value_input_option='USER_ENTERED')
+            print(f"TEAM_POINTS upsert: {res}")
+        
+        invalidate(TEAM_POINTS_SHEET)
         print("Updated H2H - TEAM_POINTS")
     except Exception as e:
         print(f"Error saving: {e}")
+        return False
+    
+    # Every round was rewritten: rebuild the table from scratch too
+    if full:
+        return update_league_table(full=True)
+    return True
 
 if __name__ == "__main__":
     calculate_team_points()
@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
 from features.auth import get_client, get_players_file
+from features.sheet_cache import get_sheet_df, invalidate
+from features.roster_state import run_transaction
+from features.write_queue import enqueue_append
 
 @st.cache_data(ttl=60)
 def load_data():
@@ -12,19 +15,15 @@ def load_data():
     df_players['player_id'] = df_players['player_id'].astype(str)
     
     try:
-        client, sh = get_client()
-        
         # Load TEAM
-        data_team = sh.worksheet("TEAM").get_all_records()
-        df_team = pd.DataFrame(data_team)
+        df_team = get_sheet_df("TEAM")
         if not df_team.empty:
             df_team.columns = df_team.columns.str.lower()
             df_team['player_id'] = df_team['player_id'].astype(str)
             df_team['team_id'] = df_team['team_id'].astype(str)
             
         # Load SQUAD
-        data_squad = sh.worksheet("SQUAD").get_all_records()
-        df_squad = pd.DataFrame(data_squad)
+        df_squad = get_sheet_df("SQUAD")
         if not df_squad.empty:
             df_squad.columns = df_squad.columns.str.lower()
             id_col = next((c for c in df_squad.columns if c in ['team_id', 'id']), 'team_id')
@@ -39,70 +38,57 @@ def load_data():
     return df_players, df_team, df_squad
 
 def execute_trade(rodada, team1_id, team1_players, team1_cash, team2_id, team2_players, team2_cash):
-    """Execute the trade immediately updating all sheets"""
-    try:
-        client, sh = get_client()
-        
-        # Load current state
-        ws_team = sh.worksheet("TEAM")
-        teams_rows = ws_team.get_all_records()
-        
-        ws_squad = sh.worksheet("SQUAD")
-        squad_rows = ws_squad.get_all_records()
-        
-        # Get or create TROCAS_FEITAS
-        try:
-            ws_trades = sh.worksheet("TROCAS_FEITAS")
-        except:
-            ws_trades = sh.add_worksheet("TROCAS_FEITAS", 1000, 7)
-            ws_trades.append_row(['rodada', 'team_id_1', 'player_id_1', 'cash_1', 'team_id_2', 'player_id_2', 'cash_2'])
+    """
+    Execute the trade immediately updating all sheets
+    Ownership and caixa are validated against an indexed TEAM/SQUAD snapshot;
+    only the changed cells (team_id of each traded player, both caixas) are
+    written, in one version-checked request (features/roster_state.py).
+    """
+    def apply(snap):
+        for tid in (team1_id, team2_id):
+            if not snap.has_team(tid):
+                return f"Clube {tid} não encontrado na planilha SQUAD."
+        for tid, pids in ((team1_id, team1_players), (team2_id, team2_players)):
+            for pid in pids:
+                if not snap.owns(tid, pid):
+                    return f"Jogador {pid} não pertence mais ao clube {tid}."
+        if float(team1_cash) > snap.budget(team1_id):
+            return "Clube 1 não tem caixa suficiente."
+        if float(team2_cash) > snap.budget(team2_id):
+            return "Clube 2 não tem caixa suficiente."
         
         # --- UPDATE TEAM (swap players) ---
         for pid in team1_players:
-            for r in teams_rows:
-                if str(r.get('team_id')) == str(team1_id) and str(r.get('player_id')) == str(pid):
-                    r['team_id'] = str(team2_id)
-                    break
-        
+            snap.transfer(pid, team2_id)
         for pid in team2_players:
-            for r in teams_rows:
-                if str(r.get('team_id')) == str(team2_id) and str(r.get('player_id')) == str(pid):
-                    r['team_id'] = str(team1_id)
-                    break
+            snap.transfer(pid, team1_id)
         
         # --- UPDATE SQUAD (cash) ---
-        for r in squad_rows:
-            tid = str(r.get('team_id', r.get('id')))
-            if tid == str(team1_id):
-                cur = float(str(r.get('caixa', 0)).replace(',', '.'))
-                r['caixa'] = cur - team1_cash + team2_cash
-            elif tid == str(team2_id):
-                cur = float(str(r.get('caixa', 0)).replace(',', '.'))
-                r['caixa'] = cur - team2_cash + team1_cash
-        
-        # --- COMMIT TO SHEETS ---
-        # TEAM
-        ws_team.clear()
-        headers = list(teams_rows[0].keys()) if teams_rows else []
-        ws_team.update([headers] + [list(r.values()) for r in teams_rows])
-        
-        # SQUAD
-        ws_squad.clear()
-        headers_sq = list(squad_rows[0].keys()) if squad_rows else []
-        ws_squad.update([headers_sq] + [list(r.values()) for r in squad_rows])
+        net = float(team1_cash) - float(team2_cash)
+        if net:
+            snap.charge(team1_id, net)
+            snap.charge(team2_id, -net)
+        return None
+    
+    try:
+        error = run_transaction(apply, names=["TEAM", "SQUAD"])
+        if error:
+            st.error(error)
+            return False
         
         # TROCAS_FEITAS (one row per player pair)
-        for i in range(len(team1_players)):
-            ws_trades.append_row([
+        enqueue_append("TROCAS_FEITAS", [
+            [
                 int(rodada),
                 str(team1_id),
-                str(team1_players[i]),
+                str(team1_players[i]) if i < len(team1_players) else '',
                 float(team1_cash) if i == 0 else 0,
                 str(team2_id),
-                str(team2_players[i]),
+                str(team2_players[i]) if i < len(team2_players) else '',
                 float(team2_cash) if i == 0 else 0
-            ])
-        
+            ]
+            for i in range(max(len(team1_players), len(team2_players), 1))
+        ], header=['rodada', 'team_id_1', 'player_id_1', 'cash_1', 'team_id_2', 'player_id_2', 'cash_2'])
         return True
         
     except Exception as e:
@@ -160,6 +146,7 @@ def execute_drop(team_id, player_id, rodada):
             else:
                 ws_team.append_row(headers)
         
+        invalidate("TEAM", "PLAYERS_FREE")
         return True
     except Exception as e:
         st.error(f"Erro no drop: {e}")
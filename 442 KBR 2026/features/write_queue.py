@@ -0,0 +1,315 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import gspread
+from features.auth import BASE_DIR, get_client
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Write-behind queue for Sheets.
+# UI actions enqueue their writes and return right away; a background worker
+# flushes them a moment later, coalesced into one request per sheet:
+#   append - rows for the end of the sheet (all queued appends of a sheet -> one append_rows)
+#   update - values for an A1 range (same sheet + range -> only the last one is written;
+#            all ranges of a sheet -> one batch_update)
+# Every queued write is journaled to disk (fsync) before enqueue() returns and
+# is only dropped from the journal once Sheets accepted it, so a crash or
+# restart replays whatever was still pending.
+# The journal is shared by every process of the app (Players/Admin pages, CLI):
+#   - journal reads/appends/rewrites run under a file lock (LOCK_FILE), and a
+#     rewrite keeps the ops other processes appended meanwhile
+#   - a flush holds a second file lock (FLUSH_LOCK_FILE) from reading the ops to
+#     dropping them, so two processes never write the same ops
+#   - every op has an id; as soon as Sheets accepted a request (a sheet's
+#     append_rows, or its batch_update) the ids it carried are journaled as
+#     applied, and ops with an applied id are never replayed
+# Sheets are flushed independently: a transient error (network, quota, 5xx)
+# keeps that sheet's ops queued for retry, a permanent one (4xx, missing sheet
+# without header) moves them to DEAD_LETTER_FILE so they cannot block the queue.
+# Reads through sheet_cache see pending appends/updates right away (pending_ops).
+# Code that reads a sheet live (not through the cache) must call flush(sheet) first.
+
+JOURNAL_FILE = BASE_DIR / "Dados" / "write_journal.jsonl"
+LOCK_FILE = BASE_DIR / "Dados" / "write_journal.lock"
+FLUSH_LOCK_FILE = BASE_DIR / "Dados" / "write_flush.lock"
+DEAD_LETTER_FILE = BASE_DIR / "Dados" / "write_dead_letter.jsonl"
+
+FLUSH_DELAY = 1.5  # seconds to wait for more writes before flushing
+BACKOFF_START = 2
+BACKOFF_MAX = 120
+
+_lock = threading.RLock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_worker = None
+_cache = {'stamp': None, 'ops': []}  # last journal read, keyed by file mtime/size
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock between processes (blocks until it is free)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10s
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _dumps(op):
+    # numpy scalars (rodada, prices from DataFrames) -> plain Python values
+    return json.dumps(op, ensure_ascii=False, default=lambda v: v.item() if hasattr(v, 'item') else str(v))
+
+def _read_journal():
+    """Ops on disk still to be written, in enqueue order. Caller holds LOCK_FILE."""
+    ops, applied = [], set()
+    try:
+        with open(JOURNAL_FILE, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-write
+                if 'applied' in rec:
+                    applied.update(rec['applied'])
+                else:
+                    ops.append(rec)
+    except OSError:
+        pass
+    return [op for op in ops if op.get('id') not in applied]
+
+def _append_journal(records):
+    """Appends records to the journal (fsync). Caller holds LOCK_FILE."""
+    JOURNAL_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+        for rec in records:
+            f.write(_dumps(rec) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _compact_journal():
+    """Rewrites the journal with only the ops still pending (atomic replace). Caller holds LOCK_FILE."""
+    ops = _read_journal()
+    JOURNAL_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = JOURNAL_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for op in ops:
+            f.write(_dumps(op) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, JOURNAL_FILE)
+
+def _enqueue(op):
+    op['id'] = uuid.uuid4().hex
+    with _file_lock(LOCK_FILE):
+        _append_journal([op])
+    _start_worker()
+    _wake.set()
+
+def enqueue_append(sheet, rows, header=None, value_input_option='RAW'):
+    """
+    Queues rows to be appended to a sheet.
+    header: written first if the sheet does not exist yet (it is created).
+    """
+    _enqueue({'op': 'append', 'sheet': sheet, 'rows': [list(r) for r in rows],
+              'header': list(header) if header else None, 'vio': value_input_option})
+
+def enqueue_update(sheet, range_name, values, value_input_option='RAW'):
+    """Queues values for an A1 range of a sheet (a later update of the same range replaces it)."""
+    _enqueue({'op': 'update', 'sheet': sheet, 'range': range_name,
+              'values': [list(r) for r in values], 'vio': value_input_option})
+
+def _journal_stamp():
+    try:
+        st = os.stat(JOURNAL_FILE)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def pending_ops(sheet=None):
+    """Ops not yet written to Sheets by any process (all sheets or one), in enqueue order."""
+    with _lock:
+        # The journal is only re-read when it changed on disk
+        stamp = _journal_stamp()
+        if stamp != _cache['stamp']:
+            with _file_lock(LOCK_FILE):
+                _cache['ops'] = _read_journal()
+            _cache['stamp'] = stamp
+        return [op for op in _cache['ops'] if sheet is None or op['sheet'] == sheet]
+
+def coalesce(ops):
+    """
+    Groups ops into one batch per sheet (first-seen order):
+    {sheet: {'rows': [...], 'header': ..., 'vio': ..., 'append_ids': [...],
+             'updates': {range: (values, vio)}, 'update_ids': {range: [...]}}}
+    """
+    batches = {}
+    for op in ops:
+        b = batches.setdefault(op['sheet'], {'rows': [], 'header': None, 'vio': 'RAW', 'append_ids': [],
+                                             'updates': {}, 'update_ids': {}})
+        if op['op'] == 'append':
+            b['rows'].extend(op['rows'])
+            b['append_ids'].append(op['id'])
+            b['header'] = b['header'] or op.get('header')
+            if op.get('vio') == 'USER_ENTERED':
+                b['vio'] = 'USER_ENTERED'
+        else:
+            # Re-insert so the range keeps the position of its last write
+            b['updates'].pop(op['range'], None)
+            b['updates'][op['range']] = (op['values'], op.get('vio', 'RAW'))
+            b['update_ids'].setdefault(op['range'], []).append(op['id'])
+    return batches
+
+class PermanentError(Exception):
+    """A write Sheets will never accept as queued (retrying cannot help)."""
+
+def _is_permanent(e):
+    if isinstance(e, PermanentError):
+        return True
+    # 4xx other than timeout / quota: bad range, bad values, no permission...
+    code = getattr(getattr(e, 'response', None), 'status_code', None)
+    return isinstance(e, gspread.exceptions.APIError) and code is not None and 400 <= code < 500 and code not in (408, 429)
+
+def _mark_applied(ids):
+    # Journaled right after each request Sheets accepted: a crash/replay from
+    # here on cannot write them again (only a crash during the request can)
+    with _file_lock(LOCK_FILE):
+        _append_journal([{'applied': list(ids)}])
+
+def _dead_letter(ops, error):
+    """Moves ops Sheets rejected for good out of the journal into DEAD_LETTER_FILE."""
+    with _file_lock(LOCK_FILE):
+        with open(DEAD_LETTER_FILE, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(_dumps(dict(op, error=str(error), failed_at=time.strftime('%Y-%m-%d %H:%M:%S'))) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _append_journal([{'applied': [op['id'] for op in ops]}])
+    print(f"Write queue: {len(ops)} write(s) for {ops[0]['sheet']} rejected ({error}). Moved to {DEAD_LETTER_FILE.name}.")
+
+def _write_batch(sh, sheet, b):
+    """
+    Writes one sheet's batch: the appends, then the updates (one request per
+    value input option), marking each part applied as soon as it went through.
+    """
+    try:
+        ws = sh.worksheet(sheet)
+    except gspread.exceptions.WorksheetNotFound:
+        if not b['header']:
+            raise PermanentError(f"sheet {sheet} does not exist")
+        ws = sh.add_worksheet(sheet, 1000, max(len(b['header']), 5))
+        ws.append_row(b['header'])
+
+    if b['rows']:
+        ws.append_rows(b['rows'], value_input_option=b['vio'])
+        _mark_applied(b['append_ids'])
+
+    by_vio = {}
+    for rng, (values, vio) in b['updates'].items():
+        data, ids = by_vio.setdefault(vio, ([], []))
+        data.append({'range': rng, 'values': values})
+        ids.extend(b['update_ids'][rng])
+    for vio, (data, ids) in by_vio.items():
+        ws.batch_update(data, value_input_option=vio)
+        _mark_applied(ids)
+
+def flush(sheet=None):
+    """
+    Writes the pending ops (all sheets, or only `sheet`) now, one batch per sheet.
+    A sheet that fails does not hold back the others:
+    - transient errors (network, quota, 5xx): its ops stay queued for the worker to retry
+    - permanent ones (4xx, missing sheet without header): its ops go to the dead-letter file
+    Returns True when nothing is left pending for them.
+    """
+    from features.sheet_cache import invalidate
+
+    with _flush_lock, _file_lock(FLUSH_LOCK_FILE):
+        with _file_lock(LOCK_FILE):
+            ops = [op for op in _read_journal() if sheet is None or op['sheet'] == sheet]
+        if not ops:
+            return True
+
+        try:
+            client, sh = get_client()
+        except Exception as e:
+            print(f"Write queue flush failed ({e}). {len(ops)} write(s) kept for retry.")
+            return False
+
+        ok = True
+        for name, b in coalesce(ops).items():
+            try:
+                _write_batch(sh, name, b)
+            except Exception as e:
+                if _is_permanent(e):
+                    # The parts of the batch not yet applied
+                    ids = set(b['append_ids']).union(*b['update_ids'].values())
+                    with _file_lock(LOCK_FILE):
+                        left = [op for op in _read_journal() if op['id'] in ids]
+                    if left:
+                        _dead_letter(left, e)
+                else:
+                    ok = False
+                    print(f"Write queue flush failed for {name} ({e}). Kept for retry.")
+
+        with _file_lock(LOCK_FILE):
+            _compact_journal()
+        invalidate(*{op['sheet'] for op in ops})
+        return ok
+
+def _run():
+    delay = BACKOFF_START
+    while True:
+        _wake.wait()
+        time.sleep(FLUSH_DELAY)  # let a burst of writes pile up into one batch
+        _wake.clear()
+        if flush():
+            delay = BACKOFF_START
+        else:
+            # Quota / network error: back off exponentially, then try again
+            time.sleep(delay)
+            delay = min(delay * 2, BACKOFF_MAX)
+            _wake.set()
+
+def _start_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="sheets-write-queue", daemon=True)
+            _worker.start()
+
+def start():
+    """
+    Replays the journal in the background (no-op if empty).
+    Called by the app entry points (Players.py / Admin.py) on each run.
+    """
+    ops = pending_ops()
+    if ops:
+        print(f"Write queue: {len(ops)} pending write(s) found in the journal.")
+        _start_worker()
+        _wake.set()
+
+if __name__ == "__main__":
+    print(f"Pending writes: {len(pending_ops())}")
+    print("Flushed." if flush() else "Flush failed, writes kept in the journal.")
@@ -2,12 +2,16 @@ import pandas as pd
 import datetime
 from features.auth import get_client
 from features.live_stats import (
-    fetch_sofascore_lineups,
-    fetch_event_details,
-    fetch_game_comments,
+    fetch_game_bundles,
+    get_http_stats,
+    compute_game_hash,
+    load_game_hashes,
+    save_game_hashes,
+    load_finished_state,
+    save_finished_state,
     parse_cards_from_comments,
     get_player_pos_map,
-    extract_stats,
+    extract_lineup_stats,
     save_stats_to_sheet,
     calculate_points,
     save_points_to_sheet,
@@ -15,11 +19,13 @@ from features.live_stats import (
 )
 from features.team_points import calculate_team_points
 from features.league_table import update_league_table
+from features.calendar_utils import build_gameweek, finished_game_ids, finished_rounds
 
 # Configuration
 TARGET_DATES = ["28/01/2026", "29/01/2026"]
 
-def manual_update_scores():
+def manual_update_scores(force=False):
+    """force=True recomputes every game even if its SofaScore payload is unchanged."""
     print(f"--- Manual Score Update for {TARGET_DATES} ---")
 
     # 1. Get Games for Target Date
@@ -38,33 +44,41 @@ def manual_update_scores():
         if any(d in dt_str for d in TARGET_DATES):
             target_games.append(row)
             
-    if not target_games:
+    if target_games:
+        print(f"Found {len(target_games)} games for {TARGET_DATES}.")
+    else:
+        # Still check the clock below: games/rounds of other dates may have just finished
         print(f"No games found for dates {TARGET_DATES}.")
-        return
-
-    print(f"Found {len(target_games)} games for {TARGET_DATES}.")
     
-    # 2. Extract Stats
+    # 2. Extract Stats (one DataFrame per game)
     all_game_stats = []
-    enriched_data_for_calc = []
     
     pos_map = get_player_pos_map()
     
+    def api_id_of(raw_id):
+        if 'id:' in raw_id: return raw_id.split('id:')[-1]
+        if '/' in raw_id: return raw_id.split('/')[-1]
+        return raw_id
+    
+    # Fetch event/lineups/comments of every game concurrently
+    api_ids = [api_id_of(str(g.get('id_jogo', ''))) for g in target_games]
+    print(f"Fetching {len(api_ids)} games from SofaScore...")
+    bundles = fetch_game_bundles(api_ids) if api_ids else {}
+    
+    # Change detection: skip games whose payload is identical to the last saved one
+    saved_hashes = load_game_hashes()
+    new_hashes = {}
+    skipped = 0
+    
     for game in target_games:
         raw_id = str(game.get('id_jogo', ''))
-        
-        # Extract API ID
-        if 'id:' in raw_id: 
-            api_id = raw_id.split('id:')[-1]
-        elif '/' in raw_id: 
-            api_id = raw_id.split('/')[-1]
-        else: 
-            api_id = raw_id
+        api_id = api_id_of(raw_id)
+        bundle = bundles.get(api_id, {})
             
         print(f"Processing Game: {game.get('home_team')} vs {game.get('away_team')} (ID: {api_id})")
         
-        # A. Fetch Score
-        event_details = fetch_event_details(api_id)
+        # A. Score
+        event_details = bundle.get('event')
         home_score = 0
         away_score = 0
         if event_details:
@@ -72,54 +86,89 @@ def manual_update_scores():
              home_score = event.get('homeScore', {}).get('current', 0)
              away_score = event.get('awayScore', {}).get('current', 0)
         
-        # B. Fetch Lineups
-        data = fetch_sofascore_lineups(api_id)
+        # B. Lineups
+        data = bundle.get('lineups')
         if not data: 
-            print(f"  -> Failed to fetch lineups for {api_id}")
+            err = bundle.get('errors', {}).get('lineups')
+            print(f"  -> Failed to fetch lineups for {api_id}" + (f" ({err})" if err else ""))
             continue
             
-        # C. Fetch Comments (Cards Override)
-        comments_data = fetch_game_comments(api_id)
+        # C. Comments (Cards Override)
+        comments_data = bundle.get('comments')
         card_map = parse_cards_from_comments(comments_data)
         
-        # Process Home
-        home_players = data.get('home', {}).get('players', [])
-        for p in home_players:
-            row = extract_stats(p, raw_id, 'home', home_score, away_score, pos_map, card_map)
-            all_game_stats.append(row)
-            enriched_data_for_calc.append(row)
-            
-        # Process Away
-        away_players = data.get('away', {}).get('players', [])
-        for p in away_players:
-            row = extract_stats(p, raw_id, 'away', home_score, away_score, pos_map, card_map)
-            all_game_stats.append(row)
-            enriched_data_for_calc.append(row)
+        game_hash = compute_game_hash(data, home_score, away_score, card_map)
+        if not force and saved_hashes.get(raw_id) == game_hash:
+            print("  -> Unchanged since last update. Skipping.")
+            skipped += 1
+            continue
+        new_hashes[raw_id] = game_hash
+        
+        # Process Home + Away in one pass
+        all_game_stats.append(extract_lineup_stats(data, raw_id, home_score, away_score, pos_map, card_map))
             
+    http = get_http_stats()
+    print(f"Games recomputed: {len(new_hashes)} | skipped (unchanged): {skipped} | "
+          f"SofaScore requests: {http['requests']} (reused connections: {http['reused_connections']}, errors: {http['errors']})")
+    
+    # Clock-driven changes: games past the DNP threshold and rounds past the grace
+    # period since the last successful run (no payload change needed)
+    gw = build_gameweek(df_gw)
+    state = load_finished_state()
+    done_games = finished_game_ids(gw)
+    done_rounds = finished_rounds(gw)
+    crossed = sorted(done_games - set(state['games']))
+    new_rounds = sorted(done_rounds - {int(r) for r in state['rounds']})
+    if crossed or new_rounds:
+        print(f"Newly finished: {len(crossed)} game(s), rounds {new_rounds}")
+    
     # 3. Save Raw Stats
-    if all_game_stats:
-        print(f"Saving {len(all_game_stats)} stats rows...")
-        save_stats_to_sheet(all_game_stats)
+    df_stats = pd.concat(all_game_stats, ignore_index=True) if all_game_stats else pd.DataFrame()
+    if not df_stats.empty:
+        print(f"Saving {len(df_stats)} stats rows...")
+        ok_stats = save_stats_to_sheet(df_stats)
         
         # 4. Calculate and Save Points
         print("Calculating points...")
-        df_calc = pd.DataFrame(enriched_data_for_calc)
+        df_calc = df_stats.copy()
         points_df = calculate_points(df_calc)
         
         print(f"Saving {len(points_df)} points rows...")
-        save_points_to_sheet(points_df)
+        ok_points = save_points_to_sheet(points_df)
         
+        if not (ok_stats and ok_points):
+            print("❌ Saving stats/points failed. Nothing marked as done; next run retries.")
+            return
         print("✅ Stats and Player Points Updated.")
-        
-        # 5. Update Team Points (H2H)
+    elif skipped:
+        print("No game payload changed since last update.")
+    elif target_games:
+        print("No stats extracted.")
+    
+    if not (new_hashes or crossed or new_rounds):
+        print("Nothing to write.")
+        return
+    
+    # 5. Update Team Points (H2H)
+    # Only the rounds/teams of the recomputed games, plus every team of the rounds
+    # with a newly finished game (DNP auto-subs)
+    ok_team = True
+    if new_hashes or crossed:
         print("Updating H2H - TEAM_POINTS...")
-        calculate_team_points()
-        
-        # 6. Update League Table
-        update_league_table()
-        
+        ok_team = calculate_team_points(changed_game_ids=list(new_hashes), finished_game_ids=crossed)
+    
+    # 6. Update League Table
+    # Rounds whose team points were just rewritten are picked up by their fingerprint
+    ok_table = ok_team and update_league_table()
+    
+    # Only remember hashes / finished state once everything went through,
+    # so a failed step is retried next run
+    if ok_team and ok_table:
+        saved_hashes.update(new_hashes)
+        save_game_hashes(saved_hashes)
+        save_finished_state(done_games, done_rounds)
     else:
-        print("No stats extracted.")
+        print("❌ Team points / table update failed. Nothing marked as done; next run retries.")
 
 if __name__ == "__main__":
     manual_update_scores()
@@ -1,11 +1,12 @@
-"""Script to recalculate ALL points from stats and COMPLETELY OVERWRITE the PLAYER_POINTS sheet."""
+"""Script to recalculate ALL points from stats and sync the PLAYER_POINTS sheet (only changed cells are written)."""
 import pandas as pd
 from features.auth import get_client
-from features.live_stats import calculate_points, STATS_SHEET, POINTS_SHEET
-from features.utils import robust_to_float, format_br_decimal
+from features.live_stats import calculate_points, points_rows, same_points, STATS_SHEET, POINTS_SHEET
+from features.sheet_upsert import upsert_changed_cells
+from features.team_points import calculate_team_points
 
 def recalculate_all():
-    print("--- Recalculating Points for ALL Games (FULL OVERWRITE) ---")
+    print("--- Recalculating Points for ALL Games (FULL SYNC) ---")
     
     client, sh = get_client()
     
@@ -29,32 +30,30 @@ def recalculate_all():
         print("Calculation resulted in empty DataFrame.")
         return
     
-    # Rename column for sheet
-    points_df = points_df.rename(columns={'PONTUACAO_LUCCA_MATCH': 'pontuacao'})
-    
-    # 3. Format pontuacao for BR locale (comma as decimal separator)
-    print("Formatting pontuacao for BR locale...")
-    points_df['pontuacao'] = points_df['pontuacao'].apply(robust_to_float)
-    points_df['pontuacao'] = points_df['pontuacao'].apply(format_br_decimal)
-    
-    # 4. COMPLETE OVERWRITE - do NOT merge with existing data
-    print(f"Saving {len(points_df)} points rows (FULL OVERWRITE)...")
+    # 3. FULL SYNC - diff against the sheet keyed by (game_id, player_id)
+    # Only changed scores are written; rows not produced by this run are removed.
+    print(f"Syncing {len(points_df)} points rows (FULL SYNC)...")
     
     try:
         ws = sh.worksheet(POINTS_SHEET)
     except:
         ws = sh.add_worksheet(POINTS_SHEET, 1000, 3)
     
-    # Prepare data
     header = ['game_id', 'player_id', 'pontuacao']
-    final_df = points_df[header]
-    final_values = [header] + final_df.values.tolist()
+    if ws.row_values(1) != header:
+        ws.update(values=[header], range_name='A1')
+    
+    res = upsert_changed_cells(ws, points_rows(points_df), key_cols=[0, 1], prune_all=True, equal=same_points)
     
-    # Clear and write (fixed argument order for gspread >= 5.0)
-    ws.clear()
-    ws.update(values=final_values, range_name='A1', value_input_option='USER_ENTERED')
+    print(f"PLAYER_POINTS synced: {res}")
     
-    print("✅ Full Recalculation Complete (PLAYER_POINTS overwritten).")
+    # 4. Propagate to H2H: every round's team points; the full rewrite also
+    # rebuilds H2H - TABLE from scratch (update_league_table(full=True))
+    print("Recalculating H2H - TEAM_POINTS and H2H - TABLE...")
+    if calculate_team_points():
+        print("✅ Full Recalculation Complete.")
+    else:
+        print("❌ H2H update failed (see errors above). PLAYER_POINTS is synced; rerun to retry.")
 
 if __name__ == "__main__":
     recalculate_all()